@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Offline benchmark of the encode path. Synthetic audio and image files
+# are made with ffmpeg's lavfi sources, and each combination is encoded
+# with each profile through Tune2Tube.generate_video(). The results are
+# saved per commit, so that changes to the ffmpeg arguments can be
+# compared against earlier ones:
+#
+#     $ ./benchmark/encode.py
+#     $ ./benchmark/encode.py --compare benchmark/results/1a2b3c4.json
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from t2t import Tune2Tube
+from t2t.containers import video_exts
+from t2t.profiles import profiles
+
+# The ffmpeg arguments that produce each kind of audio file.
+audio_codecs = {
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '192k'],
+    'flac': ['-c:a', 'flac'],
+    'wav': ['-c:a', 'pcm_s16le'],
+    'ogg': ['-c:a', 'libvorbis', '-q:a', '5'],
+}
+
+
+def make_audio(ffmpeg, path, codec, length):
+    '''
+    Makes a stereo sine wave of a given length in seconds, with a couple
+    of tags so that the metadata is read as well.
+    '''
+    subprocess.check_call([
+        ffmpeg, '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100:'
+        'duration=%d' % length,
+        '-ac', '2',
+        '-metadata', 'artist=Benchmark',
+        '-metadata', 'title=%s %ds' % (codec, length),
+    ] + audio_codecs[codec] + [path])
+
+
+def make_image(ffmpeg, path, size):
+    '''
+    Makes a test pattern image of a given size, e.g. '1920x1080'.
+    '''
+    subprocess.check_call([
+        ffmpeg, '-v', 'error', '-y',
+        '-f', 'lavfi', '-i', 'testsrc2=size=%s' % size,
+        '-frames:v', '1', path
+    ])
+
+
+def run_case(settings, audio, image, output, verbose=False):
+    '''
+    Encodes a single video in a child process, and returns its wall time,
+    CPU time and peak RSS. The child's resource usage includes that of
+    the ffmpeg processes it ran, so this measures the whole encode path.
+    '''
+    start = time.time()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            if not verbose:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, 1)
+            config = dict(settings, path_output=output)
+            Tune2Tube(config).generate_video(audio, image)
+            status = 0
+        except BaseException, e:
+            sys.stderr.write('%s\n' % e)
+        finally:
+            os._exit(status)
+    status, usage = os.wait4(pid, 0)[1:]
+    wall = time.time() - start
+    if status != 0:
+        return None
+    # The extension depends on the container that was picked.
+    base = os.path.splitext(output)[0]
+    output = [base + n for n in video_exts if os.path.exists(base + n)][0]
+    return {
+        'wall': wall,
+        'cpu': usage.ru_utime + usage.ru_stime,
+        # On Linux, this is in kilobytes.
+        'rss_kb': usage.ru_maxrss,
+        'size': os.path.getsize(output)
+    }
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def git_commit():
+    '''
+    Returns the current commit and whether the tree has local changes.
+    '''
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=root
+        ).strip()
+        dirty = subprocess.check_output(
+            ['git', 'status', '--porcelain', '--untracked-files=no'],
+            cwd=root
+        ).strip() != ''
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return commit, dirty
+
+
+def ffmpeg_version(ffmpeg):
+    try:
+        return subprocess.check_output([ffmpeg, '-version']).split('\n')[0]
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def benchmark(args, workdir):
+    '''
+    Runs every combination of audio file, image and profile, and returns
+    the results.
+    '''
+    inputs = os.path.join(workdir, 'inputs')
+    os.makedirs(inputs)
+    print('Making the input files in %s...' % inputs)
+    audio_files = []
+    for codec in args.codecs.split(','):
+        for length in [int(n) for n in args.lengths.split(',')]:
+            path = os.path.join(inputs, '%s-%ds.%s' % (codec, length, codec))
+            make_audio(args.ffmpeg, path, codec, length)
+            audio_files.append((codec, length, path))
+    images = []
+    for size in args.sizes.split(','):
+        path = os.path.join(inputs, '%s.png' % size)
+        make_image(args.ffmpeg, path, size)
+        images.append((size, path))
+
+    results = []
+    for codec, length, audio in audio_files:
+        for size, image in images:
+            for profile in args.profiles.split(','):
+                name = '%s-%ds-%s/%s' % (codec, length, size, profile)
+                runs = []
+                for n in range(args.repeat):
+                    # Start from scratch each time, so that nothing is
+                    # taken from a cache.
+                    scratch = os.path.join(workdir, 'run')
+                    os.makedirs(scratch)
+                    settings = {
+                        'path_ffmpeg': args.ffmpeg,
+                        'path_ffprobe': args.ffprobe,
+                        'profile': profile,
+                        'cache': False,
+                        'probe_index': None,
+                        'artwork_dir': os.path.join(scratch, 'artwork'),
+                        'stats_file': os.path.join(scratch, 'stats.json'),
+                        'metrics_log': None,
+                        'metrics_file': None,
+                        'metrics_port': None,
+                        'verbose': args.verbose,
+                    }
+                    run = run_case(settings, audio, image,
+                                   os.path.join(scratch, 'out.mp4'),
+                                   args.verbose)
+                    shutil.rmtree(scratch)
+                    if run is None:
+                        break
+                    runs.append(run)
+                if len(runs) < args.repeat:
+                    print('%-40s failed' % name)
+                    continue
+                result = {
+                    'case': name,
+                    'audio': codec,
+                    'length': length,
+                    'image': size,
+                    'profile': profile,
+                    'runs': runs,
+                }
+                for key in ('wall', 'cpu', 'rss_kb', 'size'):
+                    result[key] = median([n[key] for n in runs])
+                results.append(result)
+                print('%-40s %8.2fs wall %8.2fs cpu %8d KB rss %10d bytes'
+                      % (name, result['wall'], result['cpu'],
+                         result['rss_kb'], result['size']))
+    return results
+
+
+def compare(old, new):
+    '''
+    Prints how each case in new compares to the same case in old.
+    '''
+    print('\nCompared to %s (%s):' % (old['commit'], old['date']))
+    old_cases = dict((n['case'], n) for n in old['results'])
+    for result in new['results']:
+        before = old_cases.get(result['case'])
+        if before is None:
+            continue
+        print('%-40s wall %+6.1f%% cpu %+6.1f%% rss %+6.1f%% size %+6.1f%%'
+              % tuple([result['case']] + [
+                  (result[n] / float(before[n]) - 1) * 100
+                  if before[n] else 0
+                  for n in ('wall', 'cpu', 'rss_kb', 'size')
+              ]))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the encode path using synthetic inputs.'
+    )
+    parser.add_argument('--codecs', default='mp3,flac,wav,ogg',
+                        help='Audio codecs (default: %(default)s).')
+    parser.add_argument('--lengths', default='30,300',
+                        help='Audio lengths in seconds (default: '
+                        '%(default)s).')
+    parser.add_argument('--sizes', default='1280x720,3000x3000',
+                        help='Image sizes (default: %(default)s).')
+    parser.add_argument('--profiles', default=','.join(sorted(profiles)),
+                        help='Encoding profiles (default: %(default)s).')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='''Number of runs of each case; the median is \
+reported (default: %(default)s).''')
+    parser.add_argument('--ffmpeg', default='ffmpeg')
+    parser.add_argument('--ffprobe', default='ffprobe')
+    parser.add_argument('--results', default=os.path.join(root, 'benchmark',
+                                                          'results'),
+                        help='Directory to save the results in.')
+    parser.add_argument('--compare', metavar='FILE',
+                        help='Results of an earlier run to compare with.')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+
+    commit, dirty = git_commit()
+    workdir = tempfile.mkdtemp(prefix='t2t-benchmark-')
+    try:
+        results = benchmark(args, workdir)
+    finally:
+        shutil.rmtree(workdir)
+
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'date': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'ffmpeg': ffmpeg_version(args.ffmpeg),
+        'host': platform.node(),
+        'platform': platform.platform(),
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'results': results,
+    }
+    if not os.path.isdir(args.results):
+        os.makedirs(args.results)
+    path = os.path.join(args.results, '%s%s.json' % (
+        commit, '-dirty' if dirty else ''
+    ))
+    with open(path, 'w') as out:
+        json.dump(report, out, indent=2, sort_keys=True)
+    print('Saved the results to %s.' % path)
+
+    if args.compare:
+        with open(args.compare) as old:
+            compare(json.load(old), report)
+
+
+if __name__ == '__main__':
+    main()
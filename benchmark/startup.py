@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Startup time budget. Measures how long `import t2t' and
+# `tune2tube.py --help' take on top of a bare interpreter, and checks
+# that none of the heavy upload and batch dependencies are loaded by the
+# import. The package is byte-compiled first, as it would be once
+# installed, so that compiling it isn't measured.
+# Exits with status 1 if the budget is exceeded, so that it can be run
+# before a commit:
+#
+#     $ ./benchmark/startup.py --budget 150
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that are only needed to upload, or to run a batch, and which
+# should only be imported once they're used.
+heavy_modules = ['apiclient', 'googleapiclient', 'oauth2client',
+                 'httplib2', 'multiprocessing', 'sqlite3', 'csv']
+
+# The cases that are timed, as arguments to the interpreter.
+cases = [
+    ('bare', ['-c', 'pass']),
+    ('import t2t', ['-c', 'import t2t']),
+    ('tune2tube.py --help', [os.path.join(root, 'tune2tube.py'), '--help']),
+]
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def run_case(python, args, repeat):
+    '''
+    Runs the interpreter with the given arguments a number of times, and
+    returns the median wall time in milliseconds.
+    '''
+    env = dict(os.environ, PYTHONPATH=root)
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for n in range(repeat):
+            start = time.time()
+            subprocess.check_call([python] + args, env=env, stdout=devnull)
+            times.append((time.time() - start) * 1000)
+    return median(times)
+
+
+def compile_package(python):
+    '''
+    Byte-compiles the package, so that the timings don't depend on
+    whether an earlier run left .pyc files behind.
+    '''
+    subprocess.check_call([python, '-m', 'compileall', '-q',
+                           os.path.join(root, 't2t')])
+
+
+def loaded_modules(python):
+    '''
+    Returns which of the heavy modules are loaded after `import t2t'.
+    '''
+    script = ('import sys, t2t\n'
+              'print(" ".join(sorted(sys.modules)))\n')
+    env = dict(os.environ, PYTHONPATH=root)
+    modules = subprocess.check_output([python, '-c', script], env=env)
+    return sorted(set(
+        name.split('.')[0] for name in modules.split()
+    ) & set(heavy_modules))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Checks the startup time against a budget.'
+    )
+    parser.add_argument('--budget', type=float, default=150,
+                        help='''Maximum time in milliseconds that each case \
+may take on top of a bare interpreter (default: %(default)s).''')
+    parser.add_argument('--repeat', type=int, default=11,
+                        help='''Number of runs of each case; the median is \
+used (default: %(default)s).''')
+    parser.add_argument('--python', default=sys.executable,
+                        help='Interpreter to measure (default: %(default)s).')
+    args = parser.parse_args()
+
+    compile_package(args.python)
+    failed = False
+    bare = None
+    for name, case in cases:
+        elapsed = run_case(args.python, case, args.repeat)
+        if bare is None:
+            bare = elapsed
+            print('%-24s %8.1f ms' % (name, elapsed))
+            continue
+        overhead = elapsed - bare
+        over = overhead > args.budget
+        failed = failed or over
+        print('%-24s %8.1f ms (+%.1f ms)%s' % (
+            name, elapsed, overhead, ' over budget' if over else ''
+        ))
+
+    heavy = loaded_modules(args.python)
+    if heavy:
+        failed = True
+        print('Loaded by `import t2t\': %s' % ', '.join(heavy))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
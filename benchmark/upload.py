@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+#
+# Load test of the upload path against a local stand-in for the Youtube
+# API, which can inject server errors, dropped connections, slow links
+# and quota errors. Runs a number of concurrent uploads and reports their
+# throughput and how they recovered from the faults:
+#
+#     $ ./benchmark/upload.py --uploads 16 --concurrency 8 --error_rate 0.1
+#
+# The stand-in can also be run on its own, for use with --api_url:
+#
+#     $ ./benchmark/upload.py --serve --port 8099
+#     $ ./tune2tube.py --api_url http://127.0.0.1:8099 test.flac test.png
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib2
+
+from collections import Counter
+from multiprocessing.pool import ThreadPool
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+
+from t2t import Tune2Tube, Tune2TubeError
+from t2t.metrics import metrics
+from t2t.standin import Faults, StandInServer
+
+
+def make_video(path, size):
+    '''
+    Makes a file of random data to upload; the stand-in doesn't care
+    whether it's really a video.
+    '''
+    with open(path, 'wb') as video:
+        while size > 0:
+            block = min(size, 1024 * 1024)
+            video.write(os.urandom(block))
+            size -= block
+
+
+def upload(job, audio):
+    '''
+    Runs a single upload. Returns its video ID, or the error.
+    '''
+    try:
+        return job.upload_tune(audio, None, video_ready=True), None
+    except Tune2TubeError, e:
+        return None, str(e).split('\n')[0]
+
+
+def server_stats(url):
+    try:
+        return json.load(urllib2.urlopen(url + '/stats'))
+    except (IOError, ValueError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load tests uploading against a stand-in Youtube API.'
+    )
+    parser.add_argument('--serve', action='store_true',
+                        help='Only run the stand-in until interrupted.')
+    parser.add_argument('--url', help='''URL of a stand-in that's already \
+running; by default, one is started in this process.''')
+    parser.add_argument('--port', type=int, default=0)
+    faults = parser.add_argument_group('faults')
+    faults.add_argument('--error_rate', type=float, default=0,
+                        help='Chance of a 503 error per chunk.')
+    faults.add_argument('--drop_rate', type=float, default=0,
+                        help='Chance of a dropped connection per chunk.')
+    faults.add_argument('--rate', type=float,
+                        help='Link speed per connection in Mbit/s.')
+    faults.add_argument('--latency', type=float, default=0,
+                        help='Seconds added to each response.')
+    faults.add_argument('--quota', type=int,
+                        help='Number of uploads allowed before quota errors.')
+    faults.add_argument('--seed', type=int, default=0)
+    load = parser.add_argument_group('load')
+    load.add_argument('--uploads', type=int, default=8)
+    load.add_argument('--concurrency', type=int, default=4)
+    load.add_argument('--size', type=float, default=16,
+                      help='Size of each video in MB (default: %(default)s).')
+    load.add_argument('--chunk_size', type=int, default=1,
+                      help='Initial chunk size in MB (default: %(default)s).')
+    load.add_argument('--chunk_target', type=int, default=20)
+    load.add_argument('--max_retries', type=int, default=10)
+    load.add_argument('--http_timeout', type=float, default=10,
+                      help='''Seconds before a stalled request is retried \
+(default: %(default)s).''')
+    load.add_argument('--upload_limit', type=float,
+                      help='Total upload rate limit in Mbit/s.')
+    load.add_argument('--metrics_file',
+                      help='Write the metrics in Prometheus format here.')
+    args = parser.parse_args()
+
+    url = args.url
+    server = None
+    if url is None:
+        server = StandInServer(('127.0.0.1', args.port), Faults(
+            error_rate=args.error_rate,
+            drop_rate=args.drop_rate,
+            rate=args.rate * 1000000 / 8 if args.rate else None,
+            latency=args.latency,
+            quota=args.quota,
+            seed=args.seed
+        ))
+        url = server.url
+        if args.serve:
+            print('Serving a stand-in Youtube API at %s.' % url)
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            return
+        server.start()
+
+    workdir = tempfile.mkdtemp(prefix='t2t-upload-')
+    try:
+        video = os.path.join(workdir, 'video.mp4')
+        size = int(args.size * 1024 * 1024)
+        make_video(video, size)
+        engine = Tune2Tube({
+            'api_url': url,
+            'path_output': video,
+            'title': 'Load test',
+            'dynamic_title': False,
+            'add_metadata': False,
+            'quiet': True,
+            'chunk_size': args.chunk_size,
+            'chunk_target': args.chunk_target,
+            'upload_limit': args.upload_limit,
+            'http_timeout': args.http_timeout,
+            # Keep our own state out of the user's data directory.
+            'quota_limit': 0,
+            'session_dir': None,
+            'probe_index': None,
+            'stats_file': os.path.join(workdir, 'stats.json'),
+            'metrics_file': args.metrics_file,
+        })
+        engine.max_retries = args.max_retries
+        engine.get_authenticated_service()
+        engine.get_limiter()
+
+        print('Uploading %d video(s) of %.1f MB to %s, %d at a time...' % (
+            args.uploads, args.size, url, args.concurrency
+        ))
+        pool = ThreadPool(args.concurrency)
+        start = time.time()
+        results = pool.map(lambda n: upload(engine.for_job(), 'load-%d' % n),
+                           range(args.uploads))
+        elapsed = time.time() - start
+        pool.close()
+        engine.get_metrics().flush()
+    finally:
+        shutil.rmtree(workdir)
+        if server is not None:
+            server.stop()
+
+    done = [n for n in results if n[1] is None]
+    errors = Counter(n[1] for n in results if n[1] is not None)
+    values = dict(metrics.drain())
+    chunks = values.get(('stage_runs_total', 'upload_chunk'), 0)
+    chunk_seconds = values.get(('stage_seconds_total', 'upload_chunk'), 0)
+    print('')
+    print('Uploaded:       %d of %d in %.2f s' % (len(done), len(results),
+                                                  elapsed))
+    print('Throughput:     %.2f MB/s' % (
+        len(done) * size / 1048576.0 / elapsed
+    ))
+    print('Chunks:         %d (%.3f s on average)' % (
+        chunks, chunk_seconds / chunks if chunks else 0
+    ))
+    print('Retries:        %d' % values.get(('upload_retries_total', None),
+                                            0))
+    print('Backoff:        %.2f s' % values.get(('backoff_seconds_total',
+                                                  None), 0))
+    for error, count in errors.most_common():
+        print('Failed:         %d x %s' % (count, error))
+    stats = server.stats if server is not None else server_stats(url)
+    if stats is not None:
+        print('Server:         %s' % ', '.join(
+            '%s %s' % (k, v) for k, v in sorted(stats.items())
+        ))
+        # Data that was sent again after a fault isn't counted twice, so
+        # this only adds up if every upload resumed at the right place.
+        if stats['bytes'] != stats['completed'] * size and args.url is None \
+           and stats['completed'] == stats['started']:
+            print('Warning: the server received %d bytes; expected %d.' % (
+                stats['bytes'], stats['completed'] * size
+            ))
+
+
+if __name__ == '__main__':
+    main()
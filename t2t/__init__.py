@@ -17,5 +17,13 @@
 # or implied. See the License for the specific language governing
 # permissions and limitations under the License.
 
+# The batch, pipeline and watch modules pull in multiprocessing, sqlite3
+# and csv, which a single tune doesn't need; import them from t2t.batch,
+# t2t.pipeline and t2t.watch when they're used.
 from tune2tube import Tune2Tube
 from tunetags import TuneTags
+from cache import VideoCache
+from config import Config
+from cli import add_arguments, add_auth_arguments
+from errors import Tune2TubeError, ConfigError, InputError, ProbeError, \
+    EncodeError, AuthError, UploadError
@@ -0,0 +1,54 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import subprocess
+
+
+def artwork_filter(size):
+    '''
+    Returns the ffmpeg filter chain that normalizes an image so that
+    it fits within size (e.g. '1920x1080').
+    '''
+    width, height = size.split('x')
+    return ','.join([
+        # scale the image down to fit, keeping its aspect ratio, but don't
+        # scale up images that are already small enough
+        "scale='min(iw,%s)':'min(ih,%s)':force_original_aspect_ratio="
+        "decrease" % (width, height),
+        # chroma subsampling requires even dimensions
+        'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+        # plain 8-bit RGB, whatever the input was (e.g. CMYK or 16-bit)
+        'format=rgb24'
+    ])
+
+
+def normalize_image(path_ffmpeg, image, output, size):
+    '''
+    Scales, pads and converts an image to an upload-friendly PNG.
+    Raises subprocess.CalledProcessError if ffmpeg fails.
+    '''
+    ffmpeg_cmd = [
+        path_ffmpeg,
+        '-i', image,
+        '-vf', artwork_filter(size),
+        # the input might be an animated GIF; we only want one frame
+        '-frames:v', '1',
+        '-y',
+        output
+    ]
+    return subprocess.check_output(ffmpeg_cmd, stderr=subprocess.STDOUT)
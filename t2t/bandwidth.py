@@ -0,0 +1,160 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import os
+import threading
+import time
+
+
+def mbit_to_bytes(rate):
+    '''
+    Converts a rate in Mbit/s to bytes per second.
+    '''
+    if rate is None:
+        return None
+    return rate * 1000000 / 8.0
+
+
+class BandwidthLimiter(object):
+    '''
+    Token bucket that limits the total upload rate of all uploads in
+    a process. Uploads take their turn in the order they ask for bandwidth,
+    and they ask for small blocks at a time, so concurrent uploads each get
+    a fair share; if only one upload is active, it gets the whole rate.
+
+    The rate (in Mbit/s) can be read from a file, which is checked again
+    every few seconds, so that it can be changed while uploads are running.
+    '''
+
+    def __init__(self, rate=None, rate_file=None, burst=1.0,
+                 check_interval=5):
+        # Rate in bytes per second, or None for no limit.
+        self.rate = mbit_to_bytes(rate)
+        self.rate_file = rate_file
+        # Maximum number of seconds' worth of tokens that can be saved up.
+        self.burst = burst
+        self.check_interval = check_interval
+        self.tokens = 0
+        self.updated = time.time()
+        self.checked = 0
+        self._cond = threading.Condition()
+        # Tickets make sure uploads are served in the order they arrive.
+        self._next_ticket = 0
+        self._serving = 0
+        self.check_rate_file()
+
+    def set_rate(self, rate):
+        '''
+        Changes the rate limit (in Mbit/s, or None for no limit).
+        '''
+        with self._cond:
+            self._change_rate(mbit_to_bytes(rate))
+            self._cond.notify_all()
+
+    def _change_rate(self, rate):
+        '''
+        Changes the rate in bytes per second. The bucket starts over, so
+        that neither tokens saved up nor debt run up under the old rate
+        carry over to the new one.
+        '''
+        if rate == self.rate:
+            return
+        self.rate = rate
+        self.tokens = 0
+        self.updated = time.time()
+
+    def check_rate_file(self):
+        '''
+        Reads the rate limit from our rate file, if it's time to do so.
+        An empty file or 0 means no limit.
+        '''
+        if self.rate_file is None:
+            return
+        now = time.time()
+        if now - self.checked < self.check_interval:
+            return
+        self.checked = now
+        try:
+            with open(os.path.expanduser(self.rate_file)) as f:
+                rate = float(f.read().strip() or 0)
+        except (IOError, ValueError):
+            return
+        self._change_rate(mbit_to_bytes(rate) if rate > 0 else None)
+
+    def _refill(self):
+        now = time.time()
+        if self.rate is not None:
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate,
+                              self.rate * self.burst)
+        self.updated = now
+
+    def consume(self, size):
+        '''
+        Blocks until size bytes may be sent.
+        '''
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while True:
+                self.check_rate_file()
+                if self._serving == ticket:
+                    self._refill()
+                    if self.rate is None or self.tokens > 0:
+                        # We may go into debt for large blocks; whoever is
+                        # next will simply have to wait a little longer.
+                        # Without a limit, there's nothing to keep count of.
+                        if self.rate is not None:
+                            self.tokens -= size
+                        self._serving += 1
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait(min(-self.tokens / self.rate + 0.001,
+                                        self.check_interval))
+                else:
+                    self._cond.wait(self.check_interval)
+
+
+class ThrottledFile(object):
+    '''
+    Wraps a file so that reading from it takes tokens from a limiter.
+    '''
+
+    def __init__(self, fd, limiter, blocksize=16384):
+        self._fd = fd
+        self._limiter = limiter
+        self._blocksize = blocksize
+
+    def read(self, size=-1):
+        data = []
+        remaining = size
+        while size < 0 or remaining > 0:
+            n = self._blocksize if size < 0 else min(remaining,
+                                                     self._blocksize)
+            self._limiter.consume(n)
+            block = self._fd.read(n)
+            if not block:
+                break
+            data.append(block)
+            remaining -= len(block)
+        return ''.join(data)
+
+    def seek(self, offset, whence=0):
+        return self._fd.seek(offset, whence)
+
+    def tell(self):
+        return self._fd.tell()
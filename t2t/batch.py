@@ -0,0 +1,566 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+
+from multiprocessing.pool import ThreadPool
+from containers import container_path
+from errors import InputError, Tune2TubeError
+from jobs import JobStore, job_settings
+from metrics import metrics
+from quota import UploadQueue
+
+# File extensions we consider to be audio or image files when scanning
+# a directory or glob for tunes.
+audio_exts = ('.mp3', '.ogg', '.oga', '.flac', '.wav', '.m4a', '.aac',
+              '.wma', '.ape', '.opus')
+image_exts = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff')
+
+# Basenames that are picked as an album's cover when a track doesn't have
+# an image of its own, in order of preference.
+cover_names = ('cover', 'folder', 'front', 'album')
+
+
+def find_image(audio, default_image=None):
+    '''
+    Finds the image that belongs to an audio file. An image with the same
+    basename is preferred, followed by a generic cover image in the same
+    directory, followed by the only image in the directory (if there's
+    just one). Returns default_image if nothing suitable is found.
+    '''
+    base = os.path.splitext(audio)[0]
+    directory = os.path.dirname(audio) or '.'
+    images = sorted([
+        os.path.join(directory, n) for n in os.listdir(directory)
+        if os.path.splitext(n)[1].lower() in image_exts
+    ])
+    for image in images:
+        if os.path.splitext(image)[0] == base:
+            return image
+    for name in cover_names:
+        for image in images:
+            stem = os.path.splitext(os.path.basename(image))[0]
+            if stem.lower() == name:
+                return image
+    if len(images) == 1:
+        return images[0]
+    return default_image
+
+
+def read_manifest(path):
+    '''
+    Reads a CSV or JSON manifest and returns a list of tune dicts.
+    Each tune needs an 'audio' key; all other keys (e.g. 'image', 'title',
+    'description', 'keywords', 'privacy') are per-track setting overrides.
+    Relative paths are resolved against the manifest's directory.
+    '''
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'rb') as manifest:
+        if os.path.splitext(path)[1].lower() == '.json':
+            rows = json.load(manifest)
+        else:
+            rows = list(csv.DictReader(manifest))
+
+    tunes = []
+    for row in rows:
+        # Drop empty CSV cells so that they don't override the defaults.
+        tune = dict((k, v) for k, v in row.items() if v not in ('', None))
+        if 'audio' not in tune:
+            raise InputError('manifest entry without an audio file: %s' % row)
+        for key in ('audio', 'image'):
+            if key in tune:
+                tune[key] = os.path.join(base, tune[key])
+        tunes.append(tune)
+    return tunes
+
+
+def collect_tunes(source, default_image=None):
+    '''
+    Returns a list of tune dicts from a directory, a glob pattern or
+    a manifest file (.csv or .json). Every tune has at least an 'audio'
+    and an 'image' key.
+    '''
+    if os.path.isdir(source):
+        paths = [os.path.join(source, n) for n in os.listdir(source)]
+        tunes = [{'audio': n} for n in sorted(paths)
+                 if os.path.splitext(n)[1].lower() in audio_exts]
+    elif os.path.isfile(source) and \
+            os.path.splitext(source)[1].lower() in ('.csv', '.json'):
+        tunes = read_manifest(source)
+    else:
+        tunes = [{'audio': n} for n in sorted(glob.glob(source))
+                 if os.path.splitext(n)[1].lower() in audio_exts]
+
+    if not tunes:
+        raise InputError('no audio files found in `%s\'' % source)
+
+    for tune in tunes:
+        if 'image' not in tune:
+            tune['image'] = find_image(tune['audio'], default_image)
+        if tune['image'] is None:
+            raise InputError('couldn\'t find an image file for `%s\'' %
+                             tune['audio'])
+    return tunes
+
+
+def output_path(tune, index, output_dir=None):
+    '''
+    Returns the path of the video file for a tune in a batch. If no output
+    directory is given, it's None, and the video is encoded in the scratch
+    space.
+    '''
+    if output_dir is None:
+        return None
+    name = os.path.splitext(os.path.basename(tune['audio']))[0]
+    return os.path.join(output_dir, '%s.mp4' % name)
+
+
+# The Tune2Tube instance used by the encode workers. It's set by the pool's
+# initializer, so that each job can be run on a copy of it with its own
+# settings.
+_worker_t2t = None
+
+
+def _init_worker(t2t):
+    global _worker_t2t
+    _worker_t2t = t2t
+    # Forget what the main process measured before we were started, so
+    # that it isn't counted twice.
+    metrics.drain()
+
+
+def _encode_worker(job):
+    '''
+    Encodes a single tune in a worker process. Returns the job with either
+    the extracted metadata or an error message added to it.
+    '''
+    t2t = _worker_t2t.for_job(job['settings'])
+    try:
+        info = t2t.probe_audio(job['audio'])
+        if 'key' in job:
+            JobStore(t2t.settings['job_db']).update(
+                job['key'], stage='probed', duration=info['duration'],
+                metadata=info['metadata']
+            )
+        start = time.time()
+        if 'still' in job:
+            t2t.remux_video(job['audio'], job['still'])
+        else:
+            t2t.generate_video(job['audio'], job['image'])
+        job['encode_seconds'] = time.time() - start
+    except Tune2TubeError, e:
+        job['error'] = str(e)
+    else:
+        job['metadata'] = t2t.settings['metadata']
+        # The output's extension depends on the container that was chosen.
+        if job['output'] is not None:
+            job['output'] = container_path(job['output'],
+                                           t2t.settings['current_container'])
+        # The video might be uploaded straight from the cache.
+        job['settings']['path_output'] = t2t.settings['path_output']
+    # Pass our measurements on to the main process.
+    job['metrics'] = metrics.drain()
+    return job
+
+
+def _still_worker(still):
+    '''
+    Encodes the still image video of an album in a worker process.
+    '''
+    try:
+        _worker_t2t.generate_still(still['image'], still['duration'],
+                                   still['path'])
+    except Tune2TubeError, e:
+        still['error'] = str(e)
+    still['metrics'] = metrics.drain()
+    return still
+
+
+class Batch(object):
+    '''
+    Encodes a list of tunes in parallel on a pool of worker processes,
+    and uploads each finished video as soon as it's ready. Encoded videos
+    are kept in a persistent upload queue until they've been uploaded.
+    The progress of each tune is recorded in a job store, so that running
+    the same batch again skips the work that was already done.
+    '''
+
+    def __init__(self, t2t, tunes, jobs=None, output_dir=None, album=False,
+                 upload_jobs=1):
+        self.t2t = t2t
+        self.tunes = tunes
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.output_dir = output_dir
+        # In album mode, the video of each image is encoded only once.
+        self.album = album
+        # Number of videos to upload at the same time.
+        self.upload_jobs = upload_jobs
+        self.queue = UploadQueue(t2t.settings['queue_dir'])
+        self.scratch = t2t.get_scratch()
+        self.store = None
+        if t2t.settings['job_db']:
+            self.store = JobStore(t2t.settings['job_db'])
+        # Audio files of the tunes that failed before they could be
+        # uploaded or added to the upload queue.
+        self.skipped = set()
+
+    def make_jobs(self, use_store=True):
+        '''
+        Returns a job for each tune, containing the settings that
+        need to be changed for that tune specifically.
+        '''
+        jobs = []
+        for n, tune in enumerate(self.tunes):
+            settings = dict((k, v) for k, v in tune.items()
+                            if k not in ('audio', 'image'))
+            # Like on the command line, a title is used as it is, unless
+            # title_vars are given to make it from the metadata.
+            if 'title_vars' in settings:
+                settings['dynamic_title'] = True
+            elif 'title' in settings:
+                settings['dynamic_title'] = False
+            settings['path_output'] = output_path(tune, n, self.output_dir)
+            job = {
+                'audio': tune['audio'],
+                'image': tune['image'],
+                'output': settings['path_output'],
+                'settings': settings
+            }
+            # Files that don't exist are reported when they're encoded.
+            if use_store and self.store is not None and \
+               os.path.exists(tune['audio']) and \
+               os.path.exists(tune['image']):
+                job['key'], job['state'] = self.store.add(
+                    tune['audio'], tune['image'],
+                    job_settings(self.t2t.settings, settings)
+                )
+            jobs.append(job)
+        return jobs
+
+    def resume(self, job, uploading):
+        '''
+        Checks how far an earlier run got with a job. Returns 'done' if
+        there's nothing left to do, 'upload' if its video has already been
+        encoded, or None if it needs to be encoded.
+        '''
+        state = job.get('state')
+        if state is None:
+            return None
+        if uploading and state['stage'] == 'uploaded':
+            return 'done'
+        if state['stage'] in ('new', 'probed') or state['video'] is None \
+           or not os.path.exists(state['video']):
+            return None
+        if not uploading:
+            # Only count videos that were saved where we want them, in
+            # whatever container.
+            if job['output'] is not None and \
+               os.path.splitext(state['video'])[0] == \
+               os.path.splitext(os.path.abspath(job['output']))[0]:
+                return 'done'
+            return None
+        job['settings']['path_output'] = state['video']
+        job['metadata'] = state['metadata']
+        if state['queue_id'] is not None:
+            job['queue_id'] = state['queue_id']
+        return 'upload'
+
+    def use_scratch(self, job):
+        '''
+        Without an output directory, each video is encoded in a directory
+        of its own in the scratch space.
+        '''
+        if job['output'] is None:
+            job['scratch'] = os.path.join(self.scratch.job_dir(), 'video.mp4')
+            job['settings']['path_output'] = job['scratch']
+
+    def encoded(self, job, uploading):
+        '''
+        Records that a job has been encoded. If it's going to be uploaded,
+        it's added to the upload queue.
+        '''
+        if uploading:
+            # Videos stay in the scratch space or the cache until they've
+            # been uploaded.
+            self.queue.add(job)
+        else:
+            self.scratch.unreserve(job.get('scratch'))
+        if 'key' in job:
+            # Don't forget that a tune was uploaded if we only saved
+            # its video to a file this time.
+            stage = 'encoded'
+            if job['state']['stage'] == 'uploaded' and not uploading:
+                stage = 'uploaded'
+            self.store.update(
+                job['key'], stage=stage, error=None,
+                video=os.path.abspath(job['settings']['path_output']),
+                metadata=job['metadata'], queue_id=job.get('queue_id'),
+                encode_seconds=job['encode_seconds']
+            )
+
+    def make_stills(self, jobs):
+        '''
+        Returns a still image video to encode for each image, long enough
+        for the longest track that uses it. Each job is linked to the path
+        of its still image video.
+        '''
+        stills = {}
+        for job in jobs:
+            if 'error' in job:
+                continue
+            try:
+                duration = self.t2t.probe_audio(job['audio'])['duration']
+            except Tune2TubeError, e:
+                job['error'] = str(e)
+                continue
+            if job['image'] not in stills:
+                stills[job['image']] = {
+                    'image': job['image'],
+                    'duration': 0,
+                    'path': os.path.join(self.scratch.job_dir(), 'still.mp4')
+                }
+            still = stills[job['image']]
+            # Add a second so that the video never ends before the audio.
+            still['duration'] = max(still['duration'], duration + 1)
+            job['still'] = still['path']
+        return stills.values()
+
+    def encode_stills(self, pool, stills, jobs):
+        '''
+        Encodes the still image videos of an album on a pool of workers.
+        The jobs whose still couldn't be encoded get its error.
+        '''
+        if stills:
+            print('Encoding %d still image video(s) using %d worker(s)...'
+                  % (len(stills), min(self.jobs, len(jobs))))
+        for still in pool.imap_unordered(_still_worker, stills):
+            metrics.merge(still.pop('metrics'))
+            # Its space is only needed while it's being encoded, since
+            # the tracks that are remuxed with it reserve their own.
+            self.scratch.unreserve(still['path'])
+            if 'error' not in still:
+                continue
+            for job in jobs:
+                if job.get('still') == still['path']:
+                    job['error'] = still['error']
+
+    def prepare_images(self, jobs):
+        '''
+        Converts each image once up front, rather than having every worker
+        that uses the same cover convert it at the same time. The jobs whose
+        image couldn't be converted get its error.
+        '''
+        for image in set(job['image'] for job in jobs):
+            try:
+                self.t2t.prepare_image(image)
+            except Tune2TubeError, e:
+                for job in jobs:
+                    if job['image'] == image:
+                        job['error'] = str(e)
+
+    def encode(self, jobs):
+        '''
+        Encodes a list of jobs, yielding each one as soon as it's finished.
+        '''
+        self.prepare_images(jobs)
+        stills = self.make_stills(jobs) if self.album else []
+        workers = min(self.jobs, len(jobs))
+        pool = multiprocessing.Pool(workers, _init_worker, (self.t2t,))
+        try:
+            self.encode_stills(pool, stills, jobs)
+
+            # Jobs that failed before encoding are reported right away.
+            for job in jobs:
+                if 'error' in job:
+                    yield job
+            jobs = [job for job in jobs if 'error' not in job]
+
+            print('Encoding %d tune(s) using %d worker(s)...' % (
+                len(jobs), workers
+            ))
+            for job in pool.imap_unordered(_encode_worker, jobs):
+                metrics.merge(job.pop('metrics'))
+                yield job
+        finally:
+            pool.close()
+            pool.join()
+            for still in stills:
+                self.scratch.release(still['path'])
+
+    def skip(self, job):
+        '''
+        Reports a job that failed before it could be uploaded.
+        '''
+        self.skipped.add(job['audio'])
+        self.scratch.release(job.get('scratch'))
+        print('Skipping `%s\': %s' % (job['audio'], job['error']))
+        if 'key' in job:
+            self.store.update(job['key'], error=job['error'])
+
+    def upload(self, job, args, video_ready=True):
+        '''
+        Uploads a single tune. Returns whether the upload succeeded.
+        '''
+        for seconds in self.upload_steps(job, args, video_ready):
+            time.sleep(seconds)
+        return 'video_id' in job
+
+    def upload_steps(self, job, args, video_ready=True):
+        '''
+        Uploads a single tune, yielding the number of seconds to wait
+        whenever the upload has to back off; see upload(). A copy of our
+        Tune2Tube instance is used, so that concurrent uploads each have
+        their own settings while sharing the authenticated service and the
+        bandwidth limiter. The video's ID is added to the job once it's
+        been uploaded.
+        '''
+        overrides = dict(job['settings'])
+        if 'metadata' in job:
+            overrides['metadata'] = job['metadata']
+        t2t = self.t2t.for_job(overrides)
+        store = self.store if 'key' in job else None
+        if store is not None:
+            store.update(job['key'], stage='uploading')
+        start = time.time()
+        try:
+            for seconds in t2t.upload_tune_steps(job['audio'], job['image'],
+                                                 args, video_ready):
+                yield seconds
+        except Tune2TubeError, e:
+            # Failed uploads stay in the queue, so they can be tried again.
+            print('Couldn\'t upload `%s\': %s' % (job['audio'], e))
+            if store is not None:
+                store.update(job['key'], error=str(e))
+            self.scratch.unreserve(job['settings']['path_output'])
+            return
+        video_id = job['video_id'] = t2t.settings['video_id']
+        if 'queue_id' in job:
+            self.queue.finish(job['queue_id'], video_id)
+        self.scratch.release(job.get('scratch') or
+                             job['settings']['path_output'])
+        if store is not None:
+            store.update(job['key'], stage='uploaded', video_id=video_id,
+                         error=None, upload_seconds=time.time() - start)
+
+    def start_uploads(self, args):
+        '''
+        Authenticates and returns the thread pool that runs our uploads.
+        '''
+        # Authenticate before starting any uploads, so that they all
+        # share the same service and bandwidth limit.
+        self.t2t.get_authenticated_service(args)
+        self.t2t.get_limiter()
+        return ThreadPool(self.upload_jobs)
+
+    def run(self, args):
+        '''
+        Encodes all tunes and uploads each one once it's ready.
+        Returns the number of tunes that failed.
+        '''
+        settings = self.t2t.settings
+        uploading = not settings['generate_only']
+        failed = 0
+
+        pool = self.start_uploads(args) if uploading else ThreadPool(1)
+        uploads = []
+
+        # Pick up where an earlier run of this batch left off.
+        jobs = []
+        for job in self.make_jobs():
+            status = self.resume(job, uploading)
+            if status == 'done':
+                print('Skipping `%s\': already done.' % job['audio'])
+            elif status == 'upload':
+                print('Using the video encoded earlier for `%s\'.' %
+                      job['audio'])
+                uploads.append(pool.apply_async(
+                    self.upload, (job, args)
+                ))
+            else:
+                jobs.append(job)
+
+        if uploading and settings['stream']:
+            # Streamed uploads encode while uploading, so there's nothing
+            # to encode ahead of time.
+            for job in jobs:
+                uploads.append(pool.apply_async(
+                    self.upload, (job, args, False)
+                ))
+        elif jobs:
+            for job in jobs:
+                self.use_scratch(job)
+            for job in self.encode(jobs):
+                if 'error' in job:
+                    self.skip(job)
+                    failed += 1
+                    continue
+                self.encoded(job, uploading)
+                if uploading:
+                    uploads.append(pool.apply_async(
+                        self.upload, (job, args)
+                    ))
+
+        pool.close()
+        pool.join()
+        failed += len([n for n in uploads if not n.get()])
+        self.t2t.get_metrics().flush()
+        print('Finished batch: %d tune(s), %d failed.' % (
+            len(self.tunes), failed
+        ))
+        return failed
+
+    def dry_run(self):
+        '''
+        Shows the title and description of each tune's video, without
+        encoding or uploading anything.
+        '''
+        start = time.time()
+        for job in self.make_jobs(use_store=False):
+            try:
+                self.t2t.for_job(job['settings']).show_tune(job['audio'])
+            except Tune2TubeError, e:
+                print('Skipping `%s\': %s' % (job['audio'], e))
+        print('Rendered %d tune(s) in %d ms.' % (
+            len(self.tunes), (time.time() - start) * 1000
+        ))
+
+    def run_queue(self, args):
+        '''
+        Uploads the videos left in the upload queue by earlier runs.
+        Returns the number of uploads that failed.
+        '''
+        jobs = self.queue.pending()
+        if not jobs:
+            print('The upload queue is empty.')
+            return 0
+        print('Uploading %d queued video(s)...' % len(jobs))
+        pool = self.start_uploads(args)
+        uploads = [pool.apply_async(self.upload, (job, args))
+                   for job in jobs]
+        pool.close()
+        pool.join()
+        failed = len([n for n in uploads if not n.get()])
+        print('Finished upload queue: %d video(s), %d failed.' % (
+            len(jobs), failed
+        ))
+        return failed
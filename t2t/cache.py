@@ -0,0 +1,171 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import hashlib
+import os
+import time
+
+from containers import video_exts
+from utils import bytes_to_human
+
+
+def hash_file(path, digest=None, blocksize=1024 * 1024):
+    '''
+    Feeds the contents of a file into a hashlib digest and returns it.
+    '''
+    if digest is None:
+        digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), ''):
+            digest.update(block)
+    return digest
+
+
+class VideoCache(object):
+    '''
+    On-disk cache of encoded videos. Each video is keyed by a hash of
+    its input files and the ffmpeg arguments that were used to encode it.
+    When the cache grows beyond max_size bytes, the least recently used
+    videos are removed. Videos are stored with the extension ext, but
+    all of the extensions in exts count as part of the cache.
+    '''
+
+    exts = video_exts
+
+    def __init__(self, directory, max_size, ext='.mp4'):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = max_size
+        self.ext = ext
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+    def key(self, files, args):
+        '''
+        Returns the cache key for a list of input files and the arguments
+        that are used to encode them. The arguments shouldn't contain any
+        paths, so that the same files in another location share a key.
+        '''
+        digest = hashlib.sha1()
+        for path in files:
+            hash_file(path, digest)
+        digest.update('\0'.join(args))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.ext)
+
+    def get(self, key):
+        '''
+        Returns the path of a cached video, or None if there isn't one.
+        '''
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        # Mark the video as recently used.
+        os.utime(path, None)
+        return path
+
+    def tmp_path(self, key):
+        '''
+        Returns a temporary path to encode a video to before it's added.
+        '''
+        return os.path.join(self.directory, '%s.%d.tmp%s' % (
+            key, os.getpid(), self.ext
+        ))
+
+    def add(self, key, tmp_path):
+        '''
+        Moves a newly encoded video into the cache and returns its path.
+        '''
+        path = self.path(key)
+        os.rename(tmp_path, path)
+        self.evict()
+        return path
+
+    def entries(self):
+        '''
+        Returns a list of (mtime, size, path) tuples, least recently
+        used first.
+        '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.exts) or '.tmp' in name:
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        '''
+        Removes the least recently used videos until the cache fits
+        within max_size.
+        '''
+        entries = self.entries()
+        total = sum(n[1] for n in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        '''
+        Removes all videos from the cache, including leftovers from
+        encodes that didn't finish.
+        '''
+        for name in os.listdir(self.directory):
+            if name.endswith(self.exts):
+                os.remove(os.path.join(self.directory, name))
+
+    def info(self):
+        '''
+        Prints a summary of the cache's contents.
+        '''
+        entries = self.entries()
+        total = sum(n[1] for n in entries)
+        print('Cache directory: %s' % self.directory)
+        print('%d video(s), %s of %s used.' % (
+            len(entries),
+            bytes_to_human(total),
+            bytes_to_human(self.max_size)
+        ))
+        for mtime, size, path in reversed(entries):
+            print('%s  %10s  %s' % (
+                time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime)),
+                bytes_to_human(size),
+                os.path.basename(path)
+            ))
+
+
+class ArtworkCache(VideoCache):
+    '''
+    On-disk cache of preprocessed images, keyed by a hash of the original
+    image and the preprocessing settings.
+    '''
+
+    exts = ('.png',)
+
+    def __init__(self, directory, max_size, ext='.png'):
+        super(ArtworkCache, self).__init__(directory, max_size, ext)
@@ -0,0 +1,475 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import argparse
+
+from config import default_settings, privacy_statuses
+from containers import containers
+from profiles import profiles
+
+
+def add_auth_arguments(parser):
+    '''
+    Adds the arguments of oauth2client's authentication flow to a parser.
+    They're the same as those of the argparser in oauth2client/tools.py,
+    which the command line script used to build on; loading oauth2client
+    takes longer than everything else we do on startup, so it's only
+    imported once we authenticate.
+    '''
+    parser.add_argument(
+        '--auth_host_name',
+        default='localhost',
+        help='Hostname when running a local web server.'
+    )
+    parser.add_argument(
+        '--noauth_local_webserver',
+        action='store_true',
+        default=False,
+        help='Do not run a local web server.'
+    )
+    parser.add_argument(
+        '--auth_host_port',
+        default=[8080, 8090],
+        type=int,
+        nargs='*',
+        help='Port web server should listen on.'
+    )
+    parser.add_argument(
+        '--logging_level',
+        default='ERROR',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'],
+        help='Set the logging level of detail.'
+    )
+
+
+def add_arguments(parser, settings=default_settings):
+    '''
+    Adds our command line arguments to a parser, which should have
+    the arguments of add_auth_arguments() as well, and no help argument
+    of its own. Nothing is added to it unless this is called, so the
+    library can be used on its own.
+    '''
+    parser.description = '''Generates a video from an image and audio \
+file and uploads it to Youtube.'''
+    parser.epilog = '''A Youtube Data API client key is required to \
+use this script, as well as ffmpeg. For help on setting up these \
+dependencies, see this project\'s Github page \
+<http://github.com/msikma/tune2tube/> or the included README.md file.'''
+    parser.add_help = True
+    # Manually add a help argument,
+    # as it is turned off in oauth2client/tools.py.
+    parser.add_argument(
+        '--no_stored_auth',
+        action='store_true',
+        help='Forego using stored oauth2 tokens.'
+    )
+    parser.add_argument(
+        'audio_file',
+        nargs='?',
+        help='Audio file (MP3, OGG, FLAC, etc).'
+    )
+    parser.add_argument(
+        'image_file',
+        nargs='?',
+        help='''Image file (PNG, JPG, etc). In batch mode, this is used \
+for tracks that don't have an image of their own.'''
+    )
+    parser.add_argument(
+        '--output',
+        help='''Save the output video (.MP4) to a file rather than \
+uploading it to Youtube. In batch mode, this is a directory.'''
+    )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='''Upload the video while it's being encoded, without \
+writing it to a temporary file first.'''
+    )
+    parser.add_argument(
+        '--chunk_size',
+        type=int,
+        help='''Initial size of upload chunks in MB (default: %d).''' %
+        settings['chunk_size'],
+        default=settings['chunk_size']
+    )
+    parser.add_argument(
+        '--chunk_target',
+        type=int,
+        help='''Adapt the chunk size so that each chunk takes about \
+this many seconds to upload; use 0 for a fixed chunk size \
+(default: %d).''' % settings['chunk_target'],
+        default=settings['chunk_target']
+    )
+    parser.add_argument(
+        '--upload_limit',
+        type=float,
+        help='''Limit the total upload rate of all uploads to this \
+many Mbit/s.''',
+        default=None
+    )
+    parser.add_argument(
+        '--upload_limit_file',
+        help='''Read the upload rate limit in Mbit/s from this file. \
+It's checked every few seconds, so the limit can be changed while uploading; \
+an empty file or 0 means no limit.''',
+        default=None
+    )
+    parser.add_argument(
+        '--no_resume',
+        action='store_const',
+        const=None,
+        dest='session_dir',
+        default=settings['session_dir'],
+        help='''Don't save the state of uploads, and don't resume \
+uploads that were interrupted earlier.'''
+    )
+    parser.add_argument(
+        '--cache',
+        action='store_true',
+        help='''Keep encoded videos in a cache and reuse them when the \
+same files are encoded again with the same settings.'''
+    )
+    parser.add_argument(
+        '--cache_dir',
+        help='''Directory of the video cache (default: %s).''' %
+        settings['cache_dir'],
+        default=settings['cache_dir']
+    )
+    parser.add_argument(
+        '--cache_size',
+        type=int,
+        help='''Maximum size of the video cache in MB; the least \
+recently used videos are removed when it grows larger (default: %d).''' %
+        settings['cache_size'],
+        default=settings['cache_size']
+    )
+    parser.add_argument(
+        '--cache_info',
+        action='store_true',
+        help='Show the contents of the video cache and exit.'
+    )
+    parser.add_argument(
+        '--cache_clear',
+        action='store_true',
+        help='Remove all videos from the video cache and exit.'
+    )
+    parser.add_argument(
+        '--scratch_dir',
+        help='''Directory that videos are encoded in before they're \
+uploaded, e.g. on a tmpfs or a fast local disk. Each video gets \
+a directory of its own, which is removed once it's been uploaded \
+(default: %s).''' % settings['scratch_dir'],
+        default=settings['scratch_dir']
+    )
+    parser.add_argument(
+        '--scratch_budget',
+        type=int,
+        help='''Most space in MB that the videos in the scratch directory \
+are expected to take up; encodes wait until there's room. Use 0 to turn \
+this off (default: %d).''' % settings['scratch_budget'],
+        default=settings['scratch_budget']
+    )
+    parser.add_argument(
+        '--probe_index',
+        help='''Path of the index of audio file probe results; use an \
+empty string to turn it off (default: %s).''' % settings['probe_index'],
+        default=settings['probe_index']
+    )
+    parser.add_argument(
+        '--profile',
+        choices=sorted(profiles.keys()) + ['auto'],
+        help='''Video encoding profile. \'auto\' picks the profile with \
+the lowest expected encoding plus upload time, based on earlier \
+runs (default: %s).''' % settings['profile'],
+        default=settings['profile']
+    )
+    parser.add_argument(
+        '--container',
+        choices=sorted(containers.keys()) + ['auto'],
+        help='''Container of the video. \'auto\' copies the audio into \
+mp4 if it can, or else into mkv (e.g. FLAC, or WAV packed losslessly as \
+FLAC), and only encodes it to MP3 if neither can hold it \
+(default: %s).''' % settings['container'],
+        default=settings['container']
+    )
+    parser.add_argument(
+        '--loop',
+        action='store_true',
+        help='''Encode a short segment of the image once and repeat it \
+for the length of the audio, so that long tracks take no longer to encode \
+than short ones.'''
+    )
+    parser.add_argument(
+        '--loop_segment',
+        type=int,
+        help='''Length in seconds of the segment that's repeated with \
+--loop; the video gets a keyframe this often (default: %s).''' %
+        settings['loop_segment'],
+        default=settings['loop_segment']
+    )
+    parser.add_argument(
+        '--upload_rate',
+        type=float,
+        help='''Upload rate in Mbit/s to assume when picking an \
+\'auto\' profile (default: measured during earlier uploads).''',
+        default=None
+    )
+    parser.add_argument(
+        '--image_size',
+        help='''Scale the image down to fit within this size before \
+encoding the video (default: %s).''' % settings['image_size'],
+        default=settings['image_size']
+    )
+    parser.add_argument(
+        '--no_image_prep',
+        action='store_false',
+        dest='image_prep',
+        help='Use the image as-is, without scaling or converting it.'
+    )
+    parser.add_argument(
+        '--batch',
+        help='''Process a batch of tunes from a directory, a glob \
+pattern, or a .csv/.json manifest with audio, image and per-track \
+settings (e.g. title, description, keywords, privacy).'''
+    )
+    parser.add_argument(
+        '--upload_jobs',
+        type=int,
+        help='''Number of videos to upload at the same time in batch \
+mode; they share the upload rate limit equally (default: 1).''',
+        default=1
+    )
+    parser.add_argument(
+        '--pipeline',
+        action='store_true',
+        help='''In batch mode, probe, encode and upload tunes as separate \
+stages that run at the same time, with a limited number of tunes waiting \
+between them. Uploads that have to back off don't hold up other uploads.'''
+    )
+    parser.add_argument(
+        '--probe_jobs',
+        type=int,
+        help='''Number of audio files to probe at the same time in \
+pipeline mode (default: %d).''' % settings['probe_jobs'],
+        default=settings['probe_jobs']
+    )
+    parser.add_argument(
+        '--stage_queue',
+        type=int,
+        help='''Most tunes that may wait to be encoded, and most videos \
+that may wait to be uploaded, in pipeline mode (default: %d).''' %
+        settings['stage_queue'],
+        default=settings['stage_queue']
+    )
+    parser.add_argument(
+        '--album',
+        action='store_true',
+        help='''In batch mode, encode the video of each image only once \
+and combine it with the audio of each track that uses it.'''
+    )
+    parser.add_argument(
+        '--jobs',
+        type=int,
+        help='''Number of videos to encode in parallel in batch mode \
+(default: number of CPUs).''',
+        default=None
+    )
+    parser.add_argument(
+        '--job_db',
+        help='''Path of the record of each tune's progress in batch \
+mode, used to skip finished work when a batch is run again; use an empty \
+string to turn it off (default: %s).''' % settings['job_db'],
+        default=settings['job_db']
+    )
+    parser.add_argument(
+        '--watch',
+        action='append',
+        metavar='DIR',
+        help='''Keep running and process each new or changed tune that \
+appears in this folder; can be given more than once.'''
+    )
+    parser.add_argument(
+        '--watch_interval',
+        type=int,
+        help='''Number of seconds between checks of the watched folders \
+(default: %d).''' % settings['watch_interval'],
+        default=settings['watch_interval']
+    )
+    parser.add_argument(
+        '--watch_settle',
+        type=int,
+        help='''Number of seconds a file must be left unchanged before \
+it's processed (default: %d).''' % settings['watch_settle'],
+        default=settings['watch_settle']
+    )
+    parser.add_argument(
+        '--quota_limit',
+        type=int,
+        help='''Daily API quota in units; once it's used up, uploads \
+wait until it resets at midnight Pacific time. Use 0 to turn this \
+off (default: %d).''' % settings['quota_limit'],
+        default=settings['quota_limit']
+    )
+    parser.add_argument(
+        '--quota_cost',
+        type=int,
+        help='''Number of quota units each upload costs \
+(default: %d).''' % settings['quota_cost'],
+        default=settings['quota_cost']
+    )
+    parser.add_argument(
+        '--queue',
+        action='store_true',
+        help='''Upload the videos that earlier batches left in the \
+upload queue, e.g. because the quota ran out, and exit.'''
+    )
+    parser.add_argument(
+        '--cs_json',
+        help='''Path to the client secrets json file \
+(default: client_secrets.json).''',
+        default='client_secrets.json'
+    )
+    parser.add_argument(
+        '--privacy',
+        choices=privacy_statuses,
+        help='Privacy status of the video (default: unlisted).',
+        default='unlisted'
+    )
+    parser.add_argument(
+        '--category',
+        default='10',
+        help='''Numeric video category (see the Github wiki for a list; \
+the default is 10, Music).'''
+    )
+    parser.add_argument(
+        '--keywords',
+        help='Comma-separated list of video keywords/tags.',
+        default=''
+    )
+    mxgroup = parser.add_mutually_exclusive_group()
+    mxgroup.add_argument(
+        '--title',
+        help='''Video title string (default: \'%s\'). If neither --title \
+nor --title_vars is specified, --title_vars will be used with its default \
+value, unless this would result in \
+an empty title.''' % settings['default_title']
+    )
+    mxgroup.add_argument(
+        '--title_vars',
+        nargs='?',
+        help='''Comma-separated list of metadata variables to use as \
+the video title (default: %s).''' % settings['default_title_vars']
+    )
+    mxgroup.add_argument(
+        '--title_template',
+        help='''Template of the video title, e.g. \
+\'{artist} - {title}[ ({album})]\'. Fields can have fallbacks \
+({album-artist|artist}), filters ({title!upper}) and a format \
+({track-number:>2}); a part in square brackets is left out if one of its \
+fields is empty. Use @FILE to read the template from a file.'''
+    )
+    parser.add_argument(
+        '--title_sep',
+        help='''Separator for the title variables (default: \' - \', \
+yielding e.g. \'Artist - Title\'). Ignored if \
+using --title_str.''',
+        default=' - '
+    )
+    parser.add_argument(
+        '--description',
+        nargs='?',
+        help='Video description string (default: empty string).',
+        default=''
+    )
+    parser.add_argument(
+        '--description_template',
+        help='''Template of the video description, like \
+--title_template. Besides the metadata tags, {description} is the \
+--description string and {metadata} is the list of all tags.'''
+    )
+    parser.add_argument(
+        '--dry_run',
+        action='store_true',
+        help='''Only show the title and description that each tune \
+would get, without encoding or uploading anything.'''
+    )
+    parser.add_argument(
+        '--http_timeout',
+        type=float,
+        help='''Number of seconds to wait for the Youtube API before \
+a request is retried (default: %s).''' % settings['http_timeout'],
+        default=settings['http_timeout']
+    )
+    parser.add_argument(
+        '--api_url',
+        metavar='URL',
+        help='''Upload to a stand-in for the Youtube API at this URL \
+instead, e.g. one started by benchmark/upload.py --serve.'''
+    )
+    parser.add_argument(
+        '--metrics_log',
+        metavar='FILE',
+        help='''Append the time taken by each stage (probing, encoding, \
+authenticating, each upload chunk, etc.) to this file as JSON lines.'''
+    )
+    parser.add_argument(
+        '--metrics_file',
+        metavar='FILE',
+        help='''Write the totals of all timers and counters to this file \
+in Prometheus' text format, e.g. for node_exporter's textfile collector.'''
+    )
+    parser.add_argument(
+        '--metrics_port',
+        type=int,
+        metavar='PORT',
+        help='''Serve the totals of all timers and counters in \
+Prometheus' text format at http://127.0.0.1:PORT/metrics.'''
+    )
+    parser.add_argument(
+        '--add_metadata',
+        help='''Adds a list of audio file metadata to the \
+description (default: True).''',
+        default=True
+    )
+    parser.add_argument(
+        '-V',
+        '--version',
+        action='version',
+        version='%(prog)s ' + settings['t2t_version'],
+        help='Show version number and exit.'
+    )
+    mxgroup = parser.add_mutually_exclusive_group()
+    mxgroup.add_argument(
+        '-v',
+        '--verbose',
+        action='store_true',
+        help='Verbose mode (display ffmpeg/ffprobe output).'
+    )
+    mxgroup.add_argument(
+        '-q',
+        '--quiet',
+        action='store_true',
+        help='Quiet mode.'
+    )
+    parser.add_argument(
+        '-h',
+        '--help',
+        action='help',
+        default=argparse.SUPPRESS,
+        help='Show this help message and exit.'
+    )
@@ -0,0 +1,191 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+# We can set our uploaded video to one of these statuses.
+privacy_statuses = ('public', 'private', 'unlisted')
+
+# The default settings of the Tune2Tube engine.
+default_settings = {
+    # ffmpeg is a dependency for this script. ffprobe should be
+    # installed along with ffmpeg.
+    'path_ffmpeg': 'ffmpeg',
+    'path_ffprobe': 'ffprobe',
+    # Output filename. If None, the video is encoded in the scratch
+    # space, and removed once it's been uploaded.
+    'path_output': None,
+    # Image used in watch mode for audio files that don't have an image
+    # of their own in their folder.
+    'image_file': None,
+    # Version number.
+    't2t_version': '0.1',
+    # Whether to display ffmpeg/ffprobe output.
+    'verbose': False,
+    # Whether to only generate the video file without uploading it.
+    'generate_only': False,
+    # Whether to forego the usage of stored oauth2 tokens.
+    # If set to True, you will need to authenticate using your
+    # browser each time you use the script.
+    'no_stored_auth': False,
+    # Default title to use in case the user's own title is
+    # an empty string.
+    'default_title': '(Empty title)',
+    # Default variables to use for the dynamically generated title.
+    'default_title_vars': 'artist,title',
+    # Whether to use the dynamically generated title
+    # from the file's metadata.
+    'dynamic_title': True,
+    'title': None,
+    'title_vars': None,
+    # Whether to upload the video while it's being encoded, rather
+    # than writing it to path_output first.
+    'stream': False,
+    # Initial size of upload chunks in MB.
+    'chunk_size': 8,
+    # Number of seconds each chunk should take to upload; the chunk
+    # size is adapted to match. Set to 0 to use a fixed chunk size.
+    'chunk_target': 20,
+    # Whether to hide the upload progress.
+    'quiet': False,
+    # Directory where the state of unfinished uploads is kept, so
+    # that they can be resumed. Set to None to turn it off.
+    'session_dir': '~/.tune2tube/sessions',
+    # Total upload rate limit in Mbit/s, or None for no limit.
+    'upload_limit': None,
+    # File containing the upload rate limit in Mbit/s. It's checked
+    # every few seconds, so the limit can be changed at any time.
+    'upload_limit_file': None,
+    # Whether to keep encoded videos in a cache, so that the same
+    # tune can be uploaded again without encoding it again.
+    'cache': False,
+    'cache_dir': '~/.tune2tube/cache',
+    # Maximum size of the cache in MB.
+    'cache_size': 10240,
+    # Index of probe results, so that unchanged files don't need to
+    # be probed again. Set to None to turn it off.
+    'probe_index': '~/.tune2tube/probe.db',
+    # Video encoding profile; see profiles.py. 'auto' picks the one
+    # that's expected to be fastest to encode and upload.
+    'profile': 'lossless',
+    # Upload rate in Mbit/s used by the 'auto' profile. If None,
+    # the rate measured during earlier uploads is used.
+    'upload_rate': None,
+    # Measured encoding and upload statistics.
+    'stats_file': '~/.tune2tube/stats.json',
+    # Container of the video; see containers.py. 'auto' picks the one
+    # that can hold the audio without encoding it again.
+    'container': 'auto',
+    # Whether to encode a short segment of the image once and loop it
+    # for the length of the audio, rather than encoding every frame,
+    # and the length of the segment in seconds (one frame per second).
+    'loop': False,
+    'loop_segment': 60,
+    # Whether to scale down and convert the image before encoding.
+    'image_prep': True,
+    # Size that the image is scaled down to fit in.
+    'image_size': '1920x1080',
+    # Cache of converted images, and its maximum size in MB.
+    'artwork_dir': '~/.tune2tube/artwork',
+    'artwork_cache_size': 512,
+    # Daily Youtube Data API quota, and the number of units that
+    # each upload costs. Uploads wait for the quota to reset rather
+    # than going over it. Set the limit to 0 to turn this off.
+    'quota_limit': 10000,
+    'quota_cost': 1600,
+    # Record of the quota used today, shared by all processes.
+    'quota_file': '~/.tune2tube/quota.db',
+    # Directory that videos are encoded in before they're uploaded,
+    # e.g. on a tmpfs, and the most space in MB that the videos being
+    # encoded and uploaded may take up. Encodes wait until there's room.
+    # Set the budget to 0 to turn it off.
+    'scratch_dir': '~/.tune2tube/scratch',
+    'scratch_budget': 0,
+    # Directory of the queue of videos waiting to be uploaded.
+    'queue_dir': '~/.tune2tube/queue',
+    # Whether to run batches as a pipeline of probe, encode and upload
+    # stages; see pipeline.py. The number of threads that probe audio
+    # files, and the most jobs that may wait in front of the encode and
+    # upload stages.
+    'pipeline': False,
+    'probe_jobs': 2,
+    'stage_queue': 2,
+    # Record of the progress of each tune in a batch, so that a batch
+    # can be run again without redoing finished work. Set to None to
+    # turn it off.
+    'job_db': '~/.tune2tube/jobs.db',
+    # Number of seconds between checks of watched folders, and the
+    # number of seconds a file must be left unchanged before it's
+    # considered complete.
+    'watch_interval': 5,
+    'watch_settle': 10,
+    # Record of the tunes that watched folders have produced.
+    'watch_state': '~/.tune2tube/watch.db',
+    # Templates of the title and description; see template.py.
+    'title_template': None,
+    'description_template': None,
+    # Whether to only show the title and description of each tune.
+    'dry_run': False,
+    # Log of the time taken by each stage, as JSON lines, and
+    # a Prometheus textfile and HTTP port with the totals. Each is
+    # turned off if it's None.
+    'metrics_log': None,
+    'metrics_file': None,
+    'metrics_port': None,
+    # Seconds to wait for the server before a request fails and is
+    # retried. Without a timeout, a connection that stalls halfway
+    # a chunk would hang the upload forever.
+    'http_timeout': 60,
+    # Base URL of a stand-in for the Youtube API to upload to instead,
+    # e.g. a StandInServer; see standin.py.
+    'api_url': None,
+    # The client secrets file from the Developers Console.
+    'client_secrets_file': 'client_secrets.json',
+    # Video settings: privacy status, numeric category (10 is Music) and
+    # comma-separated keywords.
+    'privacy': 'unlisted',
+    'category': '10',
+    'keywords': '',
+    # Separator for the title variables, yielding e.g. 'Artist - Title'.
+    'title_sep': ' - ',
+    # Video description, and whether to add the metadata tags to it.
+    'description': '',
+    'add_metadata': True,
+    # Metadata tags of the current tune.
+    'metadata': {}
+}
+
+
+class Config(dict):
+    '''
+    The settings of a Tune2Tube engine or of a single job: the defaults,
+    updated with any overrides. A job's config is derived from its engine's,
+    so jobs never change each other's settings or the engine's.
+    '''
+
+    def __init__(self, overrides=None):
+        dict.__init__(self, default_settings)
+        if overrides:
+            self.update(overrides)
+
+    def derive(self, overrides=None):
+        '''
+        Returns a copy of this config with some settings overridden.
+        '''
+        config = Config(self)
+        if overrides:
+            config.update(overrides)
+        return config
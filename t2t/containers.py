@@ -0,0 +1,117 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import os
+
+# Output containers. Each one lists the audio codecs (as named by ffprobe)
+# that it can hold as they are, so that the audio only has to be copied.
+containers = {
+    # What Youtube recommends, so it's used whenever it can copy the audio.
+    'mp4': {
+        'format': 'mp4',
+        'ext': '.mp4',
+        'mimetype': 'video/mp4',
+        'copy': ['aac', 'mp3', 'alac', 'ac3', 'eac3'],
+    },
+    # Takes lossless and free codecs that mp4 doesn't take very well.
+    'mkv': {
+        'format': 'matroska',
+        'ext': '.mkv',
+        'mimetype': 'video/x-matroska',
+        'copy': ['aac', 'mp3', 'alac', 'ac3', 'eac3', 'flac', 'vorbis',
+                 'opus'],
+    },
+}
+
+# Order in which the containers are tried by 'auto'.
+preference = ['mp4', 'mkv']
+
+# Extensions of all video files we might produce.
+video_exts = tuple(n['ext'] for n in containers.values())
+
+# The ffmpeg audio arguments of each way of getting the audio into
+# a container.
+audio_modes = {
+    # only copy the audio, don't re-encode it
+    'copy': ['-c:a', 'copy'],
+    # uncompressed audio is packed losslessly, which is much cheaper
+    # than a lossy encoder and halves the upload
+    'flac': ['-c:a', 'flac'],
+    # anything else is encoded to high quality CBR MP3; LAME is several
+    # times faster than ffmpeg's own AAC encoder
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '320k'],
+}
+
+
+def choose_container(codec, container='auto'):
+    '''
+    Returns the container that takes audio in the given codec with the least
+    work, and the way the audio gets into it: 'copy', 'flac' or 'mp3'.
+    If a container is given, only the audio mode is chosen. The codec is
+    None if ffprobe couldn't tell, in which case the audio is encoded.
+    '''
+    names = preference if container == 'auto' else [container]
+    for name in names:
+        if codec in containers[name]['copy']:
+            return name, 'copy'
+    if codec is not None and codec.startswith('pcm_') and 'mkv' in names:
+        return 'mkv', 'flac'
+    return names[0], 'mp3'
+
+
+def container_path(path, container):
+    '''
+    Returns a video path with the extension of the given container.
+    '''
+    base, ext = os.path.splitext(path)
+    if ext in video_exts:
+        path = base
+    return path + containers[container]['ext']
+
+
+def path_container(path):
+    '''
+    Returns the container that a video path's extension stands for, or None
+    if it doesn't have the extension of one of our containers.
+    '''
+    ext = os.path.splitext(path)[1].lower()
+    for name, container in containers.items():
+        if container['ext'] == ext:
+            return name
+    return None
+
+
+def video_mimetype(path):
+    '''
+    Returns the mimetype of a video file we've made, based on its extension.
+    '''
+    ext = os.path.splitext(path)[1]
+    for container in containers.values():
+        if container['ext'] == ext:
+            return container['mimetype']
+    return 'video/mp4'
+
+
+def describe_audio(container, mode, codec):
+    '''
+    Returns a short description of a choice made by choose_container().
+    '''
+    codec = codec or 'unknown'
+    if mode == 'copy':
+        return '%s, copying the %s audio' % (container, codec)
+    return '%s, encoding the %s audio to %s' % (container, codec, mode)
@@ -0,0 +1,60 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+
+class Tune2TubeError(Exception):
+    '''
+    Base class of the errors raised by tune2tube. The message is meant
+    to be shown to the user.
+    '''
+
+
+class ConfigError(Tune2TubeError):
+    '''
+    Raised when a setting is invalid, e.g. a template that can't be parsed.
+    '''
+
+
+class InputError(Tune2TubeError):
+    '''
+    Raised when an input file is missing or can't be used.
+    '''
+
+
+class ProbeError(InputError):
+    '''
+    Raised when an audio file can't be probed.
+    '''
+
+
+class EncodeError(Tune2TubeError):
+    '''
+    Raised when ffmpeg fails to encode a video or convert an image.
+    '''
+
+
+class AuthError(Tune2TubeError):
+    '''
+    Raised when we can't authenticate with the Youtube API.
+    '''
+
+
+class UploadError(Tune2TubeError):
+    '''
+    Raised when an upload fails.
+    '''
@@ -0,0 +1,138 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import hashlib
+import json
+import os
+import time
+
+from cache import hash_file
+from quota import connect
+
+# The stages a job goes through, in order.
+stages = ('new', 'probed', 'encoded', 'uploading', 'uploaded')
+
+# Columns of the jobs table, besides the key.
+columns = ('audio', 'image', 'audio_sha1', 'image_sha1', 'stage', 'video',
+           'video_id', 'metadata', 'duration', 'queue_id', 'error',
+           'encode_seconds', 'upload_seconds', 'created', 'updated')
+
+# Settings of the engine that change a tune's video or how it's published.
+# They're part of each job's key, so that running a batch again with other
+# settings processes its tunes again.
+result_settings = ('profile', 'container', 'loop', 'loop_segment',
+                   'image_prep', 'image_size', 'title', 'title_vars',
+                   'dynamic_title', 'default_title', 'title_sep',
+                   'title_template', 'description', 'description_template',
+                   'add_metadata', 'privacy', 'category', 'keywords')
+
+
+def job_settings(engine_settings, settings):
+    '''
+    Returns the settings that decide a job's result: those of the engine
+    that matter, updated with the job's own. Templates that are read from
+    a file are represented by the hash of the file, so that changing the
+    file counts as well.
+    '''
+    result = dict((k, engine_settings.get(k)) for k in result_settings)
+    result.update(settings)
+    for name in ('title_template', 'description_template'):
+        source = result.get(name)
+        if source and source.startswith('@'):
+            path = os.path.expanduser(source[1:])
+            if os.path.exists(path):
+                result[name] = '@' + hash_file(path).hexdigest()
+    return result
+
+
+def job_key(audio_sha1, image_sha1, settings):
+    '''
+    Returns the key of a job: a hash of its input files and the settings
+    that apply to it, apart from where its video is written to.
+    '''
+    settings = dict((k, v) for k, v in settings.items()
+                    if k != 'path_output')
+    digest = hashlib.sha1()
+    digest.update('%s\0%s\0' % (audio_sha1, image_sha1))
+    digest.update(json.dumps(settings, sort_keys=True))
+    return digest.hexdigest()
+
+
+class JobStore(object):
+    '''
+    Record of the state of each tune that's been processed in a batch:
+    the stage it has reached, its video file and Youtube video ID, how long
+    each stage took, and the last error. A batch that's run again uses this
+    to skip the work that was already done.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with connect(self.path) as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+                key TEXT PRIMARY KEY, audio TEXT, image TEXT,
+                audio_sha1 TEXT, image_sha1 TEXT, stage TEXT, video TEXT,
+                video_id TEXT, metadata TEXT, duration REAL,
+                queue_id INTEGER, error TEXT, encode_seconds REAL,
+                upload_seconds REAL, created REAL, updated REAL
+            )''')
+
+    def add(self, audio, image, settings):
+        '''
+        Returns the key and the stored state of a job, adding it to the
+        store if it's new.
+        '''
+        audio_sha1 = hash_file(audio).hexdigest()
+        image_sha1 = hash_file(image).hexdigest()
+        key = job_key(audio_sha1, image_sha1, settings)
+        with connect(self.path) as db:
+            db.execute(
+                '''INSERT OR IGNORE INTO jobs (key, audio, image, audio_sha1,
+                image_sha1, stage, created, updated)
+                VALUES (?, ?, ?, ?, ?, 'new', ?, ?)''',
+                (key, audio, image, audio_sha1, image_sha1, time.time(),
+                 time.time())
+            )
+        return key, self.get(key)
+
+    def get(self, key):
+        '''
+        Returns the state of a job as a dict, or None if it's unknown.
+        '''
+        db = connect(self.path)
+        row = db.execute('SELECT %s FROM jobs WHERE key = ?' %
+                         ', '.join(columns), (key,)).fetchone()
+        db.close()
+        if row is None:
+            return None
+        job = dict(zip(columns, row))
+        job['metadata'] = json.loads(job['metadata'] or '{}')
+        return job
+
+    def update(self, key, **fields):
+        '''
+        Changes the state of a job.
+        '''
+        if 'metadata' in fields:
+            fields['metadata'] = json.dumps(fields['metadata'])
+        fields['updated'] = time.time()
+        names = sorted(fields.keys())
+        with connect(self.path) as db:
+            db.execute('UPDATE jobs SET %s WHERE key = ?' % ', '.join(
+                '%s = ?' % n for n in names
+            ), [fields[n] for n in names] + [key])
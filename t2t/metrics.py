@@ -0,0 +1,199 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Prefix of the names of our Prometheus metrics.
+prefix = 't2t_'
+
+# Descriptions of the metrics we export. Counters end in _total; the rest
+# are gauges holding the last value that was measured.
+descriptions = {
+    'stage_seconds_total': 'Time spent in each stage, in seconds.',
+    'stage_runs_total': 'Number of times each stage was run.',
+    'stage_errors_total': 'Number of times each stage failed.',
+    'encoded_bytes_total': 'Size of the encoded videos in bytes.',
+    'encoded_audio_seconds_total': 'Duration of the encoded audio.',
+    'uploaded_bytes_total': 'Number of bytes uploaded.',
+    'upload_retries_total': 'Number of retried upload chunks.',
+    'backoff_seconds_total': 'Time spent waiting before retries.',
+    'encode_speed': 'Speed of the last encode, in audio seconds per second.',
+    'upload_rate': 'Throughput of the last upload chunk, in bytes per second.',
+    'queue_length': 'Number of jobs waiting for each stage of the pipeline.',
+    'workers_busy': 'Number of busy workers of each stage of the pipeline.',
+}
+
+
+class Metrics(object):
+    '''
+    Process-wide timers and counters of where the time goes for each tune:
+    probing (which reads the tags as well), converting the image, encoding,
+    waiting for quota or scratch space, authenticating and uploading each
+    chunk.
+    Each measurement can be written to a log of JSON lines as it happens,
+    and the totals are exported in Prometheus' text format, either to
+    a file for node_exporter's textfile collector or over HTTP.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Values by metric name and stage (None for metrics without one).
+        self.values = {}
+        self.log_path = None
+        self.textfile = None
+        self.server = None
+
+    def configure(self, log_path=None, textfile=None):
+        self.log_path = log_path
+        self.textfile = textfile
+
+    def add(self, name, value=1, stage=None):
+        with self.lock:
+            key = (name, stage)
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, stage=None):
+        with self.lock:
+            self.values[(name, stage)] = value
+
+    def log(self, event, **fields):
+        '''
+        Writes an event to the JSON log, if there is one. Each event is
+        a single short line, so the lines of concurrent processes appending
+        to the same file don't get mixed up.
+        '''
+        if self.log_path is None:
+            return
+        fields['event'] = event
+        fields['time'] = time.time()
+        fields['pid'] = os.getpid()
+        line = json.dumps(fields, sort_keys=True) + '\n'
+        with self.lock:
+            with open(os.path.expanduser(self.log_path), 'a') as log:
+                log.write(line)
+
+    @contextmanager
+    def timer(self, stage, **fields):
+        '''
+        Measures the time spent in a stage. The fields are added to the
+        stage's log event; the block can add more through the dict it gets.
+        '''
+        start = time.time()
+        try:
+            yield fields
+        except Exception, e:
+            self.add('stage_errors_total', stage=stage)
+            fields['error'] = str(e)
+            raise
+        finally:
+            seconds = time.time() - start
+            self.add('stage_seconds_total', seconds, stage)
+            self.add('stage_runs_total', stage=stage)
+            self.log(stage, seconds=round(seconds, 6), **fields)
+
+    def drain(self):
+        '''
+        Returns our values and resets them, e.g. to pass the measurements
+        of a worker process on to the main process.
+        '''
+        with self.lock:
+            values = self.values.items()
+            self.values = {}
+        return values
+
+    def merge(self, values):
+        '''
+        Adds the values returned by drain() in another process to ours.
+        '''
+        for (name, stage), value in values:
+            if name.endswith('_total'):
+                self.add(name, value, stage)
+            else:
+                self.set(name, value, stage)
+
+    def prometheus(self):
+        '''
+        Returns our values in Prometheus' text exposition format.
+        '''
+        with self.lock:
+            values = dict(self.values)
+        lines = []
+        for name in sorted(set(n[0] for n in values)):
+            lines.append('# HELP %s%s %s' % (prefix, name,
+                                             descriptions.get(name, name)))
+            lines.append('# TYPE %s%s %s' % (
+                prefix, name,
+                'counter' if name.endswith('_total') else 'gauge'
+            ))
+            for (key, stage), value in sorted(values.items()):
+                if key != name:
+                    continue
+                label = '{stage="%s"}' % stage if stage is not None else ''
+                lines.append('%s%s%s %s' % (prefix, name, label, repr(value)))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        '''
+        Writes our values to the Prometheus textfile, if there is one.
+        The file is replaced at once, so it's never read half-written.
+        '''
+        if self.textfile is None:
+            return
+        path = os.path.expanduser(self.textfile)
+        with open(path + '.tmp', 'w') as textfile:
+            textfile.write(self.prometheus())
+        os.rename(path + '.tmp', path)
+
+    def serve(self, port, host='127.0.0.1'):
+        '''
+        Serves our values over HTTP at /metrics in a background thread.
+        '''
+        import BaseHTTPServer
+        if self.server is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus()
+                self.send_response(200)
+                self.send_header('Content-Type',
+                                 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = BaseHTTPServer.HTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+
+# The metrics of this process.
+metrics = Metrics()
@@ -0,0 +1,288 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import Queue
+import heapq
+import itertools
+import multiprocessing
+import time
+
+from collections import deque
+from multiprocessing.pool import ThreadPool
+from batch import Batch, _encode_worker, _init_worker
+from errors import Tune2TubeError
+from metrics import metrics
+
+# Longest time in seconds that the main thread waits for news from the
+# workers before looking at them again.
+poll_interval = 1.0
+
+
+class Stage(object):
+    '''
+    A stage of the pipeline: a queue of jobs waiting for one of the
+    stage's workers. A stage only starts a job while the queue of the stage
+    after it has room, so that a slow stage holds back the ones before it.
+    Jobs can also be put aside for a while, e.g. an upload that has to back
+    off; they count as queued, and go to the front of the queue once
+    they're due.
+    '''
+
+    def __init__(self, name, workers, size=None):
+        self.name = name
+        self.workers = workers
+        # Most jobs that may be queued, or None for no limit.
+        self.size = size
+        self.queue = deque()
+        # Heap of (due time, sequence number, job) of the jobs put aside.
+        self.sleeping = []
+        self.counter = itertools.count()
+        # Results of the jobs that are being worked on.
+        self.running = []
+
+    def queued(self):
+        return len(self.queue) + len(self.sleeping)
+
+    def has_room(self):
+        return self.size is None or self.queued() < self.size
+
+    def busy(self):
+        return bool(self.queue or self.sleeping or self.running)
+
+    def start(self, pool, func, following=None, callback=None):
+        '''
+        Starts the jobs at the front of the queue on a pool, while there
+        are free workers and room in the following stage.
+        '''
+        while self.queue and len(self.running) < self.workers and \
+                (following is None or following.has_room()):
+            self.running.append(pool.apply_async(
+                func, (self.queue.popleft(),), callback=callback
+            ))
+
+    def finished(self):
+        '''
+        Returns the results of the jobs that have finished. An exception
+        raised by a worker is raised again here.
+        '''
+        done = [n for n in self.running if n.ready()]
+        self.running = [n for n in self.running if n not in done]
+        return [n.get() for n in done]
+
+    def sleep(self, job, seconds):
+        heapq.heappush(self.sleeping, (time.time() + seconds,
+                                       next(self.counter), job))
+
+    def wake(self):
+        '''
+        Moves the jobs that have slept long enough back into the queue.
+        Returns the time the next one is due, or None.
+        '''
+        while self.sleeping and self.sleeping[0][0] <= time.time():
+            self.queue.appendleft(heapq.heappop(self.sleeping)[2])
+        return self.sleeping[0][0] if self.sleeping else None
+
+
+class Pipeline(Batch):
+    '''
+    Runs a batch as three stages, each with its own workers: probing the
+    audio files on threads (which mostly wait for ffprobe), encoding the
+    videos on worker processes, and uploading them on threads. Between the
+    stages, jobs wait in queues of a limited size, so that encoding doesn't
+    run far ahead of uploading, and the CPU and the uplink are kept busy at
+    the same time.
+
+    Uploads are advanced one step at a time (see upload_tune_steps()).
+    When an upload has to back off or wait for quota, it's put aside, and
+    its thread goes on with other uploads in the meantime. Once it's due,
+    it may be resumed on any upload thread, so each chunk is sent with the
+    HTTP connection of the thread that sends it. All of this is coordinated
+    by the thread that calls run(), so no threads are used besides the
+    workers.
+    '''
+
+    def __init__(self, t2t, tunes, jobs=None, output_dir=None, album=False,
+                 upload_jobs=1):
+        Batch.__init__(self, t2t, tunes, jobs, output_dir, album,
+                       upload_jobs)
+        self.probe_jobs = t2t.settings['probe_jobs']
+        self.stage_queue = t2t.settings['stage_queue']
+        # Workers let the main thread know that they're done through this.
+        self.events = Queue.Queue()
+
+    def probe(self, job):
+        '''
+        Probes the audio file of a job on a probe thread.
+        '''
+        try:
+            self.t2t.for_job(job['settings']).probe_audio(job['audio'])
+        except Tune2TubeError, e:
+            job['error'] = str(e)
+        return job
+
+    def step(self, upload):
+        '''
+        Advances an upload on an upload thread, until it's finished or
+        has to wait. Returns the upload along with the number of seconds
+        to wait, or None if it's finished.
+        '''
+        try:
+            return upload, next(upload['steps'])
+        except StopIteration:
+            return upload, None
+
+    def make_upload(self, job, args, video_ready=True):
+        return {
+            'job': job,
+            'steps': self.upload_steps(job, args, video_ready)
+        }
+
+    def notify(self, result):
+        self.events.put(None)
+
+    def wait(self, due):
+        '''
+        Waits until a worker is done, or until an upload is due.
+        '''
+        timeout = poll_interval
+        if due is not None:
+            timeout = max(0, min(due - time.time(), timeout))
+        try:
+            self.events.get(timeout=timeout)
+        except Queue.Empty:
+            pass
+
+    def run(self, args):
+        '''
+        Encodes all tunes and uploads each one once it's ready.
+        Returns the number of tunes that failed.
+        '''
+        settings = self.t2t.settings
+        uploading = not settings['generate_only']
+        stream = uploading and settings['stream']
+        failed = 0
+
+        probes = Stage('probe', self.probe_jobs)
+        encodes = Stage('encode', self.jobs, self.stage_queue)
+        uploads = Stage('upload', self.upload_jobs, self.stage_queue)
+        stages = (probes, encodes, uploads)
+
+        # Pick up where an earlier run of this batch left off.
+        jobs = []
+        for job in self.make_jobs():
+            status = self.resume(job, uploading)
+            if status == 'done':
+                print('Skipping `%s\': already done.' % job['audio'])
+            elif status == 'upload':
+                print('Using the video encoded earlier for `%s\'.' %
+                      job['audio'])
+                uploads.queue.append(self.make_upload(job, args))
+            else:
+                jobs.append(job)
+
+        # Streamed uploads encode while uploading, so they skip the
+        # encode stage.
+        probe_pool = ThreadPool(self.probe_jobs)
+        upload_pool = self.start_uploads(args) if uploading else None
+        encode_pool = None
+        stills = []
+        if jobs and not stream:
+            self.prepare_images(jobs)
+            for job in jobs:
+                if 'error' in job:
+                    self.skip(job)
+                    failed += 1
+            jobs = [job for job in jobs if 'error' not in job]
+        if jobs and not stream:
+            encode_pool = multiprocessing.Pool(min(self.jobs, len(jobs)),
+                                               _init_worker, (self.t2t,))
+        try:
+            if self.album and encode_pool is not None:
+                stills = self.make_stills(jobs)
+                self.encode_stills(encode_pool, stills, jobs)
+                for job in jobs:
+                    if 'error' in job:
+                        self.skip(job)
+                        failed += 1
+                jobs = [job for job in jobs if 'error' not in job]
+            probes.queue.extend(jobs)
+
+            if jobs:
+                print('Running %d tune(s) through %d probe, %d encode and '
+                      '%d upload worker(s)...' % (
+                          len(jobs), self.probe_jobs,
+                          min(self.jobs, len(jobs)) if encode_pool else 0,
+                          self.upload_jobs if uploading else 0
+                      ))
+            while any(stage.busy() for stage in stages):
+                due = uploads.wake()
+                probes.start(probe_pool, self.probe,
+                             uploads if stream else encodes, self.notify)
+                if encode_pool is not None:
+                    encodes.start(encode_pool, _encode_worker,
+                                  uploads if uploading else None,
+                                  self.notify)
+                if upload_pool is not None:
+                    uploads.start(upload_pool, self.step, None, self.notify)
+                self.wait(due)
+
+                for job in probes.finished():
+                    if 'error' in job:
+                        self.skip(job)
+                        failed += 1
+                    elif stream:
+                        uploads.queue.append(self.make_upload(job, args,
+                                                              False))
+                    else:
+                        self.use_scratch(job)
+                        encodes.queue.append(job)
+                for job in encodes.finished():
+                    metrics.merge(job.pop('metrics'))
+                    if 'error' in job:
+                        self.skip(job)
+                        failed += 1
+                        continue
+                    self.encoded(job, uploading)
+                    if uploading:
+                        uploads.queue.append(self.make_upload(job, args))
+                for upload, seconds in uploads.finished():
+                    if seconds is not None:
+                        uploads.sleep(upload, seconds)
+                    elif 'video_id' not in upload['job']:
+                        failed += 1
+                for stage in stages:
+                    metrics.set('queue_length', stage.queued(), stage.name)
+                    metrics.set('workers_busy', len(stage.running),
+                                stage.name)
+        finally:
+            for pool in (probe_pool, encode_pool, upload_pool):
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+            # Let the uploads we didn't get to clean up after themselves.
+            for upload in list(uploads.queue) + \
+                    [n[2] for n in uploads.sleeping]:
+                upload['steps'].close()
+            for still in stills:
+                self.scratch.release(still['path'])
+
+        self.t2t.get_metrics().flush()
+        print('Finished batch: %d tune(s), %d failed.' % (
+            len(self.tunes), failed
+        ))
+        return failed
@@ -0,0 +1,122 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import json
+import os
+import subprocess
+import threading
+
+
+def run_ffprobe(path_ffprobe, audio):
+    '''
+    Probes an audio file with ffprobe and returns a dict with its duration
+    in seconds, codec, sample rate, channel count, bit rate and tags.
+    Raises subprocess.CalledProcessError or ValueError if the file
+    couldn't be probed.
+    '''
+    probe_cmd = [
+        path_ffprobe,
+        # only print errors, not the banner and human-readable info
+        '-v', 'error',
+        # structured output
+        '-print_format', 'json',
+        '-show_format',
+        # we only care about the first audio stream
+        '-show_streams',
+        '-select_streams', 'a:0',
+        audio
+    ]
+    probe = json.loads(subprocess.check_output(probe_cmd))
+    if not probe.get('streams'):
+        raise ValueError('no audio stream found')
+    stream = probe['streams'][0]
+    fmt = probe.get('format', {})
+
+    # Not all containers store the duration in the same place.
+    duration = fmt.get('duration', stream.get('duration'))
+    if duration is None:
+        raise ValueError('no duration found')
+
+    return {
+        'duration': float(duration),
+        'codec': stream.get('codec_name'),
+        'sample_rate': int(stream.get('sample_rate') or 0),
+        'channels': stream.get('channels'),
+        'bit_rate': int(stream.get('bit_rate') or fmt.get('bit_rate') or 0),
+        'format': fmt.get('format_name'),
+        # Most formats keep their tags in the container, but e.g. Ogg keeps
+        # them with the stream.
+        'tags': fmt.get('tags') or stream.get('tags') or {}
+    }
+
+
+class ProbeIndex(object):
+    '''
+    Persistent index of probe results, stored in an SQLite database.
+    Results are keyed by a file's path, size and modification time, so that
+    an unchanged file never has to be probed twice.
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        self._local = threading.local()
+
+    def db(self):
+        '''
+        Returns our database connection. Connections can't be shared with
+        forked worker processes or other threads, so each process and
+        thread opens its own.
+        '''
+        local = self._local
+        if getattr(local, 'db', None) is None or local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            import sqlite3
+            local.db = sqlite3.connect(self.path, timeout=30)
+            local.db.execute('''CREATE TABLE IF NOT EXISTS probes (
+                path TEXT PRIMARY KEY, size INTEGER, mtime REAL, info TEXT
+            )''')
+            local.pid = os.getpid()
+        return local.db
+
+    def get(self, audio):
+        '''
+        Returns the stored probe result of a file, or None if the file
+        hasn't been probed yet or has changed since.
+        '''
+        stat = os.stat(audio)
+        row = self.db().execute(
+            'SELECT size, mtime, info FROM probes WHERE path = ?',
+            (os.path.abspath(audio),)
+        ).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime:
+            return None
+        return json.loads(row[2])
+
+    def put(self, audio, info):
+        '''
+        Stores the probe result of a file.
+        '''
+        stat = os.stat(audio)
+        with self.db() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?)',
+                (os.path.abspath(audio), stat.st_size, stat.st_mtime,
+                 json.dumps(info))
+            )
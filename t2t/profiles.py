@@ -0,0 +1,165 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import json
+import os
+
+# Video encoding profiles. Each one has the x264 arguments it uses, and
+# a rough estimate of its encoding time (in seconds per second of audio)
+# and video size (in bytes per second of audio). The estimates are only
+# used by the 'auto' profile until real measurements are available.
+profiles = {
+    # The original settings: as fast as possible, at the cost of filesize.
+    'lossless': {
+        'description': 'lossless 4:4:4, for hosts with a very fast uplink',
+        'args': [
+            # 4:4:4 chroma subsampling (best quality)
+            '-pix_fmt', 'yuv444p',
+            '-preset', 'ultrafast',
+            # lossless quality
+            '-qp', '0',
+        ],
+        'speed': 0.01,
+        'byterate': 200000
+    },
+    'cpu-cheap': {
+        'description': 'fast, visually lossless encoding',
+        'args': [
+            '-pix_fmt', 'yuv420p',
+            '-preset', 'ultrafast',
+            '-tune', 'stillimage',
+            '-crf', '18',
+        ],
+        'speed': 0.008,
+        'byterate': 20000
+    },
+    'balanced': {
+        'description': 'moderate encoding time and filesize',
+        'args': [
+            '-pix_fmt', 'yuv420p',
+            '-preset', 'veryfast',
+            '-tune', 'stillimage',
+            '-crf', '20',
+        ],
+        'speed': 0.015,
+        'byterate': 8000
+    },
+    'small-upload': {
+        'description': 'smallest files, for hosts with a slow uplink',
+        'args': [
+            '-pix_fmt', 'yuv420p',
+            '-preset', 'slow',
+            '-tune', 'stillimage',
+            '-crf', '23',
+            # the picture never changes, so keyframes are rarely needed
+            '-g', '300',
+        ],
+        'speed': 0.05,
+        'byterate': 3000
+    },
+}
+
+# Upload rate (in bytes per second) that's assumed by the 'auto' profile
+# if we haven't measured any uploads yet.
+default_upload_rate = 1000000
+
+# Weight of a new measurement in the running averages of our statistics.
+stats_weight = 0.3
+
+
+class ProfileStats(object):
+    '''
+    Keeps running averages of the measured encoding speed and video size
+    of each profile, as well as the upload rate, in a JSON file.
+    These are used to pick the fastest profile in 'auto' mode.
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def save(self, stats):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Write to a temporary file first, so that concurrent processes
+        # never see a half-written file.
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(stats, f, indent=2)
+        os.rename(tmp, self.path)
+
+    def update(self, key, value):
+        stats = self.load()
+        if key in stats:
+            value = stats[key] * (1 - stats_weight) + value * stats_weight
+        stats[key] = value
+        self.save(stats)
+
+    def record_encode(self, profile, duration, seconds, size):
+        '''
+        Records an encode of duration seconds of audio that took seconds
+        to complete and produced a video of size bytes.
+        '''
+        if duration <= 0:
+            return
+        self.update('%s.speed' % profile, seconds / duration)
+        self.update('%s.byterate' % profile, size / duration)
+
+    def record_upload(self, size, seconds):
+        '''
+        Records an upload of size bytes that took seconds to complete.
+        '''
+        if seconds <= 0:
+            return
+        self.update('upload_rate', size / seconds)
+
+    def estimate(self, profile):
+        '''
+        Returns the estimated (speed, byterate) of a profile.
+        '''
+        stats = self.load()
+        return (
+            stats.get('%s.speed' % profile, profiles[profile]['speed']),
+            stats.get('%s.byterate' % profile, profiles[profile]['byterate'])
+        )
+
+    def upload_rate(self):
+        return self.load().get('upload_rate', default_upload_rate)
+
+
+def choose_profile(stats, duration, upload_rate=None):
+    '''
+    Returns the name of the profile with the lowest estimated encoding
+    plus upload time for duration seconds of audio. upload_rate is in
+    bytes per second; if it's not given, the measured rate is used.
+    '''
+    if upload_rate is None:
+        upload_rate = stats.upload_rate()
+    times = []
+    for name in sorted(profiles):
+        speed, byterate = stats.estimate(name)
+        times.append((duration * (speed + byterate / float(upload_rate)),
+                      name))
+    return min(times)[1]
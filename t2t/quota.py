@@ -0,0 +1,266 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import json
+import os
+import time
+
+from datetime import datetime, timedelta
+
+
+# Reasons given by the API when we've run out of quota.
+quota_reasons = ('quotaExceeded', 'dailyLimitExceeded', 'uploadLimitExceeded')
+
+# Reasons given by the API when we're sending requests too quickly. These
+# limits only last a short while, so the request is simply retried.
+rate_limit_reasons = ('rateLimitExceeded', 'userRateLimitExceeded')
+
+
+def pacific_offset(utc):
+    '''
+    Returns the offset of US Pacific time from UTC at a given UTC time.
+    Daylight saving time runs from the second Sunday of March until the
+    first Sunday of November, at 2 AM local time.
+    '''
+    def sunday(year, month, n):
+        first = datetime(year, month, 1)
+        return first + timedelta(days=(6 - first.weekday()) % 7 + 7 * (n - 1))
+    dst_start = sunday(utc.year, 3, 2) + timedelta(hours=10)
+    dst_end = sunday(utc.year, 11, 1) + timedelta(hours=9)
+    if dst_start <= utc < dst_end:
+        return timedelta(hours=-7)
+    return timedelta(hours=-8)
+
+
+def quota_day(utc=None):
+    '''
+    Returns the current quota day. The API's quota resets at midnight
+    Pacific time.
+    '''
+    if utc is None:
+        utc = datetime.utcnow()
+    return (utc + pacific_offset(utc)).strftime('%Y-%m-%d')
+
+
+def seconds_until_reset(utc=None):
+    '''
+    Returns the number of seconds until the API's quota resets.
+    '''
+    if utc is None:
+        utc = datetime.utcnow()
+    local = utc + pacific_offset(utc)
+    midnight = datetime(local.year, local.month, local.day) + timedelta(1)
+    return (midnight - local).total_seconds()
+
+
+def error_reasons(e):
+    '''
+    Returns the reasons the API gave for a 403 HttpError.
+    '''
+    if e.resp.status != 403:
+        return []
+    try:
+        errors = json.loads(e.content)['error']['errors']
+    except (ValueError, KeyError, TypeError):
+        return []
+    return [n.get('reason') for n in errors]
+
+
+def is_quota_error(e):
+    '''
+    Returns whether an HttpError was caused by running out of quota.
+    '''
+    return any(n in quota_reasons for n in error_reasons(e))
+
+
+def is_rate_limit_error(e):
+    '''
+    Returns whether an HttpError was caused by sending requests too
+    quickly.
+    '''
+    return any(n in rate_limit_reasons for n in error_reasons(e))
+
+
+def connect(path):
+    '''
+    Opens a new connection to a database in our data directory. We don't
+    keep connections around, since they can't be shared between threads.
+    '''
+    import sqlite3
+    path = os.path.expanduser(path)
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    return sqlite3.connect(path, timeout=30)
+
+
+class QuotaTracker(object):
+    '''
+    Keeps count of the API quota we've used today, in a database shared by
+    all processes, so that we stop before running into the daily limit.
+    '''
+
+    def __init__(self, path, limit):
+        self.path = path
+        self.limit = limit
+        with connect(self.path) as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS quota (
+                day TEXT PRIMARY KEY, used INTEGER
+            )''')
+
+    def used(self):
+        db = connect(self.path)
+        row = db.execute('SELECT used FROM quota WHERE day = ?',
+                         (quota_day(),)).fetchone()
+        db.close()
+        return row[0] if row else 0
+
+    def reserve(self, cost):
+        '''
+        Reserves quota for an API call. Returns False if that would take
+        us over today's limit.
+        '''
+        day = quota_day()
+        db = connect(self.path)
+        try:
+            # Lock the database, so that no other process can reserve
+            # the same quota in the meantime.
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute('SELECT used FROM quota WHERE day = ?',
+                             (day,)).fetchone()
+            used = row[0] if row else 0
+            if used + cost > self.limit:
+                db.rollback()
+                return False
+            db.execute('INSERT OR REPLACE INTO quota VALUES (?, ?)',
+                       (day, used + cost))
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def exhaust(self):
+        '''
+        Marks today's quota as used up, e.g. after the API told us so.
+        '''
+        with connect(self.path) as db:
+            db.execute('INSERT OR REPLACE INTO quota VALUES (?, ?)',
+                       (quota_day(), self.limit))
+
+    def delay(self, cost):
+        '''
+        Reserves quota for an API call. Returns 0 if that worked, or the
+        number of seconds to wait until the quota resets if there isn't
+        enough left today.
+        '''
+        if self.reserve(cost):
+            return 0
+        seconds = seconds_until_reset()
+        print('''The daily API quota has been used up. Waiting %d \
+minute(s) until it resets...''' % (seconds / 60 + 1))
+        # Wait a little longer, in case our clock is slightly off.
+        return seconds + 60
+
+    def wait(self, cost):
+        '''
+        Reserves quota for an API call, waiting until the quota resets
+        if there isn't enough left today.
+        '''
+        seconds = self.delay(cost)
+        while seconds:
+            time.sleep(seconds)
+            seconds = self.delay(cost)
+
+
+class UploadQueue(object):
+    '''
+    Persistent queue of encoded videos that are waiting to be uploaded.
+    Videos that couldn't be uploaded (e.g. because we ran out of quota or
+    the process was stopped) can be picked up by a later run, without
+    encoding them again. Videos are left in the scratch space or the cache
+    until they've been uploaded.
+    '''
+
+    def __init__(self, directory):
+        self.directory = os.path.expanduser(directory)
+        self.path = os.path.join(self.directory, 'queue.db')
+        with connect(self.path) as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS uploads (
+                id INTEGER PRIMARY KEY, audio TEXT, image TEXT,
+                settings TEXT, metadata TEXT, status TEXT, video_id TEXT,
+                added REAL, job TEXT
+            )''')
+
+    def add(self, job):
+        '''
+        Adds an encoded job to the queue and returns its id.
+        '''
+        settings = dict(job['settings'])
+        settings['path_output'] = os.path.abspath(settings['path_output'])
+        with connect(self.path) as db:
+            id = db.execute(
+                '''INSERT INTO uploads (audio, image, settings, metadata,
+                status, added, job) VALUES (?, ?, ?, ?, 'pending', ?, ?)''',
+                (job['audio'], job['image'], json.dumps(settings),
+                 json.dumps(job.get('metadata', {})), time.time(),
+                 job.get('key'))
+            ).lastrowid
+        job['queue_id'] = id
+        job['settings'] = settings
+        return id
+
+    def finish(self, id, video_id=None):
+        '''
+        Marks a job as uploaded.
+        '''
+        with connect(self.path) as db:
+            db.execute('''UPDATE uploads SET status = 'uploaded',
+                       video_id = ? WHERE id = ?''', (video_id, id))
+
+    def pending(self):
+        '''
+        Returns the jobs that haven't been uploaded yet, oldest first.
+        Jobs whose video file has disappeared are dropped from the queue.
+        '''
+        db = connect(self.path)
+        rows = db.execute(
+            '''SELECT id, audio, image, settings, metadata, job FROM uploads
+            WHERE status = 'pending' ORDER BY id'''
+        ).fetchall()
+        jobs = []
+        for row in rows:
+            job = {
+                'queue_id': row[0],
+                'audio': row[1],
+                'image': row[2],
+                'settings': json.loads(row[3]),
+                'metadata': json.loads(row[4])
+            }
+            if row[5] is not None:
+                job['key'] = row[5]
+            if not os.path.exists(job['settings']['path_output']):
+                print('''Dropping `%s\' from the upload queue: its video \
+file `%s\' no longer exists.''' % (job['audio'],
+                                    job['settings']['path_output']))
+                with db:
+                    db.execute('''UPDATE uploads SET status = 'missing'
+                               WHERE id = ?''', (job['queue_id'],))
+                continue
+            jobs.append(job)
+        db.close()
+        return jobs
@@ -0,0 +1,183 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import errno
+import os
+import shutil
+import tempfile
+import time
+
+from quota import connect
+from utils import bytes_to_human
+
+# Number of seconds between checks of the budget while waiting for room.
+wait_interval = 5
+
+
+def owner_alive(path):
+    '''
+    Returns whether the process that made a job directory is still running.
+    The process ID is part of the directory's name.
+    '''
+    try:
+        pid = int(os.path.basename(path).split('-')[1])
+    except (IndexError, ValueError):
+        return False
+    try:
+        os.kill(pid, 0)
+    except OSError, e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def dir_size(path):
+    '''
+    Returns the total size of the files in a directory.
+    '''
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class ScratchSpace(object):
+    '''
+    Directory where videos are encoded before they're uploaded. Each job
+    gets a directory of its own, so that concurrent runs never overwrite
+    each other's files, and it's removed once the job's upload has been
+    confirmed. The directory can be put on a tmpfs or a fast local disk.
+
+    If there's a budget, each job reserves the size that its video is
+    expected to grow to before it's encoded, in a database shared by all
+    processes. Encodes wait while the reservations of other jobs would
+    take them over the budget.
+    '''
+
+    def __init__(self, directory, budget=0):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.budget = budget
+        self.path = os.path.join(self.directory, 'scratch.db')
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        if self.budget:
+            with connect(self.path) as db:
+                db.execute('''CREATE TABLE IF NOT EXISTS reservations (
+                    path TEXT PRIMARY KEY, size INTEGER
+                )''')
+
+    def job_dir(self):
+        '''
+        Makes a new job directory and returns its path. Empty directories
+        left behind by processes that have stopped are cleaned up first.
+        '''
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('job-') and not owner_alive(path):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    # Not empty: it might still be in the upload queue.
+                    continue
+        return tempfile.mkdtemp(prefix='job-%d-' % os.getpid(),
+                                dir=self.directory)
+
+    def job_of(self, path):
+        '''
+        Returns the job directory that a file is in, or None if it's not
+        in the scratch space.
+        '''
+        if path is None:
+            return None
+        path = os.path.abspath(path)
+        if os.path.dirname(os.path.dirname(path)) != self.directory:
+            return None
+        return os.path.dirname(path)
+
+    def reserve(self, path, size):
+        '''
+        Reserves size bytes for a job's file. Returns False if that would
+        take us over the budget while other jobs are still using it.
+        '''
+        job = self.job_of(path)
+        if not self.budget or job is None:
+            return True
+        db = connect(self.path)
+        try:
+            # Lock the database, so that no other process can reserve
+            # the same space in the meantime.
+            db.execute('BEGIN IMMEDIATE')
+            used = 0
+            for other, reserved in db.execute(
+                    'SELECT path, size FROM reservations').fetchall():
+                if other == job:
+                    continue
+                if not owner_alive(other) or not os.path.isdir(other):
+                    db.execute('DELETE FROM reservations WHERE path = ?',
+                               (other,))
+                    continue
+                used += max(reserved, dir_size(other))
+            # A job that's larger than the whole budget can still go
+            # ahead on its own.
+            if used and used + size > self.budget:
+                db.rollback()
+                return False
+            db.execute('INSERT OR REPLACE INTO reservations VALUES (?, ?)',
+                       (job, size))
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def wait(self, path, size):
+        '''
+        Reserves size bytes for a job's file, waiting until other jobs
+        have made room if there isn't enough left.
+        '''
+        if self.reserve(path, size):
+            return
+        print('Waiting for %s of scratch space in `%s\'...' % (
+            bytes_to_human(size), self.directory
+        ))
+        while not self.reserve(path, size):
+            time.sleep(wait_interval)
+
+    def unreserve(self, path):
+        '''
+        Gives up a job's reservation, but keeps its files, e.g. because
+        its upload failed and it's waiting in the upload queue.
+        '''
+        job = self.job_of(path)
+        if not self.budget or job is None:
+            return
+        with connect(self.path) as db:
+            db.execute('DELETE FROM reservations WHERE path = ?', (job,))
+
+    def release(self, path):
+        '''
+        Removes a job's directory and gives up its reservation, once its
+        file is no longer needed.
+        '''
+        job = self.job_of(path)
+        if job is None:
+            return
+        self.unreserve(path)
+        shutil.rmtree(job, ignore_errors=True)
@@ -0,0 +1,88 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import datetime
+import threading
+
+import httplib2
+from apiclient.discovery import build
+
+
+class AuthenticatedService(object):
+    '''
+    A Youtube API service and its credentials, shared by all uploads in
+    a process. The discovery document is only fetched once, and each thread
+    gets its own authorized HTTP object (httplib2 isn't thread-safe), which
+    keeps its connections open between requests. The access token is
+    refreshed ahead of time rather than after a request fails.
+    '''
+
+    def __init__(self, credentials, service_name, version,
+                 refresh_margin=300, api_url=None, timeout=None):
+        self.credentials = credentials
+        # Seconds to wait for the server before a request fails.
+        self.timeout = timeout
+        # Refresh the access token when it expires within this many seconds.
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if api_url is None:
+            self.youtube = build(service_name, version, http=self.http())
+        else:
+            # Use a stand-in for the API, e.g. a StandInServer.
+            self.youtube = build(
+                service_name, version, http=self.http(),
+                discoveryServiceUrl=api_url.rstrip('/') +
+                '/discovery/v1/apis/{api}/{apiVersion}/rest',
+                cache_discovery=False
+            )
+
+    def http(self):
+        '''
+        Returns the authorized HTTP object of the current thread.
+        '''
+        if getattr(self._local, 'http', None) is None:
+            http = httplib2.Http(timeout=self.timeout)
+            # The upload protocol answers each chunk with a 308 that isn't
+            # a redirect; newer versions of httplib2 would try to follow it.
+            http.redirect_codes = http.redirect_codes - set([308])
+            self._local.http = self.credentials.authorize(http)
+        return self._local.http
+
+    def refresh_if_needed(self):
+        '''
+        Refreshes the access token if it has expired or is about to.
+        '''
+        with self._lock:
+            expiry = self.credentials.token_expiry
+            margin = datetime.timedelta(seconds=self.refresh_margin)
+            if self.credentials.access_token_expired or (
+                expiry is not None and
+                expiry - margin < datetime.datetime.utcnow()
+            ):
+                self.credentials.refresh(self.http())
+
+    def prepare(self, request):
+        '''
+        Makes a request use the current thread's HTTP object and a fresh
+        access token. Long uploads can outlast a token, so this should be
+        done right before the request is executed.
+        '''
+        self.refresh_if_needed()
+        request.http = self.http()
+        return request
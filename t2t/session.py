@@ -0,0 +1,95 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import json
+import os
+
+from cache import hash_file
+
+
+class UploadSession(object):
+    '''
+    The state of a resumable upload, saved to disk so that an interrupted
+    upload can be continued by a later run. A session belongs to the
+    contents of a video file rather than its path, since the same video
+    may be encoded to a different temporary file the next time.
+    '''
+
+    def __init__(self, directory, upfile):
+        self.directory = os.path.expanduser(directory)
+        self.upfile = upfile
+        self.size = os.path.getsize(upfile)
+        self.sha1 = hash_file(upfile).hexdigest()
+        self.path = os.path.join(self.directory, '%s.json' % self.sha1)
+
+    def load(self):
+        '''
+        Returns the saved state of this session, or None if there's
+        no interrupted upload of this file.
+        '''
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            return None
+        if state.get('size') != self.size:
+            return None
+        return state
+
+    def save(self, uri, offset):
+        '''
+        Saves the session URI and the number of bytes that the server
+        has confirmed so far.
+        '''
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({
+                'uri': uri,
+                'file': os.path.abspath(self.upfile),
+                'size': self.size,
+                'sha1': self.sha1,
+                'offset': offset
+            }, f, indent=2)
+        os.rename(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def query_session(http, uri, size):
+    '''
+    Asks the server how much of an upload it has received. Returns a tuple
+    of the confirmed offset and, if the upload was already completed, the
+    server's response. Returns None if the session no longer exists.
+    '''
+    resp, content = http.request(uri, 'PUT', headers={
+        'Content-Range': 'bytes */%d' % size,
+        'Content-Length': '0'
+    })
+    if resp.status in (200, 201):
+        return size, json.loads(content)
+    if resp.status != 308:
+        return None
+    # The range header looks like 'bytes=0-1234'; it's missing if the
+    # server hasn't received anything yet.
+    if 'range' not in resp:
+        return 0, None
+    return int(resp['range'].split('-')[1]) + 1, None
@@ -0,0 +1,391 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import BaseHTTPServer
+import SocketServer
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+import urlparse
+
+# Paths of the discovery document and the upload endpoint.
+discovery_path = '/discovery/v1/apis/youtube/v3/rest'
+upload_path = '/upload/youtube/v3/videos'
+session_path = '/upload/sessions/'
+
+
+def discovery_document(base):
+    '''
+    Returns the part of the Youtube Data API's discovery document that we
+    use: videos.insert with resumable media uploads.
+    '''
+    return {
+        'kind': 'discovery#restDescription',
+        'discoveryVersion': 'v1',
+        'id': 'youtube:v3',
+        'name': 'youtube',
+        'version': 'v3',
+        'protocol': 'rest',
+        'rootUrl': base + '/',
+        'servicePath': 'youtube/v3/',
+        'baseUrl': base + '/youtube/v3/',
+        'batchPath': 'batch/youtube/v3',
+        'parameters': {
+            'alt': {'type': 'string', 'default': 'json',
+                    'location': 'query'},
+        },
+        'schemas': {
+            'Video': {
+                'id': 'Video',
+                'type': 'object',
+                'properties': {
+                    'id': {'type': 'string'},
+                    'snippet': {'type': 'object'},
+                    'status': {'type': 'object'},
+                },
+            },
+        },
+        'resources': {
+            'videos': {
+                'methods': {
+                    'insert': {
+                        'id': 'youtube.videos.insert',
+                        'path': 'videos',
+                        'httpMethod': 'POST',
+                        'parameters': {
+                            'part': {'type': 'string', 'required': True,
+                                     'location': 'query'},
+                        },
+                        'parameterOrder': ['part'],
+                        'request': {'$ref': 'Video'},
+                        'response': {'$ref': 'Video'},
+                        'supportsMediaUpload': True,
+                        'mediaUpload': {
+                            'accept': ['video/*', 'application/octet-stream'],
+                            'maxSize': '256GB',
+                            'protocols': {
+                                'simple': {'multipart': True,
+                                           'path': upload_path},
+                                'resumable': {'multipart': True,
+                                              'path': upload_path},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+    }
+
+
+class Faults(object):
+    '''
+    The faults a stand-in server injects. Rates are the chance that
+    a chunk is affected; the random generator is seeded, so a run can be
+    repeated exactly.
+    '''
+
+    def __init__(self, error_rate=0, drop_rate=0, rate=None, latency=0,
+                 quota=None, seed=0):
+        # Chance of answering a chunk with a 500 or 503 error.
+        self.error_rate = error_rate
+        # Chance of closing the connection halfway through a chunk.
+        self.drop_rate = drop_rate
+        # Speed of the link in bytes per second per connection, or None.
+        self.rate = rate
+        # Seconds added to every response.
+        self.latency = latency
+        # Number of uploads that can be started before the server reports
+        # that the quota has run out, or None for no limit.
+        self.quota = quota
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def cut(self, length):
+        '''
+        Returns where a dropped connection is cut off.
+        '''
+        with self.lock:
+            return self.random.randint(0, length - 1)
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    Local stand-in for the parts of the Youtube Data API that we use: the
+    discovery document and the resumable videos.insert protocol. It can
+    inject server errors, dropped connections, slow links and quota errors,
+    so that our upload and retry logic can be tested without the real API.
+    Uploaded data is counted and hashed, but not kept.
+
+    Point tune2tube at it with the api_url setting (--api_url).
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), faults=None):
+        BaseHTTPServer.HTTPServer.__init__(self, address, StandInHandler)
+        self.faults = faults or Faults()
+        self.lock = threading.Lock()
+        # Threads handling a connection, and their sockets.
+        self.connections = []
+        # Upload sessions by ID.
+        self.sessions = {}
+        self.stats = {
+            'started': 0,
+            'completed': 0,
+            'chunks': 0,
+            'bytes': 0,
+            'errors': 0,
+            'drops': 0,
+            'quota_errors': 0,
+            'status_queries': 0,
+        }
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.stats[name] += value
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self.process_request_thread,
+                                  args=(request, client_address))
+        thread.daemon = True
+        with self.lock:
+            self.connections.append((thread, request))
+        thread.start()
+
+    def start(self):
+        '''
+        Serves requests in a background thread.
+        '''
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        '''
+        Stops serving, and closes the connections that clients kept open.
+        '''
+        self.shutdown()
+        for thread, request in self.connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            thread.join(1)
+        self.server_close()
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Seconds to wait for a client before giving up on its connection.
+    timeout = 60
+
+    def log_message(self, *args):
+        pass
+
+    def respond(self, status, body=None, headers=None):
+        if self.server.faults.latency:
+            time.sleep(self.server.faults.latency)
+        content = json.dumps(body) if body is not None else ''
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def error(self, status, reason, message):
+        self.respond(status, {'error': {
+            'code': status,
+            'message': message,
+            'errors': [{'domain': 'youtube.quota', 'reason': reason,
+                        'message': message}]
+        }})
+
+    def read_body(self, sink=None):
+        '''
+        Reads the request body at the speed of the simulated link. Returns
+        False if the connection was dropped, on purpose or because the
+        client sent less than it said it would.
+        '''
+        faults = self.server.faults
+        length = int(self.headers.get('Content-Length', 0))
+        drop = length and faults.roll(faults.drop_rate)
+        if drop:
+            length = faults.cut(length)
+        block = 65536
+        while length > 0:
+            start = time.time()
+            try:
+                data = self.rfile.read(min(block, length))
+            except socket.error:
+                data = ''
+            if not data:
+                self.close_connection = True
+                return False
+            length -= len(data)
+            if sink is not None:
+                sink(data)
+            if faults.rate:
+                time.sleep(max(0, len(data) / float(faults.rate) -
+                               (time.time() - start)))
+        if drop:
+            self.server.count('drops')
+            self.close_connection = True
+            return False
+        return True
+
+    def do_GET(self):
+        path = urlparse.urlparse(self.path).path
+        if path == discovery_path:
+            self.respond(200, discovery_document(self.server.url))
+        elif path == '/stats':
+            with self.server.lock:
+                self.respond(200, dict(self.server.stats))
+        else:
+            self.respond(404, {'error': {'code': 404,
+                                         'message': 'Not Found'}})
+
+    def do_POST(self):
+        '''
+        Starts a resumable upload, or fails with a quota error.
+        '''
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        body = []
+        if not self.read_body(body.append):
+            return
+        if url.path != upload_path or \
+           query.get('uploadType') != ['resumable']:
+            self.respond(400, {'error': {
+                'code': 400, 'message': 'only resumable uploads are supported'
+            }})
+            return
+        faults = self.server.faults
+        with self.server.lock:
+            out_of_quota = faults.quota is not None and \
+                self.server.stats['started'] >= faults.quota
+            if not out_of_quota:
+                self.server.stats['started'] += 1
+                id = '%011d' % self.server.stats['started']
+                total = self.headers.get('X-Upload-Content-Length')
+                self.server.sessions[id] = {
+                    'id': id,
+                    'received': 0,
+                    'total': int(total) if total else None,
+                    'sha1': hashlib.sha1(),
+                    'metadata': json.loads(''.join(body) or '{}'),
+                    'video': None,
+                }
+        if out_of_quota:
+            self.server.count('quota_errors')
+            self.error(403, 'quotaExceeded', 'The request cannot be '
+                       'completed because you have exceeded your quota.')
+            return
+        self.respond(200, headers={
+            'Location': '%s%s%s' % (self.server.url, session_path, id)
+        })
+
+    def do_PUT(self):
+        '''
+        Receives a chunk of an upload, or reports how much of it has been
+        received so far.
+        '''
+        path = urlparse.urlparse(self.path).path
+        id = path[len(session_path):]
+        session = self.server.sessions.get(id)
+        if not path.startswith(session_path) or session is None:
+            self.read_body()
+            self.respond(404, {'error': {'code': 404,
+                                         'message': 'Not Found'}})
+            return
+
+        # The range header is 'bytes start-end/total' for a chunk, and
+        # 'bytes */total' for a status query; the total is '*' while the
+        # size isn't known yet.
+        spec, total = self.headers.get('Content-Range',
+                                       'bytes */*')[6:].split('/')
+        if total != '*':
+            session['total'] = int(total)
+        if spec == '*':
+            self.server.count('status_queries')
+            self.read_body()
+            self.report(session)
+            return
+
+        start = int(spec.split('-')[0])
+        faults = self.server.faults
+        if start != session['received']:
+            # We can only take the data that follows what we have.
+            self.read_body()
+            self.report(session)
+            return
+        if faults.roll(faults.error_rate):
+            self.read_body()
+            self.server.count('errors')
+            self.respond(503, {'error': {
+                'code': 503, 'message': 'Backend Error'
+            }})
+            return
+
+        chunk = []
+        if not self.read_body(chunk.append):
+            return
+        data = ''.join(chunk)
+        session['received'] += len(data)
+        session['sha1'].update(data)
+        self.server.count('chunks')
+        self.server.count('bytes', len(data))
+        self.report(session)
+
+    def report(self, session):
+        '''
+        Answers with the state of an upload: 308 and the range received so
+        far while it's incomplete, or the video once it's done.
+        '''
+        if session['video'] is None and session['total'] is not None and \
+           session['received'] >= session['total']:
+            self.server.count('completed')
+            session['video'] = {
+                'kind': 'youtube#video',
+                'id': session['id'],
+                'snippet': session['metadata'].get('snippet', {}),
+                'status': {'uploadStatus': 'uploaded'},
+                'fileDetails': {'fileSize': session['received'],
+                                'sha1': session['sha1'].hexdigest()},
+            }
+        if session['video'] is not None:
+            self.respond(200, session['video'])
+            return
+        headers = {}
+        if session['received']:
+            headers['Range'] = 'bytes=0-%d' % (session['received'] - 1)
+        self.respond(308, headers=headers)
@@ -0,0 +1,93 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+from apiclient.http import MediaUpload
+from errors import EncodeError, UploadError
+from metrics import metrics
+
+
+class PipeMediaUpload(MediaUpload):
+    '''
+    Resumable upload of the output of a running ffmpeg process.
+
+    The total size isn't known until ffmpeg finishes, so the upload is sent
+    in chunks with an open-ended content range. Only the bytes that haven't
+    been confirmed by the server yet are kept in memory, so that a failed
+    chunk can be sent again.
+    '''
+
+    def __init__(self, process, chunksize, mimetype='video/mp4',
+                 limiter=None):
+        self._process = process
+        self._limiter = limiter
+        self._chunksize = chunksize
+        self._mimetype = mimetype
+        # Offset of the first byte in our buffer.
+        self._offset = 0
+        self._buffer = ''
+        self._eof = False
+
+    def chunksize(self):
+        return self._chunksize
+
+    def set_chunksize(self, chunksize):
+        self._chunksize = chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def resumable(self):
+        return True
+
+    def getbytes(self, begin, length):
+        '''
+        Returns up to length bytes starting at begin. Anything before begin
+        has been confirmed by the server and is dropped from the buffer.
+        A short read means the stream has ended.
+        '''
+        if begin < self._offset:
+            raise UploadError('''the server requested part of the video \
+stream that has already been discarded''')
+        self._buffer = self._buffer[begin - self._offset:]
+        self._offset = begin
+
+        while len(self._buffer) < length and not self._eof:
+            data = self._process.stdout.read(length - len(self._buffer))
+            if data == '':
+                self._finish()
+            metrics.add('encoded_bytes_total', len(data))
+            self._buffer += data
+
+        data = self._buffer[:length]
+
+        # The chunk is sent in one go, so the best we can do to limit our
+        # bandwidth is to wait until we may send it.
+        if self._limiter is not None:
+            self._limiter.consume(len(data))
+
+        return data
+
+    def _finish(self):
+        '''
+        Called when the stream has ended. Makes sure ffmpeg succeeded
+        before we let the upload be completed.
+        '''
+        self._eof = True
+        if self._process.wait() != 0:
+            raise EncodeError('''encountered an error trying to generate the \
+video stream. Try again with -v (--verbose) to see what went wrong.''')
@@ -0,0 +1,257 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import os
+import string
+
+from errors import ConfigError
+
+# Filters that can be applied to a field, e.g. {artist!upper}.
+filters = {
+    'upper': lambda n: n.upper(),
+    'lower': lambda n: n.lower(),
+    'title': lambda n: n.title(),
+    'strip': lambda n: n.strip(),
+    # Only the first line of a multi-line value.
+    'line': lambda n: n.strip().split('\n')[0],
+    # All lines joined by spaces.
+    'oneline': lambda n: ' '.join(n.split()),
+}
+
+# Characters allowed in field names.
+name_chars = set(string.ascii_letters + string.digits + '-_')
+
+# Templates compiled so far, by their source.
+_compiled = {}
+
+# Templates read from files so far, by their path: the file's modification
+# time and its contents.
+_files = {}
+
+
+class TemplateError(ConfigError, ValueError):
+    '''
+    Raised when a template can't be parsed.
+    '''
+
+
+def compile_field(expr):
+    '''
+    Compiles a field expression (the part between braces) into a function
+    that takes a dict of fields and returns its text, and whether it found
+    a value. A field consists of one or more alternatives separated by |
+    (field names, or text in double quotes), followed by any number of
+    !filters and an optional :format spec.
+    '''
+    alternatives = []
+    chain = []
+    spec = ''
+    pos = 0
+    current = ''
+    # Whether the next alternative may start here: at the start, or
+    # right after a |.
+    expecting = True
+    while pos < len(expr):
+        char = expr[pos]
+        if char == '"':
+            if not expecting:
+                raise TemplateError('missing `|\' in {%s}' % expr)
+            end = expr.find('"', pos + 1)
+            if end == -1:
+                raise TemplateError('unterminated quote in {%s}' % expr)
+            alternatives.append((False, expr[pos + 1:end]))
+            expecting = False
+            pos = end + 1
+            continue
+        if char in '|!:':
+            if current:
+                alternatives.append((True, current))
+                current = ''
+            elif expecting:
+                raise TemplateError('empty alternative in {%s}' % expr)
+            expecting = char == '|'
+            if char == ':':
+                spec = expr[pos + 1:]
+                break
+            if char == '!':
+                end = pos + 1
+                while end < len(expr) and expr[end] not in '!:':
+                    end += 1
+                chain.append(expr[pos + 1:end])
+                pos = end
+                continue
+        elif char in name_chars:
+            if not current and not expecting:
+                raise TemplateError('missing `|\' in {%s}' % expr)
+            current += char
+        elif char.isspace():
+            if current:
+                alternatives.append((True, current))
+                current = ''
+                expecting = False
+        else:
+            raise TemplateError('unexpected `%s\' in {%s}' % (char, expr))
+        pos += 1
+    if current:
+        alternatives.append((True, current))
+    elif expecting and alternatives:
+        raise TemplateError('empty alternative in {%s}' % expr)
+    if not alternatives:
+        raise TemplateError('empty field {%s}' % expr)
+    for name in chain:
+        if name not in filters:
+            raise TemplateError('unknown filter `%s\' in {%s}' % (name, expr))
+    try:
+        format(u'', spec)
+    except ValueError, e:
+        raise TemplateError('invalid format in {%s}: %s' % (expr, e))
+    chain = [filters[n] for n in chain]
+
+    def render(fields):
+        for is_name, value in alternatives:
+            if is_name:
+                value = fields.get(value)
+            if value:
+                break
+        else:
+            return u'', False
+        value = unicode(value)
+        for fn in chain:
+            value = fn(value)
+        if spec:
+            value = format(value, spec)
+        return value, True
+    return render
+
+
+def parse(source, pos=0, depth=0):
+    '''
+    Parses a template, starting at pos. Returns a list of compiled parts
+    and the position where parsing stopped: the end of the source, or the
+    closing bracket of an optional section.
+    '''
+    parts = []
+    text = []
+    while pos < len(source):
+        char = source[pos]
+        pair = source[pos:pos + 2]
+        if pair in ('{{', '}}'):
+            # Escaped brace.
+            text.append(char)
+            pos += 2
+            continue
+        if pair in ('\\[', '\\]'):
+            # Escaped bracket. Brackets can't be escaped by doubling them,
+            # since e.g. ']]' closes two nested sections.
+            text.append(pair[1])
+            pos += 2
+            continue
+        if char in '{[]':
+            if text:
+                parts.append(literal(''.join(text)))
+                text = []
+        if char == '{':
+            end = source.find('}', pos)
+            if end == -1:
+                raise TemplateError('unterminated field at %d' % pos)
+            parts.append(compile_field(source[pos + 1:end]))
+            pos = end + 1
+        elif char == '[':
+            section, pos = parse(source, pos + 1, depth + 1)
+            parts.append(optional(section))
+        elif char == ']':
+            if depth == 0:
+                raise TemplateError('unexpected `]\' at %d' % pos)
+            return parts, pos + 1
+        elif char == '}':
+            raise TemplateError('unexpected `}\' at %d' % pos)
+        else:
+            text.append(char)
+            pos += 1
+    if depth > 0:
+        raise TemplateError('unterminated `[\'')
+    if text:
+        parts.append(literal(''.join(text)))
+    return parts, pos
+
+
+def literal(text):
+    text = unicode(text)
+    return lambda fields: (text, True)
+
+
+def optional(parts):
+    '''
+    Returns a section that's only rendered if all of its fields have
+    a value, e.g. '[ ({album})]'.
+    '''
+    def render(fields):
+        out = []
+        for part in parts:
+            value, found = part(fields)
+            if not found:
+                return u'', True
+            out.append(value)
+        return u''.join(out), True
+    return render
+
+
+class Template(object):
+    '''
+    A title or description template, e.g. '{artist} - {title}[ ({year})]'.
+    Fields are written between braces, and can have fallbacks, filters
+    and a format spec: '{album-artist|artist|"Unknown"!upper:.40}'.
+    A section between square brackets is left out entirely if any of its
+    fields is empty, and sections can be nested. Use doubled braces for
+    literal ones, and a backslash before a literal bracket.
+
+    The template is compiled into a chain of functions once, so rendering
+    it for each track is cheap.
+    '''
+
+    def __init__(self, source):
+        if isinstance(source, str):
+            source = source.decode('utf-8')
+        self.source = source
+        self.parts = parse(source)[0]
+
+    def render(self, fields):
+        return u''.join(part(fields)[0] for part in self.parts)
+
+
+def compile_template(source):
+    '''
+    Returns the compiled Template of a source string. Each source is only
+    compiled once per process.
+    '''
+    if source not in _compiled:
+        _compiled[source] = Template(source)
+    return _compiled[source]
+
+
+def read_template(path):
+    '''
+    Returns the source of a template file. Each file is only read once per
+    process, unless it has been changed since.
+    '''
+    path = os.path.expanduser(path)
+    mtime = os.path.getmtime(path)
+    if path not in _files or _files[path][0] != mtime:
+        with open(path) as f:
+            _files[path] = (mtime, f.read().rstrip('\n'))
+    return _files[path][1]
@@ -19,75 +19,61 @@
 #
 # This script contains code from <https://developers.google.com/>.
 
-import argparse
+import copy
 import subprocess
 import sys
-import re
 import os
-import httplib
-import httplib2
+import shutil
 import random
 import time
-import mutagen
-
-from datetime import datetime, timedelta
-from apiclient.discovery import build
-from apiclient.errors import HttpError
-from apiclient.http import MediaFileUpload
-from oauth2client.client import (flow_from_clientsecrets,
-                                 AccessTokenRefreshError)
-from oauth2client.file import Storage
-from oauth2client.tools import argparser, run_flow
-from utils import bytes_to_human, error_exit
+
+# The Google API client, oauth2client and httplib2 take much longer to load
+# than everything else, so they're only imported by the methods that need
+# them: a run that only encodes a video never loads them.
+from artwork import artwork_filter, normalize_image
+from bandwidth import BandwidthLimiter
+from cache import ArtworkCache, VideoCache
+from config import Config, privacy_statuses
+from containers import (audio_modes, choose_container, container_path,
+                        containers, describe_audio, video_mimetype)
+from errors import (AuthError, ConfigError, EncodeError, InputError,
+                    ProbeError, UploadError)
+from metrics import metrics
+from probe import ProbeIndex, run_ffprobe
+from quota import (QuotaTracker, UploadQueue, is_quota_error,
+                   is_rate_limit_error)
+from scratch import ScratchSpace
+from template import TemplateError, compile_template, read_template
+from session import UploadSession, query_session
+from profiles import ProfileStats, choose_profile, profiles
+from utils import bytes_to_human, seconds_to_human
 from tunetags import TuneTags
 
 
 class Tune2Tube(object):
-    def __init__(self):
-        self.settings = {
-            # ffmpeg is a dependency for this script. ffprobe should be
-            # installed along with ffmpeg.
-            'path_ffmpeg': 'ffmpeg',
-            'path_ffprobe': 'ffprobe',
-            # Temporary output filename.
-            'path_output': 'tmp.mp4',
-            # Version number.
-            't2t_version': '0.1',
-            # Whether to display ffmpeg/ffprobe output.
-            'verbose': False,
-            # Whether to only generate the video file without uploading it.
-            'generate_only': False,
-            # Whether to forego the usage of stored oauth2 tokens.
-            # If set to True, you will need to authenticate using your
-            # browser each time you use the script.
-            'no_stored_auth': False,
-            # Default title to use in case the user's own title is
-            # an empty string.
-            'default_title': '(Empty title)',
-            # Default variables to use for the dynamically generated title.
-            'default_title_vars': 'artist,title',
-            # Whether to use the dynamically generated title
-            # from the file's metadata.
-            'dynamic_title': True,
-            'title': None,
-            'title_vars': None
-        }
+    '''
+    Encodes tunes into videos and uploads them to Youtube. An instance can
+    be kept around to process any number of tunes; see process().
+    '''
 
-        # Explicitly tell the underlying HTTP transport library not to retry,
-        # since we are handling retry logic ourselves.
-        httplib2.RETRIES = 1
+    def __init__(self, config=None):
+        self.settings = Config(config)
+        self.probe_index = None
+
+        # The authenticated Youtube API service, once we have one.
+        self.service = None
+
+        # Bandwidth limiter shared by all uploads, if there's a limit.
+        self.limiter = None
+
+        # Limits of the upload chunk size in bytes. The largest chunk is
+        # also the most memory used for buffering a streamed upload.
+        self.min_chunksize = 1024 * 1024
+        self.max_chunksize = 128 * 1024 * 1024
 
         # Maximum number of times to retry before giving up.
         self.max_retries = 10
 
-        # Always retry when these exceptions are raised.
-        self.retriable_exceptions = (
-            httplib2.HttpLib2Error, IOError, httplib.NotConnected,
-            httplib.IncompleteRead, httplib.ImproperConnectionState,
-            httplib.CannotSendRequest, httplib.CannotSendHeader,
-            httplib.ResponseNotReady, httplib.BadStatusLine
-        )
-
         # Always retry when an apiclient.errors.HttpError with one of these
         # status codes is raised.
         self.retriable_status_codes = [500, 502, 503, 504]
@@ -101,7 +87,7 @@ class Tune2Tube(object):
         self.youtube_api_version = 'v3'
 
         # We can set our uploaded video to one of these statuses.
-        self.valid_privacy_statuses = ('public', 'private', 'unlisted')
+        self.valid_privacy_statuses = privacy_statuses
 
         # This variable defines a message to display if
         # the client_secrets_file is missing.
@@ -118,193 +104,105 @@ through <https://console.developers.google.com/>. See the README.md file
 for more details.
 '''
 
-        # Set up our command line argument parser.
-        # The argparser is initialized in oauth2client/tools.py. We're just
-        # adding our own arguments to the ones already defined there.
-        argparser.description = '''Generates a video from an image and audio \
-file and uploads it to Youtube.'''
-        argparser.epilog = '''A Youtube Data API client key is required to \
-use this script, as well as ffmpeg. For help on setting up these \
-dependencies, see this project\'s Github page \
-<http://github.com/msikma/tune2tube/> or the included README.md file.'''
-        argparser.add_help = True
-        # Manually add a help argument,
-        # as it is turned off in oauth2client/tools.py.
-        argparser.add_argument(
-            '--no_stored_auth',
-            action='store_true',
-            help='Forego using stored oauth2 tokens.'
-        )
-        argparser.add_argument(
-            'audio_file',
-            help='Audio file (MP3, OGG, FLAC, etc).'
-        )
-        argparser.add_argument(
-            'image_file',
-            help='Image file (PNG, JPG, etc).'
-        )
-        argparser.add_argument(
-            '--output',
-            help='''Save the output video (.MP4) to a file rather than \
-uploading it to Youtube.'''
-        )
-        argparser.add_argument(
-            '--cs_json',
-            help='''Path to the client secrets json file \
-(default: client_secrets.json).''',
-            default='client_secrets.json'
-        )
-        argparser.add_argument(
-            '--privacy',
-            choices=self.valid_privacy_statuses,
-            help='Privacy status of the video (default: unlisted).',
-            default='unlisted'
-        )
-        argparser.add_argument(
-            '--category',
-            default='10',
-            help='''Numeric video category (see the Github wiki for a list; \
-the default is 10, Music).'''
-        )
-        argparser.add_argument(
-            '--keywords',
-            help='Comma-separated list of video keywords/tags.',
-            default=''
-        )
-        mxgroup = argparser.add_mutually_exclusive_group()
-        mxgroup.add_argument(
-            '--title',
-            help='''Video title string (default: \'%s\'). If neither --title \
-nor --title_vars is specified, --title_vars will be used with its default \
-value, unless this would result in \
-an empty title.''' % self.settings['default_title']
-        )
-        mxgroup.add_argument(
-            '--title_vars',
-            nargs='?',
-            help='''Comma-separated list of metadata variables to use as \
-the video title (default: %s).''' % self.settings['default_title_vars']
-        )
-        argparser.add_argument(
-            '--title_sep',
-            help='''Separator for the title variables (default: \' - \', \
-yielding e.g. \'Artist - Title\'). Ignored if \
-using --title_str.''',
-            default=' - '
-        )
-        argparser.add_argument(
-            '--description',
-            nargs='?',
-            help='Video description string (default: empty string).',
-            default=''
-        )
-        argparser.add_argument(
-            '--add_metadata',
-            help='''Adds a list of audio file metadata to the \
-description (default: True).''',
-            default=True
-        )
-        argparser.add_argument(
-            '-V',
-            '--version',
-            action='version',
-            version='%(prog)s ' + self.settings['t2t_version'],
-            help='Show version number and exit.'
-        )
-        mxgroup = argparser.add_mutually_exclusive_group()
-        mxgroup.add_argument(
-            '-v',
-            '--verbose',
-            action='store_true',
-            help='Verbose mode (display ffmpeg/ffprobe output).'
-        )
-        mxgroup.add_argument(
-            '-q',
-            '--quiet',
-            action='store_true',
-            help='Quiet mode.'
-        )
-        argparser.add_argument(
-            '-h',
-            '--help',
-            action='help',
-            default=argparse.SUPPRESS,
-            help='Show this help message and exit.'
+        self.tunetags = TuneTags()
+
+    @property
+    def retriable_exceptions(self):
+        '''
+        Exceptions that are always retried.
+        '''
+        import httplib
+        import httplib2
+        return (
+            httplib2.HttpLib2Error, IOError, httplib.NotConnected,
+            httplib.IncompleteRead, httplib.ImproperConnectionState,
+            httplib.CannotSendRequest, httplib.CannotSendHeader,
+            httplib.ResponseNotReady, httplib.BadStatusLine
         )
 
-        self.tunetags = TuneTags()
+    def get_authenticated_service(self, args=None):
+        '''
+        Get authenticated and cache the result. The service is shared by
+        all uploads, so we only authenticate once per process. args are
+        the flags for oauth2client's authentication flow; its defaults are
+        used if they're not given.
+        '''
+        if self.service is not None:
+            return self.service.youtube
+        with self.get_metrics().timer('auth'):
+            return self.authenticate(args)
 
-    def get_authenticated_service(self, args):
+    def authenticate(self, args):
         '''
-        Get authenticated and cache the result.
+        Runs oauth2client's authentication flow, or uses the stored
+        credentials if we have them. A stand-in for the API doesn't check
+        our credentials, so we don't need any for it.
         '''
-        flow = flow_from_clientsecrets(
-            self.settings['client_secrets_file'],
-            scope=self.youtube_upload_scope,
-            message=self.missing_client_secrets_message % (
+        import httplib2
+        from oauth2client.client import (flow_from_clientsecrets,
+                                         AccessTokenCredentials)
+        from oauth2client.clientsecrets import InvalidClientSecretsError
+        from oauth2client.file import Storage
+        from oauth2client.tools import argparser, run_flow
+        from service import AuthenticatedService
+
+        # Explicitly tell the underlying HTTP transport library not to retry,
+        # since we are handling retry logic ourselves.
+        httplib2.RETRIES = 1
+
+        if self.settings['api_url']:
+            self.service = AuthenticatedService(
+                AccessTokenCredentials('stand-in', 'tune2tube.py'),
+                self.youtube_api_service_name,
+                self.youtube_api_version,
+                api_url=self.settings['api_url'],
+                timeout=self.settings['http_timeout']
+            )
+            return self.service.youtube
+
+        try:
+            flow = flow_from_clientsecrets(
+                self.settings['client_secrets_file'],
+                scope=self.youtube_upload_scope
+            )
+        except InvalidClientSecretsError:
+            raise AuthError(self.missing_client_secrets_message % (
                 'tune2tube.py',
                 os.path.abspath(os.path.join(
                     os.path.dirname(__file__),
                     self.settings['client_secrets_file']
                 ))
-            )
-        )
+            ))
 
         storage = Storage('%s-oauth2.json' % 'tune2tube.py')
         credentials = storage.get()
         if credentials is None or credentials.invalid \
            or self.settings['no_stored_auth']:
+            if args is None:
+                args = argparser.parse_args([])
             credentials = run_flow(flow, storage, args)
 
-        return build(
+        self.service = AuthenticatedService(
+            credentials,
             self.youtube_api_service_name,
             self.youtube_api_version,
-            http=credentials.authorize(httplib2.Http())
+            timeout=self.settings['http_timeout']
         )
+        return self.service.youtube
 
-    def initialize_upload(self, youtube, args, upfile):
+    def initialize_upload_steps(self, youtube, args, upfile, media=None):
         '''
-        Begin a resumable video upload.
+        Begin a resumable video upload. If media is passed, it is uploaded
+        instead of upfile. Yields the number of seconds to wait whenever
+        the upload has to wait; see upload_tune_steps().
         '''
         tags = None
 
         if self.settings['keywords']:
             tags = self.settings['keywords'].split(',')
 
-        # If we need to generate a dynamic title, do so now.
-        if self.settings['dynamic_title']:
-            title_vars = self.settings['title_vars'].split(',')
-            items = [self.settings['metadata'][n] for n in title_vars
-                     if n in self.settings['metadata']]
-            title = self.settings['title_sep'].join(items)
-        else:
-            title = self.settings['title']
-
-        if title == '':
-            title = '(no title)'
-
-        # Add the metadata tags to the description if needed.
-        description = self.settings['description'].strip()
-        if self.settings['add_metadata']:
-            if description is not '':
-                description += '\n'
-            # Sort the list of metadata, so that items with linebreaks go last.
-            metalist = [{
-                key: self.settings['metadata'][key]
-            } for key in self.settings['metadata']]
-            metalist = sorted(metalist, key=lambda x: '\n'
-                              in list(x.values())[0])
-            for tag in metalist:
-                for key in tag:
-                    # Prevent pictures from being added to the description.
-                    if 'APIC' in key:
-                        continue
-                    value = tag[key]
-                    nice_key = self.tunetags.tag_lookup(key, True)
-                    if '\n' in value:
-                        description += '\n----\n%s: %s\n' % (nice_key, value)
-                    else:
-                        description += '\n%s: %s' % (nice_key, value)
+        title = self.render_title()
+        description = self.render_description()
 
         body = {
             'snippet': {
@@ -318,40 +216,347 @@ description (default: True).''',
             }
         }
 
+        session = None
+        if media is None:
+            from upload import ChunkedFileUpload
+            media = ChunkedFileUpload(upfile, limiter=self.get_limiter(),
+                                      chunksize=self.chunk_bytes(),
+                                      mimetype=video_mimetype(upfile),
+                                      resumable=True)
+            if self.settings['session_dir']:
+                session = UploadSession(self.settings['session_dir'], upfile)
+            filesize = os.path.getsize(upfile)
+            print('Uploading file... (filesize: %s)' % bytes_to_human(
+                filesize
+            ))
+        else:
+            print('Uploading video stream...')
+
         # Call the API's videos.insert method to create and upload the video.
         insert_request = youtube.videos().insert(
             part=','.join(body.keys()),
             body=body,
-            media_body=MediaFileUpload(upfile, chunksize=-1, resumable=True)
+            media_body=media
         )
+        if self.service is not None:
+            self.service.prepare(insert_request)
+
+        # Continue an earlier upload of this file if it was interrupted.
+        if session is not None and self.resume_session(insert_request,
+                                                       session, media):
+            return
+
+        # Only starting a new upload costs quota; resuming one doesn't.
+        quota = self.get_quota()
+        if quota is not None and insert_request.resumable_uri is None:
+            with self.get_metrics().timer('quota_wait'):
+                seconds = quota.delay(self.settings['quota_cost'])
+                while seconds:
+                    yield seconds
+                    seconds = quota.delay(self.settings['quota_cost'])
+
+        start = time.time()
+        for seconds in self.resumable_upload_steps(insert_request, media,
+                                                   session):
+            yield seconds
+        if media.size() is not None:
+            self.get_profile_stats().record_upload(
+                media.size(), time.time() - start
+            )
+
+    def get_template(self, name):
+        '''
+        Returns the compiled title or description template, or None if
+        there isn't one. A template that starts with @ is read from a file.
+        '''
+        source = self.settings[name]
+        if not source:
+            return None
+        if source.startswith('@'):
+            try:
+                source = read_template(source[1:])
+            except (IOError, OSError), e:
+                raise ConfigError('couldn\'t read the %s: %s' % (
+                    name.replace('_', ' '), e
+                ))
+        try:
+            return compile_template(source)
+        except TemplateError, e:
+            raise ConfigError('invalid %s: %s' % (name.replace('_', ' '), e))
+
+    def template_fields(self):
+        '''
+        Returns the fields that templates can use: the normalized metadata
+        tags, plus a few fields of our own.
+        '''
+        fields = dict(self.settings['metadata'])
+        source = self.settings.get('source_file')
+        if source:
+            fields['filename'] = os.path.splitext(os.path.basename(source))[0]
+        if self.settings.get('duration'):
+            fields['duration'] = seconds_to_human(self.settings['duration'])
+        fields['description'] = self.settings['description'].strip()
+        fields['metadata'] = self.metadata_text()
+        return fields
+
+    def render_title(self):
+        '''
+        Returns the title of the video.
+        '''
+        template = self.get_template('title_template')
+        if template is not None:
+            title = template.render(self.template_fields()).strip()
+        # If we need to generate a dynamic title, do so now.
+        elif self.settings['dynamic_title']:
+            title_vars = self.settings['title_vars']
+            if title_vars is None:
+                title_vars = self.settings['default_title_vars']
+            title_vars = title_vars.split(',')
+            items = [self.settings['metadata'][n] for n in title_vars
+                     if n in self.settings['metadata']]
+            title = self.settings['title_sep'].join(items)
+        else:
+            title = self.settings['title']
+
+        if title == '':
+            title = '(no title)'
+        return title
+
+    def render_description(self):
+        '''
+        Returns the description of the video. By default, this is our
+        description followed by the metadata tags, if needed.
+        '''
+        template = self.get_template('description_template')
+        if template is not None:
+            return template.render(self.template_fields()).strip()
+        parts = []
+        description = self.settings['description'].strip()
+        if description:
+            parts.append(description)
+        if self.settings['add_metadata']:
+            metadata = self.metadata_text()
+            if metadata:
+                parts.append(metadata)
+        return '\n\n'.join(parts)
+
+    def metadata_text(self):
+        '''
+        Returns a list of the metadata tags with their human-readable names,
+        one per line. Items with linebreaks go last, set apart by a line.
+        '''
+        lines = []
+        blocks = []
+        for key, value in self.settings['metadata'].items():
+            # Prevent pictures from being added to the description.
+            if 'APIC' in key:
+                continue
+            nice_key = self.tunetags.tag_lookup(key, True)
+            if '\n' in value:
+                blocks.append('----\n%s: %s\n' % (nice_key, value))
+            else:
+                lines.append('%s: %s' % (nice_key, value))
+        return '\n'.join(lines + blocks).strip()
+
+    def render_tune(self, audio):
+        '''
+        Probes an audio file and returns the title and description its
+        video would get, without encoding or uploading anything.
+        '''
+        info = self.probe_audio(audio)
+        self.settings['source_file'] = audio
+        self.settings['duration'] = info['duration']
+        self.settings['video_container'] = self.select_container(info)
+        return self.render_title(), self.render_description()
+
+    def show_tune(self, audio):
+        '''
+        Prints the title and description of a tune's video, and the
+        container it would be encoded to.
+        '''
+        title, description = self.render_tune(audio)
+        print(('''== %s\nContainer: %s\nTitle: %s\nDescription:\n%s\n''' % (
+            audio, self.settings['video_container'], title, description
+        )).encode('utf-8'))
+
+    def get_limiter(self):
+        '''
+        Returns the bandwidth limiter shared by all uploads, or None if
+        there's no upload limit.
+        '''
+        if self.limiter is None and (self.settings['upload_limit'] or
+                                     self.settings['upload_limit_file']):
+            self.limiter = BandwidthLimiter(
+                self.settings['upload_limit'],
+                self.settings['upload_limit_file']
+            )
+        return self.limiter
+
+    def get_metrics(self):
+        '''
+        Returns the metrics of this process, set up to be written where our
+        settings say.
+        '''
+        metrics.configure(self.settings['metrics_log'],
+                          self.settings['metrics_file'])
+        return metrics
 
-        filesize = os.path.getsize(upfile)
-        print('Uploading file... (filesize: %s)' % bytes_to_human(filesize))
-        self.resumable_upload(insert_request)
+    def serve_metrics(self):
+        '''
+        Starts serving the metrics over HTTP, if our settings ask for it.
+        This must only be done by the main process, before any workers are
+        started; the workers send their metrics back to it.
+        '''
+        if self.settings['metrics_port']:
+            self.get_metrics().serve(self.settings['metrics_port'])
+
+    def get_quota(self):
+        '''
+        Returns the API quota tracker, or None if there's no quota limit.
+        '''
+        if not self.settings['quota_limit']:
+            return None
+        return QuotaTracker(self.settings['quota_file'],
+                            self.settings['quota_limit'])
 
-    def resumable_upload(self, insert_request):
+    def get_scratch(self):
+        '''
+        Returns the scratch space that videos without an output path are
+        encoded in.
+        '''
+        return ScratchSpace(self.settings['scratch_dir'],
+                            self.settings['scratch_budget'] * 1024 * 1024)
+
+    def reserve_scratch(self, output, size):
+        '''
+        Waits until there's room in the scratch space's budget for a video
+        of about size bytes, if it's going to be encoded there.
+        '''
+        scratch = self.get_scratch()
+        if not scratch.budget or scratch.job_of(output) is None:
+            return
+        with self.get_metrics().timer('scratch_wait'):
+            scratch.wait(output, int(size))
+
+    def projected_size(self, duration):
+        '''
+        Returns the expected size in bytes of a video of duration seconds
+        encoded with our current profile.
+        '''
+        byterate = self.get_profile_stats().estimate(
+            self.settings['current_profile']
+        )[1]
+        return byterate * duration
+
+    def chunk_bytes(self):
+        '''
+        Returns the initial upload chunk size in bytes.
+        '''
+        from upload import round_chunksize
+        return round_chunksize(self.settings['chunk_size'] * 1024 * 1024,
+                               self.min_chunksize, self.max_chunksize)
+
+    def resume_session(self, insert_request, session, media):
+        '''
+        Points the upload at the session of an earlier, interrupted upload
+        of the same file, and asks the server how much of it was received.
+        Returns True if that upload had actually been completed already.
+        '''
+        state = session.load()
+        if state is None:
+            return False
+        try:
+            result = query_session(insert_request.http, state['uri'],
+                                   media.size())
+        except self.retriable_exceptions, e:
+            print('Couldn\'t resume the previous upload: %s' % e)
+            result = None
+        if result is None:
+            print('The previous upload session has expired. Starting over.')
+            session.remove()
+            return False
+
+        offset, response = result
+        if response is not None:
+            session.remove()
+            self.upload_complete(response)
+            return True
+
+        print('Resuming the previous upload at %s of %s.' % (
+            bytes_to_human(offset), bytes_to_human(media.size())
+        ))
+        insert_request.resumable_uri = state['uri']
+        insert_request.resumable_progress = offset
+        return False
+
+    def upload_complete(self, response):
+        '''
+        Reports the result of a finished upload.
+        '''
+        if 'id' not in response:
+            raise UploadError('''The upload failed with an unexpected \
+response: %s''' % response)
+        self.settings['video_id'] = response['id']
+        print('''Video ID `%s' was successfully uploaded. \
+Its visibility is set to `%s'.''' % (response['id'], self.settings['privacy']))
+        print('''URL of the newly uploaded video: \
+<https://www.youtube.com/watch?v=%s>''' % response['id'])
+        print('''It may take some time for the video to \
+finish processing; typically 1-10 minutes.''')
+
+    def resumable_upload_steps(self, insert_request, media, session=None):
         '''
         This method implements an exponential backoff strategy to resume a
-        failed upload.
+        failed upload. The upload is sent in chunks, whose size is adapted
+        to the measured throughput. If a session is passed, its state is
+        saved after each chunk, so that a later run can resume it.
+        Rather than sleeping, the backoff time is yielded to the caller.
         '''
+        from apiclient.errors import HttpError
+        from upload import ChunkSizer, UploadProgress
         response = None
         error = None
         retry = 0
+        progress = UploadProgress(media.size(), self.settings['quiet'])
+        progress.sent = insert_request.resumable_progress
+        sizer = ChunkSizer(self.chunk_bytes(), self.min_chunksize,
+                           self.max_chunksize, self.settings['chunk_target'])
+        media.set_chunksize(sizer.chunksize)
+        metrics = self.get_metrics()
         while response is None:
             try:
-                status, response = insert_request.next_chunk()
-                if 'id' in response:
-                    print('''Video ID `%s' was successfully uploaded. \
-Its visibility is set to `%s'.''' % (response['id'], self.settings['privacy']))
-                    print('''URL of the newly uploaded video: \
-<https://www.youtube.com/watch?v=%s>''' % response['id'])
-                    print('''It may take some time for the video to \
-finish processing; typically 1-10 minutes.''')
+                # Don't let the access token expire halfway a long upload.
+                # After backing off, the upload may be resumed on another
+                # thread (see Pipeline), so it has to use that thread's
+                # HTTP object rather than the one it started with.
+                if self.service is not None:
+                    self.service.prepare(insert_request)
+                offset = insert_request.resumable_progress
+                with metrics.timer('upload_chunk', offset=offset) as fields:
+                    status, response = insert_request.next_chunk()
+                    if response is None:
+                        fields['bytes'] = status.resumable_progress - offset
+                    elif media.size() is not None:
+                        fields['bytes'] = media.size() - offset
+                if 'bytes' in fields:
+                    metrics.add('uploaded_bytes_total', fields['bytes'])
+                if response is None:
+                    # Another chunk was confirmed; adjust the next one.
+                    sent, seconds = progress.update(status.resumable_progress)
+                    if seconds > 0:
+                        metrics.set('upload_rate', sent / seconds)
+                    media.set_chunksize(sizer.update(sent, seconds))
+                    retry = 0
+                    if session is not None:
+                        session.save(insert_request.resumable_uri,
+                                     status.resumable_progress)
                 else:
-                    error_exit('''The upload failed with an unexpected \
-response: %s''' % response)
+                    if session is not None:
+                        session.remove()
+                    self.upload_complete(response)
             except HttpError, e:
-                if e.resp.status in self.retriable_status_codes:
+                if e.resp.status in self.retriable_status_codes or \
+                   is_rate_limit_error(e):
                     error = '''A retriable HTTP error %d occurred:\n%s''' % (
                         e.resp.status, e.content
                     )
@@ -362,99 +567,102 @@ response: %s''' % response)
 
             if error is not None:
                 print(error)
+                # Make sure the session can be resumed if we give up.
+                if session is not None and insert_request.resumable_uri:
+                    session.save(insert_request.resumable_uri, progress.sent)
                 retry += 1
                 if retry > self.max_retries:
-                    error_exit('''Too many upload errors. No longer \
+                    raise UploadError('''Too many upload errors. No longer \
 attempting to retry.''')
                 max_sleep = 2 ** retry
                 sleep_seconds = random.random() * max_sleep
                 print('''Sleeping %f seconds and then \
 retrying...''' % sleep_seconds)
-                time.sleep(sleep_seconds)
+                metrics.add('upload_retries_total')
+                metrics.add('backoff_seconds_total', sleep_seconds)
+                metrics.log('backoff', retry=retry, seconds=sleep_seconds,
+                            error=error)
+                yield sleep_seconds
+                media.set_chunksize(sizer.failed())
+                error = None
 
-    def generate_video(self, audio, image):
+    def probe_audio(self, audio):
         '''
-        Encodes a video file from our audio and image input files.
+        Probes the audio file for its duration, codec and sample rate,
+        and extracts its metadata. Results are kept in the probe index,
+        so unchanged files are only probed once.
         '''
-        # Check to see if our files exist at all.
-        if not (os.path.exists(audio) and os.path.exists(image)):
-            error_exit('please specify a valid audio and image file')
-
-        in_image_ext = os.path.splitext(image)[1]
-        in_audio_ext = os.path.splitext(audio)[1]
+        if not os.path.isfile(audio):
+            raise InputError('couldn\'t find the audio file `%s\'' % audio)
+        index = self.get_probe_index()
+        info = index.get(audio) if index is not None else None
 
-        # Check our MP3/OGG/FLAC/etc file and get its duration.
-        probe_cmd = [self.settings['path_ffprobe'], audio]
-        try:
-            probe_out = subprocess.check_output(
-                probe_cmd,
-                stderr=subprocess.STDOUT
-            )
-            if self.settings['verbose']:
-                print(probe_out)
-        except:
-            error_exit('''couldn't probe the audio file \
+        if info is None:
+            # Check our MP3/OGG/FLAC/etc file and get its duration and tags.
+            try:
+                with self.get_metrics().timer('ffprobe', audio=audio):
+                    info = run_ffprobe(self.settings['path_ffprobe'], audio)
+            except (OSError, subprocess.CalledProcessError):
+                raise ProbeError('''couldn't probe the audio file \
 (ffprobe might not be available)''')
+            except ValueError, e:
+                raise ProbeError('''couldn't parse ffprobe's output (%s). Try \
+again with -v (--verbose) to see what went wrong.''' % e)
+            info['metadata'] = self.normalize_metadata(info.pop('tags'))
 
-        # Try to extract some metadata from the file using Mutagen.
-        try:
-            metadata = mutagen.File(audio)
-        except AttributeError:
-            metadata = []
+            if index is not None:
+                index.put(audio, info)
+
+        if self.settings['verbose']:
+            print(info)
 
         # Save a human-readable version of the metadata in the object.
-        # Keep the original Mutagen output around too.
-        self.settings['metadata'] = {}
-        self.settings['orig_metadata'] = metadata
-        if metadata is not None:
-            for tag in metadata:
-                item = metadata[tag]
-                # We join the item in case it's still a list, as in the case
-                # of Vorbis.
-                if isinstance(item, (list, tuple)):
-                    item = [n for n in item if isinstance(n, (unicode))]
-                    if item == []: continue
-                    item = ''.join(item)
-                elif not isinstance(item, (unicode)):
-                    continue
-                self.settings['metadata'][self.tunetags.tag_lookup(tag)] = \
-                    str(item)
-
-        # Lift the actual track duration string out of the output.
-        duration = re.findall('Duration: (.+?),', probe_out)
-
-        # If we get valid output, parse the duration and get a seconds value.
-        # Otherwise, stop the script.
-        if len(duration):
-            duration = duration[0]
-        else:
-            error_exit('''couldn't parse ffprobe's output. Try again with \
--v (--verbose) to see what went wrong.''')
+        self.settings['metadata'] = info['metadata']
+        return info
 
-        # Turn the string into a datetime format.
-        try:
-            audio_info = datetime.strptime(duration, '%H:%M:%S.%f')
-            delta = timedelta(
-                hours=audio_info.hour,
-                minutes=audio_info.minute,
-                seconds=audio_info.second,
-                microseconds=audio_info.microsecond
-            )
-        except ValueError:
-            error_exit('''encountered an error trying to determine the \
-duration of the audio file. It could be in an unrecognized format, or \
-longer than 24 hours. (Duration: %s, exception: %s)''' % (
-                duration, sys.exc_info()[0]
-            ))
+    def normalize_metadata(self, metadata):
+        '''
+        Returns a dict of the metadata tags that ffprobe found, with
+        each key normalized and each value turned into a string.
+        '''
+        return self.tunetags.normalize(metadata)
+
+    def get_probe_index(self):
+        '''
+        Returns the probe index, or None if it's turned off.
+        '''
+        if not self.settings['probe_index']:
+            return None
+        if self.probe_index is None or \
+           self.probe_index.path != os.path.expanduser(
+               self.settings['probe_index']):
+            self.probe_index = ProbeIndex(self.settings['probe_index'])
+        return self.probe_index
+
+    def prepare_video(self, audio, image):
+        '''
+        Checks our input files and returns the ffmpeg command that encodes
+        them into a video, minus the output arguments.
+        '''
+        # Check to see if our files exist at all.
+        if not (os.path.exists(audio) and os.path.exists(image)):
+            raise InputError('please specify a valid audio and image file')
+
+        info = self.probe_audio(audio)
+        self.settings['duration'] = info['duration']
+        duration = seconds_to_human(info['duration'])
 
         print('Using image file `%s\', size: %s.' % (
             image,
             os.path.getsize(image)
         ))
-        print('Using audio file `%s\', size: %s, duration: %s.' % (
+        print('Using audio file `%s\', size: %s, duration: %s, \
+codec: %s (%d Hz).' % (
             audio,
             os.path.getsize(audio),
-            duration
+            duration,
+            info['codec'],
+            info['sample_rate']
         ))
 
         if self.settings['metadata'] == []:
@@ -464,101 +672,596 @@ longer than 24 hours. (Duration: %s, exception: %s)''' % (
                 self.settings['metadata']
             ))
 
-        print('Encoding video file...')
+        # Now build the ffmpeg command that produces the video.
+        ffmpeg_cmd = [self.settings['path_ffmpeg']]
+        if self.settings['loop']:
+            ffmpeg_cmd.extend(self.loop_args(image, info['duration']))
+        else:
+            ffmpeg_cmd.extend(self.image_args(image))
+        # automatically overwrite on duplicate
+        ffmpeg_cmd.append('-y')
+        print('Using container %s.' % self.select_container(info))
+        ffmpeg_cmd.extend(self.audio_args(audio))
+        if self.settings['loop']:
+            ffmpeg_cmd.extend([
+                # take the video from the first input and the audio from
+                # the other
+                '-map', '0:v:0',
+                '-map', '1:a:0',
+                # only copy the looped segment, don't re-encode it
+                '-c:v', 'copy',
+                # cut the video off at the end of the track; a copied
+                # frame can't be cut, so also drop the frame that would
+                # start before the end and last a second past it
+                '-t', str(info['duration']),
+                '-shortest',
+            ])
+        else:
+            ffmpeg_cmd.extend(self.video_args(info['duration']))
+        return ffmpeg_cmd
 
-        # Now call ffmpeg and produce the video.
-        ffmpeg_cmd = [
-            self.settings['path_ffmpeg'],
+    def image_args(self, image):
+        '''
+        Returns the ffmpeg input arguments for our image.
+        '''
+        return [
             # loop the video (picture) for the movie's duration
             '-loop', '1',
             # a framerate of 1fps (anything lower won't be accepted by Youtube)
             '-framerate', '1:1',
             # one input file is the picture
             '-i', image,
-            # automatically overwrite on duplicate
-            '-y',
         ]
-        # Add the audio file.
-        if in_audio_ext == '.flac' or in_audio_ext == '.wav':
-            # mp4 doesn't take flac very well, so we'll convert it.
-            # also make sure we encode wav files, since mp4 files with PCM
-            # audio sometimes don't decode well and don't get accepted.
-            ffmpeg_cmd.extend([
-                # one input file is the audio
-                '-i', audio,
-                # for compatibility with various builds, we'll use MP3
-                '-c:a', 'libmp3lame',
-                # high quality CBR is good enough
-                '-b:a', '320k',
-            ])
+
+    def loop_args(self, image, duration):
+        '''
+        Returns the ffmpeg input arguments for a segment of our image that's
+        repeated for the movie's duration.
+        '''
+        return [
+            # repeat the segment until the audio ends
+            '-stream_loop', '-1',
+            '-i', self.encode_segment(image, duration),
+        ]
+
+    def encode_segment(self, image, duration):
+        '''
+        Encodes a short video of our image, which is looped to the full
+        length of the movie without being encoded again, so the encoding
+        time doesn't depend on the duration. The segment is a single GOP
+        that starts with a keyframe, so its copies can be joined as they
+        are. Segments are kept with the converted images, so an album's
+        cover is only encoded once.
+        '''
+        frames = str(self.settings['loop_segment'])
+        args = ['-an'] + self.video_args(duration) + [
+            # one keyframe at the start of each copy of the segment
+            '-g', frames,
+            '-keyint_min', frames,
+            '-sc_threshold', '0',
+            # without B-frames, packets are stored in presentation order,
+            # so the video can be cut off cleanly without re-encoding it
+            '-bf', '0',
+            '-frames:v', frames,
+        ]
+        # The duration doesn't matter, since the segment is always
+        # the same number of frames.
+        del args[args.index('-t'):args.index('-t') + 2]
+        cache = VideoCache(self.settings['artwork_dir'],
+                           self.settings['artwork_cache_size'] * 1024 * 1024)
+        key = cache.key([image], args)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        output = cache.tmp_path(key)
+        ffmpeg_cmd = [self.settings['path_ffmpeg']]
+        ffmpeg_cmd.extend(self.image_args(image))
+        ffmpeg_cmd.append('-y')
+        ffmpeg_cmd.extend(args)
+        ffmpeg_cmd.append(output)
+        print('Encoding a %s second segment of the image to loop...' % frames)
+        try:
+            with self.get_metrics().timer('segment', image=image):
+                probe_out = subprocess.check_output(
+                    ffmpeg_cmd,
+                    stderr=subprocess.STDOUT
+                )
+            if self.settings['verbose']:
+                print(probe_out)
+        except (OSError, subprocess.CalledProcessError):
+            raise EncodeError('''encountered an error trying to generate the \
+video. Try again with -v (--verbose) to see what went wrong. \
+(Exception: %s)''' % sys.exc_info()[0])
+        return cache.add(key, output)
+
+    def audio_args(self, audio):
+        '''
+        Returns the ffmpeg input and encoding arguments for our audio file,
+        as chosen by select_container().
+        '''
+        return [
+            # one input file is the audio
+            '-i', audio,
+        ] + audio_modes[self.settings['audio_mode']]
+
+    def select_container(self, info):
+        '''
+        Chooses the container of our video and how the audio gets into it,
+        based on the codec of the audio: copying it is much cheaper than
+        encoding it again. The extension of the output path is changed
+        to match the container.
+        '''
+        container, mode = choose_container(info['codec'],
+                                           self.settings['container'])
+        self.settings['current_container'] = container
+        self.settings['audio_mode'] = mode
+        if self.settings['path_output'] is not None:
+            self.settings['path_output'] = container_path(
+                self.settings['path_output'], container
+            )
+        return describe_audio(container, mode, info['codec'])
+
+    def video_args(self, duration):
+        '''
+        Returns the ffmpeg video encoding arguments for a video of
+        duration seconds.
+        '''
+        video_args = [
+            # use x264 as the video encoder
+            '-c:v', 'libx264',
+            # duration of the video
+            '-t', str(duration),
+        ]
+        # Add the rate control, preset and pixel format of our profile.
+        profile = self.select_profile(duration)
+        print('Using encoding profile `%s\'.' % profile)
+        video_args.extend(profiles[profile]['args'])
+        return video_args
+
+    def select_profile(self, duration):
+        '''
+        Returns the name of the encoding profile to use. In 'auto' mode,
+        this is the profile with the lowest estimated encoding plus upload
+        time, based on earlier measurements.
+        '''
+        self.settings['current_profile'] = self.settings['profile']
+        if self.settings['profile'] == 'auto':
+            upload_rate = self.settings['upload_rate']
+            if upload_rate is not None:
+                # Convert from Mbit/s to bytes per second.
+                upload_rate = upload_rate * 1000000 / 8
+            self.settings['current_profile'] = choose_profile(
+                self.get_profile_stats(), duration, upload_rate
+            )
+        return self.settings['current_profile']
+
+    def get_profile_stats(self):
+        return ProfileStats(self.settings['stats_file'])
+
+    def generate_video(self, audio, image):
+        '''
+        Encodes a video file from our audio and image input files.
+        '''
+        image = self.prepare_image(image)
+        ffmpeg_cmd = self.prepare_video(audio, image)
+        output = self.settings['path_output']
+
+        # If we've encoded these files with these arguments before,
+        # we can use the cached video instead.
+        cache = self.get_cache()
+        if cache is not None:
+            args = [{audio: '<audio>', image: '<image>'}.get(n, n)
+                    for n in ffmpeg_cmd[1:]]
+            key = cache.key([audio, image], args)
+            cached = cache.get(key)
+            if cached is not None:
+                print('Using cached video file `%s\'.' % cached)
+                self.use_cached_video(cached)
+                return
+            output = cache.tmp_path(key)
+
+        # The audio is usually copied as it is.
+        self.reserve_scratch(output, self.projected_size(
+            self.settings['duration']) + os.path.getsize(audio))
+        ffmpeg_cmd.append(output)
+
+        print('Encoding video file...')
+
+        start = time.time()
+        metrics = self.get_metrics()
+        try:
+            with metrics.timer('encode', audio=audio) as fields:
+                probe_out = subprocess.check_output(
+                    ffmpeg_cmd,
+                    stderr=subprocess.STDOUT
+                )
+                fields['bytes'] = os.path.getsize(output)
+                fields['speed'] = self.settings['duration'] / max(
+                    time.time() - start, 0.001
+                )
+            if self.settings['verbose']:
+                print(probe_out)
+        except (OSError, subprocess.CalledProcessError):
+            raise EncodeError('''encountered an error trying to generate the \
+video. Try again with -v (--verbose) to see what went wrong. \
+(Exception: %s)''' % sys.exc_info()[0])
+
+        metrics.add('encoded_bytes_total', fields['bytes'])
+        metrics.add('encoded_audio_seconds_total', self.settings['duration'])
+        metrics.set('encode_speed', fields['speed'])
+        # A looped video's encoding time says nothing about its profile.
+        if not self.settings['loop']:
+            self.get_profile_stats().record_encode(
+                self.settings['current_profile'],
+                self.settings['duration'],
+                time.time() - start,
+                fields['bytes']
+            )
+
+        if cache is not None:
+            self.use_cached_video(cache.add(key, output))
+
+        print('Successfully generated the file `%s\'.'
+              % self.settings['path_output'])
+
+    def prepare_image(self, image):
+        '''
+        Returns a normalized version of the image: scaled down to fit the
+        target size, padded to even dimensions and converted to RGB.
+        The result is cached, so an album's cover is only converted once.
+        '''
+        if not self.settings['image_prep'] or not os.path.exists(image):
+            return image
+        cache = ArtworkCache(self.settings['artwork_dir'],
+                             self.settings['artwork_cache_size'] * 1024 * 1024)
+        key = cache.key([image], [artwork_filter(self.settings['image_size'])])
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        output = cache.tmp_path(key)
+        try:
+            with self.get_metrics().timer('image', image=image):
+                probe_out = normalize_image(self.settings['path_ffmpeg'],
+                                            image, output,
+                                            self.settings['image_size'])
+            if self.settings['verbose']:
+                print(probe_out)
+        except (OSError, subprocess.CalledProcessError):
+            raise EncodeError('''encountered an error trying to convert the \
+image file. Try again with -v (--verbose) to see what went wrong. \
+(Exception: %s)''' % sys.exc_info()[0])
+        print('Converted image file `%s\' (size: %s).' % (
+            image, self.settings['image_size']
+        ))
+        return cache.add(key, output)
+
+    def get_cache(self):
+        '''
+        Returns the video cache, or None if caching is turned off.
+        '''
+        if not self.settings['cache']:
+            return None
+        container = self.settings.get('current_container', 'mp4')
+        return VideoCache(self.settings['cache_dir'],
+                          self.settings['cache_size'] * 1024 * 1024,
+                          containers[container]['ext'])
+
+    def use_cached_video(self, path):
+        '''
+        Makes a cached video our output. If we're only generating the video,
+        it's copied to the output path; otherwise it's uploaded directly
+        from the cache.
+        '''
+        if self.settings['generate_only']:
+            shutil.copyfile(path, self.settings['path_output'])
         else:
+            self.settings['path_output'] = path
+
+    def generate_still(self, image, duration, output):
+        '''
+        Encodes a video of our image without any audio, which can be remuxed
+        with the audio of each track that uses the same image.
+        '''
+        if not os.path.exists(image):
+            raise InputError('please specify a valid image file')
+        image = self.prepare_image(image)
+        ffmpeg_cmd = [self.settings['path_ffmpeg']]
+        if self.settings['loop']:
+            ffmpeg_cmd.extend(self.loop_args(image, duration))
+            ffmpeg_cmd.extend(['-y', '-an', '-c:v', 'copy',
+                               '-t', str(duration), output])
+        else:
+            ffmpeg_cmd.extend(self.image_args(image))
+            ffmpeg_cmd.extend(['-y', '-an'])
+            ffmpeg_cmd.extend(self.video_args(duration))
             ffmpeg_cmd.extend([
-                # one input file is the audio
-                '-i', audio,
-                # only copy the audio, don't re-encode it
-                '-c:a', 'copy',
+                # without B-frames, packets are stored in presentation
+                # order, so the video can be cut off cleanly without
+                # re-encoding it
+                '-bf', '0',
+                output
             ])
-        # Add the video encoding options.
+
+        print('Encoding still image video for `%s\' (duration: %s)...' % (
+            image, seconds_to_human(duration)
+        ))
+        self.reserve_scratch(output, self.projected_size(duration))
+
+        try:
+            with self.get_metrics().timer('encode_still', image=image):
+                probe_out = subprocess.check_output(
+                    ffmpeg_cmd,
+                    stderr=subprocess.STDOUT
+                )
+            if self.settings['verbose']:
+                print(probe_out)
+        except (OSError, subprocess.CalledProcessError):
+            raise EncodeError('''encountered an error trying to generate the \
+video. Try again with -v (--verbose) to see what went wrong. \
+(Exception: %s)''' % sys.exc_info()[0])
+
+    def remux_video(self, audio, still):
+        '''
+        Produces a video file by combining our audio file with a still image
+        video made by generate_still(). The video stream is copied rather
+        than encoded again, and trimmed to the length of the audio.
+        '''
+        if not os.path.exists(audio):
+            raise InputError('please specify a valid audio file')
+        info = self.probe_audio(audio)
+        self.settings['duration'] = info['duration']
+        print('Using audio file `%s\', duration: %s.' % (
+            audio, seconds_to_human(info['duration'])
+        ))
+
+        ffmpeg_cmd = [
+            self.settings['path_ffmpeg'],
+            # one input file is the still image video
+            '-i', still,
+            '-y',
+        ]
+        print('Using container %s.' % self.select_container(info))
+        ffmpeg_cmd.extend(self.audio_args(audio))
         ffmpeg_cmd.extend([
-            # use x264 as the video encoder
-            '-c:v', 'libx264',
-            # duration of the video
-            '-t', str(delta.total_seconds()),
-            # 4:4:4 chroma subsampling (best quality)
-            '-pix_fmt', 'yuv444p',
-            # as fast as possible, at cost of filesize
-            # (uploading likely costs less time)
-            '-preset', 'ultrafast',
-            # lossless quality
-            '-qp', '0',
-            # output
+            # take the video from the first input and the audio from the other
+            '-map', '0:v:0',
+            '-map', '1:a:0',
+            # only copy the video, don't re-encode it
+            '-c:v', 'copy',
+            # cut the video off at the end of the track, without the
+            # last frame running on past it (see prepare_video())
+            '-t', str(info['duration']),
+            '-shortest',
             self.settings['path_output']
         ])
 
+        self.reserve_scratch(self.settings['path_output'],
+                             os.path.getsize(still) + os.path.getsize(audio))
+        metrics = self.get_metrics()
         try:
-            probe_out = subprocess.check_output(
-                ffmpeg_cmd,
-                stderr=subprocess.STDOUT
-            )
+            with metrics.timer('remux', audio=audio):
+                probe_out = subprocess.check_output(
+                    ffmpeg_cmd,
+                    stderr=subprocess.STDOUT
+                )
             if self.settings['verbose']:
                 print(probe_out)
-        except:
-            error_exit('''encountered an error trying to generate the video. \
-Try again with -v (--verbose) to see what went wrong. \
+        except (OSError, subprocess.CalledProcessError):
+            raise EncodeError('''encountered an error trying to generate the \
+video. Try again with -v (--verbose) to see what went wrong. \
 (Exception: %s)''' % sys.exc_info()[0])
 
+        metrics.add('encoded_bytes_total',
+                    os.path.getsize(self.settings['path_output']))
+        metrics.add('encoded_audio_seconds_total', info['duration'])
         print('Successfully generated the file `%s\'.'
               % self.settings['path_output'])
 
-    def upload_tune(self, audio, image, args, video_ready=False):
+    def stream_video(self, audio, image):
+        '''
+        Starts encoding a video from our audio and image input files as
+        a fragmented MP4 written to a pipe. Returns the ffmpeg process.
+        '''
+        image = self.prepare_image(image)
+        ffmpeg_cmd = self.prepare_video(audio, image)
+        container = containers[self.settings['current_container']]
+        if container['format'] == 'mp4':
+            ffmpeg_cmd.extend([
+                # fragmented MP4 doesn't need a seekable output, so the moov
+                # atom can be written up front instead of at the very end
+                '-movflags', 'frag_keyframe+empty_moov',
+            ])
+        ffmpeg_cmd.extend([
+            '-f', container['format'],
+            # output
+            'pipe:1'
+        ])
+
+        print('Encoding video stream...')
+
+        stderr = None if self.settings['verbose'] else open(os.devnull, 'w')
+        try:
+            return subprocess.Popen(
+                ffmpeg_cmd,
+                stdout=subprocess.PIPE,
+                stderr=stderr
+            )
+        except OSError:
+            raise EncodeError('''encountered an error trying to generate the \
+video (ffmpeg might not be available)''')
+
+    def upload_tune(self, audio, image, args=None, video_ready=False):
         '''
-        Uploads a video to Youtube.
+        Encodes a video and uploads it to Youtube. Returns the ID of the
+        uploaded video, or the path of the video file if we're only
+        generating it. Raises a Tune2TubeError if anything goes wrong.
         '''
-        if not video_ready:
+        for seconds in self.upload_tune_steps(audio, image, args,
+                                              video_ready):
+            time.sleep(seconds)
+        if self.settings['generate_only']:
+            return self.settings['path_output']
+        return self.settings['video_id']
+
+    def upload_tune_steps(self, audio, image, args=None, video_ready=False):
+        '''
+        Does the work of upload_tune() as a generator, which yields the
+        number of seconds to wait whenever an upload has to back off or
+        wait for quota. This lets the caller do something else meanwhile,
+        e.g. work on other uploads; see the Pipeline class.
+        Without an output path, the video is encoded in a directory of its
+        own in the scratch space, which is removed once it's been uploaded.
+        If the upload fails, the video is kept and added to the upload
+        queue, so that it can be uploaded later with --queue.
+        '''
+        scratch = None
+        if self.settings['path_output'] is None and not video_ready:
+            scratch = os.path.join(self.get_scratch().job_dir(), 'video.mp4')
+            self.settings['path_output'] = scratch
+        self.settings['encoded_video'] = None
+        done = False
+        try:
+            for seconds in self.encode_and_upload_steps(audio, image, args,
+                                                        video_ready):
+                yield seconds
+            done = True
+        finally:
+            # The encoded video's extension depends on its container, and
+            # it may have been taken from the cache instead.
+            video = self.settings['encoded_video']
+            if scratch is None:
+                pass
+            elif done and not self.settings['generate_only']:
+                self.get_scratch().release(scratch)
+            elif done:
+                self.get_scratch().unreserve(scratch)
+            elif video is not None:
+                if self.get_scratch().job_of(video) is None:
+                    self.get_scratch().release(scratch)
+                else:
+                    self.get_scratch().unreserve(scratch)
+                self.queue_video(audio, image, video)
+            else:
+                # The encode failed, or the upload was streamed: there's
+                # no video to keep.
+                self.get_scratch().release(scratch)
+
+    def queue_video(self, audio, image, video):
+        '''
+        Adds an encoded video to the upload queue after its upload failed.
+        '''
+        UploadQueue(self.settings['queue_dir']).add({
+            'audio': audio,
+            'image': image,
+            'settings': {'path_output': video},
+            'metadata': self.settings['metadata']
+        })
+        print('The video `%s\' was added to the upload queue; use --queue '
+              'to upload it later.' % video)
+
+    def encode_and_upload_steps(self, audio, image, args=None,
+                                video_ready=False):
+        '''
+        Encodes a video to our output path, unless it's ready already, and
+        uploads it. See upload_tune_steps().
+        '''
+        self.settings['source_file'] = audio
+
+        # In streaming mode, the video is uploaded while it's being encoded.
+        stream = self.settings['stream'] and not video_ready \
+            and not self.settings['generate_only']
+        if stream:
+            process = self.stream_video(audio, image)
+        elif not video_ready:
             self.generate_video(audio, image)
+            self.settings['encoded_video'] = self.settings['path_output']
 
         if self.settings['generate_only']:
             print('Skipping Youtube upload.')
-            exit()
+            self.get_metrics().flush()
+            return
 
         # Now upload the file to Youtube.
+        import httplib2
+        from apiclient.errors import HttpError
+        from oauth2client.client import AccessTokenRefreshError
         print('Authenticating using the Youtube API...')
         try:
             youtube = self.get_authenticated_service(args)
         except httplib2.ServerNotFoundError, e:
-            error_exit('%s.' % e)
+            raise AuthError('%s.' % e)
+
+        media = None
+        if stream:
+            from stream import PipeMediaUpload
+            media = PipeMediaUpload(process, self.chunk_bytes(),
+                                    mimetype=video_mimetype(
+                                        self.settings['path_output']),
+                                    limiter=self.get_limiter())
 
         try:
-            self.initialize_upload(youtube, args, self.settings['path_output'])
+            self.settings['video_id'] = None
+            while True:
+                try:
+                    with self.get_metrics().timer('upload', audio=audio):
+                        for seconds in self.initialize_upload_steps(
+                            youtube, args, self.settings['path_output'], media
+                        ):
+                            yield seconds
+                    break
+                except HttpError, e:
+                    if not is_quota_error(e) or self.get_quota() is None:
+                        raise
+                    # We ran out of quota sooner than we expected, e.g.
+                    # because other clients share it. Try again once it
+                    # has been reset.
+                    print('The API reports that the quota has run out.')
+                    self.get_quota().exhaust()
         except HttpError, e:
-            print('An HTTP error %d occurred:\n%s' % (
+            raise UploadError('An HTTP error %d occurred:\n%s' % (
                 e.resp.status,
                 e.content
             ))
         except AccessTokenRefreshError, e:
-            print('''The stored access token seems to be invalid. Delete any \
--oauth2.json files that may exist and try again, or try again with the \
---no_stored_auth switch.''')
+            raise AuthError('''The stored access token seems to be invalid. \
+Delete any -oauth2.json files that may exist and try again, or try again \
+with the --no_stored_auth switch.''')
+        finally:
+            # Don't leave ffmpeg running if the upload didn't finish.
+            if stream and process.poll() is None:
+                process.kill()
+                process.wait()
+            self.get_metrics().flush()
 
     def change_settings(self, overrides):
-        self.settings = dict(self.settings.items() + overrides.items())
+        self.settings = self.settings.derive(overrides)
+
+    def for_job(self, overrides=None):
+        '''
+        Returns a copy of this engine for a single job, with its own config
+        derived from ours. The copy shares our authenticated service,
+        bandwidth limiter and probe index, so it's cheap to make.
+        '''
+        job = copy.copy(self)
+        job.settings = self.settings.derive(overrides)
+        return job
+
+    def process(self, audio, image, flags=None, **overrides):
+        '''
+        Encodes and uploads a single tune, with any settings overridden
+        for this tune only. Returns the ID of the uploaded video, or the
+        path of the video file if generate_only is set. Raises
+        a Tune2TubeError if anything goes wrong; the engine can still be
+        used for the next tune afterwards.
+        '''
+        job = self.for_job(overrides)
+        # Set up the shared state on the engine rather than on the job,
+        # so that it's kept for the next job.
+        if not job.settings['generate_only']:
+            self.get_authenticated_service(flags)
+            job.service = self.service
+            job.limiter = self.get_limiter()
+        job.probe_index = self.get_probe_index()
+        return job.upload_tune(audio, image, flags)
@@ -16,172 +16,300 @@
 # or implied. See the License for the specific language governing
 # permissions and limitations under the License.
 
+from collections import Mapping
+
+# A list of MP3/OGG/ASF/MP4/APE tags that we might encounter.
+tags_common = [
+    'album', 'title', 'artist', 'album-artist', 'release-date',
+    'release-date', 'original-release-date', 'composer', 'lyricist',
+    'writer', 'conductor', 'performer', 'remixer', 'arranger',
+    'engineer', 'producer', 'mix-dj', 'mixer', 'grouping', 'subtitle',
+    'disc-subtitle', 'track-number', 'total-tracks', 'disc-number',
+    'total-discs', 'compilation-itunes', 'comment', 'comments',
+    'genre', 'bpm', 'mood', 'isrc', 'copyright', 'lyrics', 'media',
+    'record-label', 'catalog-number', 'barcode', 'encoded-by',
+    'encoder-settings', 'album-sort-order', 'album-artist-sort-order',
+    'artist-sort-order', 'title-sort-order', 'composer-sort-order',
+    'show-name-sort-order', 'asin', 'gapless-playback', 'podcast',
+    'podcast-url', 'show-name', 'script', 'language', 'license',
+    'original-year', 'acoustid', 'acoustid-fingerprint', 'website',
+    'work-title', 'website', 'original-artist', 'date', 'tracknumber'
+]
+
+# The names of each tag in various file formats. Each list has the same
+# order as tags_common; an empty string means a format doesn't have a tag.
+tags_db = {
+    'ID3v23': [
+        'TALB', 'TIT2', 'TPE1', 'TPE2', 'TYER', 'TDAT', 'TORY', 'TCOM',
+        'TEXT', 'TXXX:Writer', 'TPE3', 'IPLS:instrument', 'TPE4',
+        'IPLS:arranger', 'IPLS:engineer', 'IPLS:producer',
+        'IPLS:DJ-mix', 'IPLS:mix', 'TIT1', 'TIT3', '', 'TRCK', 'TRCK',
+        'TPOS', 'TPOS', 'TCMP', 'COMM:description', '', 'TCON', 'TBPM',
+        '', 'TSRC', 'TCOP', 'USLT:description', 'TMED', 'TPUB',
+        'TXXX:CATALOGNUMBER', 'TXXX:BARCODE', 'TENC', 'TSSE', 'TSOA',
+        'TSO2', 'TSOP', 'TSOT', 'TSOC', '', 'TXXX:ASIN', '', '', '',
+        '', 'TXXX:SCRIPT', 'TLAN', 'WCOPTXXX:LICENSE',
+        'TXXX:originalyear', 'TXXX:Acoustid Id',
+        'TXXX:Acoustid Fingerprint', 'WOAR', 'TOAL', 'WXXX:website',
+        'TOPE', '', ''
+    ],
+    'ID3v24': [
+        'TALB', 'TIT2', 'TPE1', 'TPE2', 'TDRC', 'TDRC', 'TDOR', 'TCOM',
+        'TEXT', 'TXXX:Writer', 'TPE3', 'TMCL:instrument', 'TPE4',
+        'TIPL:arranger', 'TIPL:engineer', 'TIPL:producer',
+        'TIPL:DJ-mix', 'TIPL:mix', 'TIT1', 'TIT3', 'TSST', 'TRCK',
+        'TRCK', 'TPOS', 'TPOS', 'TCMP', 'COMM:description', '', 'TCON',
+        'TBPM', 'TMOO', 'TSRC', 'TCOP', 'USLT:description', 'TMED',
+        'TPUB', 'TXXX:CATALOGNUMBER', 'TXXX:BARCODE', 'TENC', 'TSSE',
+        'TSOA', 'TXXX:ALBUMARTISTSORT', 'TSOP', 'TSOT',
+        'TXXX:COMPOSERSORT', '', 'TXXX:ASIN', '', '', '', '',
+        'TXXX:SCRIPT', 'TLAN', 'WCOPTXXX:LICENSE', 'TXXX:originalyear',
+        'TXXX:Acoustid Id', 'TXXX:Acoustid Fingerprint', 'WOAR',
+        'TOAL', 'WXXX:website', 'TOPE', '', ''
+    ],
+    'ASF/Windows Media': [
+        'WM/AlbumTitle', 'Title', 'Author', 'WM/AlbumArtist',
+        'WM/Year', 'WM/Year', 'WM/OriginalReleaseYear', 'WM/Composer',
+        'WM/Writer', '', 'WM/Conductor', '', 'WM/ModifiedBy', '',
+        'WM/Engineer', 'WM/Producer', 'WM/DJMixer', 'WM/Mixer',
+        'WM/ContentGroupDescription', 'WM/SubTitle', 'WM/SetSubTitle',
+        'WM/TrackNumber', '', 'WM/PartOfSet', '', 'WM/IsCompilation',
+        'Description', '', 'WM/Genre', 'WM/BeatsPerMinute', 'WM/Mood',
+        'WM/ISRC', 'Copyright', 'WM/Lyrics', 'WM/Media',
+        'WM/Publisher', 'WM/CatalogNo', 'WM/Barcode', 'WM/EncodedBy',
+        'WM/EncoderSettings', 'WM/AlbumSortOrder',
+        'WM/AlbumArtistSortOrder', 'WM/ArtistSortOrder',
+        'WM/TitleSortOrder', 'WM/ComposerSortOrder', '', '', '', '',
+        '', '', 'WM/Script', 'WM/Language', 'LICENSE', '',
+        'Acoustid/Id', 'Acoustid/Fingerprint', '', '', '', '', '', ''
+    ],
+    'iTunes MP4': [
+        '©alb', '©nam', '©ART', 'aART', '©day', '©day', '', '©wrt',
+        '----:com.apple.iTunes:LYRICIST', '',
+        '----:com.apple.iTunes:CONDUCTOR', '',
+        '----:com.apple.iTunes:REMIXER', '',
+        '----:com.apple.iTunes:ENGINEER',
+        '----:com.apple.iTunes:PRODUCER',
+        '----:com.apple.iTunes:DJMIXER', '----:com.apple.iTunes:MIXER',
+        '©grp', '----:com.apple.iTunes:SUBTITLE',
+        '----:com.apple.iTunes:DISCSUBTITLE', 'trkn', 'trkn', 'disk',
+        'disk', 'cpil', '©cmt', '', '©gen', 'tmpo',
+        '----:com.apple.iTunes:MOOD', '----:com.apple.iTunes:ISRC',
+        'cprt', '©lyr', '----:com.apple.iTunes:MEDIA',
+        '----:com.apple.iTunes:LABEL',
+        '----:com.apple.iTunes:CATALOGNUMBER',
+        '----:com.apple.iTunes:BARCODE', '©too', '', 'soal', 'soaa',
+        'soar', 'sonm', 'soco', 'sosn', '----:com.apple.iTunes:ASIN',
+        'pgap', 'pcst', 'purl', 'tvsh', '----:com.apple.iTunes:SCRIPT',
+        '----:com.apple.iTunes:LANGUAGE',
+        '----:com.apple.iTunes:LICENSE', '',
+        '----:com.apple.iTunes:Acoustid Id',
+        '----:com.apple.iTunes:Acoustid Fingerprint', '', '', '', '',
+        '', ''
+    ],
+    'Vorbis': [
+        'ALBUM', 'TITLE', 'ARTIST', 'ALBUMARTIST', 'DATE', 'DATE',
+        'ORIGINALDATE', 'COMPOSER', 'LYRICIST', 'WRITER', 'CONDUCTOR',
+        'PERFORMER', 'REMIXER', 'ARRANGER', 'ENGINEER', 'PRODUCER',
+        'DJMIXER', 'MIXER', 'GROUPING', 'SUBTITLE', 'DISCSUBTITLE',
+        'TRACKNUMBER', 'TRACKTOTAL and    TOTALTRACKS', 'DISCNUMBER',
+        'DISCTOTAL and TOTALDISCS', 'COMPILATION', 'COMMENT',
+        'COMMENTS', 'GENRE', 'BPM', 'MOOD', 'ISRC', 'COPYRIGHT',
+        'LYRICS', 'MEDIA', 'LABEL', 'CATALOGNUMBER', 'BARCODE',
+        'ENCODEDBY', 'ENCODERSETTINGS', 'ALBUMSORT', 'ALBUMARTISTSORT',
+        'ARTISTSORT', 'TITLESORT', 'COMPOSERSORT', '', 'ASIN', '', '',
+        '', '', 'SCRIPT', 'LANGUAGE', 'LICENSE', 'ORIGINALYEAR',
+        'ACOUSTID_ID', 'ACOUSTID_FINGERPRINT', 'WEBSITE', 'WORK', '',
+        '', '', ''
+    ],
+    'APEv2': [
+        'Album', 'Title', 'Artist', 'Album Artist', 'Year', 'Year', '',
+        'Composer', 'Lyricist', 'Writer', 'Conductor',
+        'Performerinstrument', 'MixArtist', 'Arranger', 'Engineer',
+        'Producer', 'DJMixer', 'Mixer', 'Grouping', 'Subtitle',
+        'DiscSubtitle', 'Track', 'Track', 'Disc', 'Disc',
+        'Compilation', 'Comment', 'Comments', 'Genre', 'BPM', 'Mood',
+        'ISRC', 'Copyright', 'Lyrics', 'Media', 'Label',
+        'CatalogNumber', 'Barcode', 'EncodedBy', 'EncoderSettings',
+        'ALBUMSORT', 'ALBUMARTISTSORT', 'ARTISTSORT', 'TITLESORT',
+        'COMPOSERSORT', '', 'ASIN', '', '', '', '', 'Script',
+        'Language', 'LICENSE', 'ORIGINALYEAR', 'ACOUSTID_ID',
+        'ACOUSTID_FINGERPRINT', 'Weblink', 'WORK', '', '', '', ''
+    ],
+}
+
+# Human-readable versions of the tags. These are shown when adding
+# a list of tags to the video's description.
+tags_readable = [
+    'Album', 'Title', 'Artist', 'Album Artist', 'Release Date',
+    'Release Date', 'Original Release Date', 'Composer', 'Lyricist',
+    'Writer', 'Conductor', 'Performer', 'Remixer', 'Arranger',
+    'Engineer', 'Producer', 'Mix-DJ', 'Mixer', 'Grouping', 'Subtitle',
+    'Disc Subtitle', 'Track Number', 'Total Tracks', 'Disc Number',
+    'Total Discs', 'Compilation (iTunes)', 'Comment', 'Comment',
+    'Genre', 'BPM', 'Mood', 'ISRC', 'Copyright', 'Lyrics', 'Media',
+    'Record Label', 'Catalog Number', 'Barcode', 'Encoded By',
+    'Encoder Settings', 'Album Sort Order', 'Album Artist Sort Order',
+    'Artist Sort Order', 'Title Sort Order', 'Composer Sort Order',
+    'Show Name Sort Order', 'ASIN', 'Gapless Playback', 'Podcast',
+    'Podcast URL', 'Show Name', 'Script', 'Language', 'License',
+    'Original Year', 'AcoustID', 'AcoustID Fingerprint', 'Website',
+    'Work Title', 'Website', 'Original Artist', 'Date', 'Track Number'
+]
+
+# Formats whose tag names aren't case-sensitive. ffprobe reports some
+# formats' tags in upper case (e.g. DATE in a FLAC file).
+tags_nocase = ('Vorbis', 'APEv2', 'FFmpeg')
+
+# The generic names that ffprobe gives the tags it knows, whatever the
+# format, and the tags they stand for. Tags it doesn't know keep their
+# own name (e.g. TSRC or ISRC), and are looked up in all formats.
+ffmpeg_tags = {
+    'album': 'album',
+    'album_artist': 'album-artist',
+    'album-sort': 'album-sort-order',
+    'artist': 'artist',
+    'artist-sort': 'artist-sort-order',
+    'comment': 'comment',
+    'compilation': 'compilation-itunes',
+    'composer': 'composer',
+    'copyright': 'copyright',
+    'date': 'release-date',
+    'disc': 'disc-number',
+    'encoded_by': 'encoded-by',
+    'encoder': 'encoder-settings',
+    'genre': 'genre',
+    'grouping': 'grouping',
+    'language': 'language',
+    'lyrics': 'lyrics',
+    'performer': 'performer',
+    'publisher': 'record-label',
+    'title': 'title',
+    'title-sort': 'title-sort-order',
+    'track': 'track-number',
+}
+
+# Tags that ffprobe reports about the container rather than the tune.
+ffmpeg_ignored = ('major_brand', 'minor_version', 'compatible_brands',
+                  'handler_name', 'vendor_id', 'creation_time')
+
+
+def tag_names(fmt, item):
+    '''
+    Returns the keys under which a tag from one of the tables is indexed.
+    '''
+    # Some Vorbis tags have more than one name.
+    names = [n.strip() for n in item.split(' and ')]
+    if fmt in tags_nocase:
+        names = [n.lower() for n in names]
+    return names
+
+
+class FrozenIndex(Mapping):
+    '''
+    Read-only view of a compiled tag index.
+    '''
+
+    def __init__(self, index):
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._index[key]
+
+    def get(self, key, default=None):
+        return self._index.get(key, default)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+def compile_index():
+    '''
+    Compiles the tag tables into an index of (format, tag) pairs, each
+    pointing to the position of the tag in tags_common. Within a format,
+    the first tag of a given name wins, so e.g. ID3's TRCK means the track
+    number and not the total number of tracks. ffprobe's generic names
+    are indexed as the FFmpeg format.
+    '''
+    index = {}
+    formats = sorted(tags_db.keys()) + ['common']
+    for fmt in formats:
+        table = tags_common if fmt == 'common' else tags_db[fmt]
+        for n, item in enumerate(table):
+            if not item:
+                continue
+            for name in tag_names(fmt, item):
+                index.setdefault((fmt, name), n)
+    # Tags of an unknown format are looked up in all formats; the common
+    # names go first, followed by the other formats in a fixed order.
+    fallback = {}
+    for fmt in ['common'] + formats[:-1]:
+        for (key_fmt, name), n in index.items():
+            if key_fmt == fmt:
+                fallback.setdefault(name, n)
+    for name, n in fallback.items():
+        index[(None, name)] = n
+    for name, tag in ffmpeg_tags.items():
+        index[('FFmpeg', name)] = tags_common.index(tag)
+    return FrozenIndex(index)
+
+
+# The compiled index, shared by all TuneTags instances.
+tag_index = compile_index()
+
 
 class TuneTags(object):
     '''
-    Used to look up and normalize tags in audio files.
-    Contains a dict with tag key names for various file formats.
-    The keys are linked to a list of human-readable labels.
+    Used to look up and normalize tags in audio files. Tags are looked up
+    in an index that's compiled once, when this module is imported.
     '''
 
     def __init__(self):
-        # A list of MP3/OGG/ASF/MP4/APE tags that we might encounter.
-        self.tags_common = [
-            'album', 'title', 'artist', 'album-artist', 'release-date',
-            'release-date', 'original-release-date', 'composer', 'lyricist',
-            'writer', 'conductor', 'performer', 'remixer', 'arranger',
-            'engineer', 'producer', 'mix-dj', 'mixer', 'grouping', 'subtitle',
-            'disc-subtitle', 'track-number', 'total-tracks', 'disc-number',
-            'total-discs', 'compilation-itunes', 'comment', 'comments',
-            'genre', 'bpm', 'mood', 'isrc', 'copyright', 'lyrics', 'media',
-            'record-label', 'catalog-number', 'barcode', 'encoded-by',
-            'encoder-settings', 'album-sort-order', 'album-artist-sort-order',
-            'artist-sort-order', 'title-sort-order', 'composer-sort-order',
-            'show-name-sort-order', 'asin', 'gapless-playback', 'podcast',
-            'podcast-url', 'show-name', 'script', 'language', 'license',
-            'original-year', 'acoustid', 'acoustid-fingerprint', 'website',
-            'work-title', 'website', 'original-artist', 'date', 'tracknumber'
-        ]
-        self.tags_db = {
-            'ID3v23': [
-                'TALB', 'TIT2', 'TPE1', 'TPE2', 'TYER', 'TDAT', 'TORY', 'TCOM',
-                'TEXT', 'TXXX:Writer', 'TPE3', 'IPLS:instrument', 'TPE4',
-                'IPLS:arranger', 'IPLS:engineer', 'IPLS:producer',
-                'IPLS:DJ-mix', 'IPLS:mix', 'TIT1', 'TIT3', '', 'TRCK', 'TRCK',
-                'TPOS', 'TPOS', 'TCMP', 'COMM:description', 'TCON', 'TBPM', '',
-                'TSRC', 'TCOP', 'USLT:description', 'TMED', 'TPUB',
-                'TXXX:CATALOGNUMBER', 'TXXX:BARCODE', 'TENC', 'TSSE', 'TSOA',
-                'TSO2', 'TSOP', 'TSOT', 'TSOC', '', 'TXXX:ASIN', '', '', '',
-                '', 'TXXX:SCRIPT', 'TLAN', 'WCOPTXXX:LICENSE',
-                'TXXX:originalyear', 'TXXX:Acoustid Id',
-                'TXXX:Acoustid Fingerprint', 'WOAR', 'TOAL', 'WXXX:website',
-                'TOPE', '', ''
-            ],
-            'ID3v24': [
-                'TALB', 'TIT2', 'TPE1', 'TPE2', 'TDRC', 'TDRC', 'TDOR', 'TCOM',
-                'TEXT', 'TXXX:Writer', 'TPE3', 'TMCL:instrument', 'TPE4',
-                'TIPL:arranger', 'TIPL:engineer', 'TIPL:producer',
-                'TIPL:DJ-mix', 'TIPL:mix', 'TIT1', 'TIT3', 'TSST', 'TRCK',
-                'TRCK', 'TPOS', 'TPOS', 'TCMP', 'COMM:description', 'TCON',
-                'TBPM', 'TMOO', 'TSRC', 'TCOP', 'USLT:description', 'TMED',
-                'TPUB', 'TXXX:CATALOGNUMBER', 'TXXX:BARCODE', 'TENC', 'TSSE',
-                'TSOA', 'TXXX:ALBUMARTISTSORT', 'TSOP', 'TSOT',
-                'TXXX:COMPOSERSORT', '', 'TXXX:ASIN', '', '', '', '',
-                'TXXX:SCRIPT', 'TLAN', 'WCOPTXXX:LICENSE', 'TXXX:originalyear',
-                'TXXX:Acoustid Id', 'TXXX:Acoustid Fingerprint', 'WOAR',
-                'TOAL', 'WXXX:website', 'TOPE', '', ''
-            ],
-            'ASF/Windows Media': [
-                'WM/AlbumTitle', 'Title', 'Author', 'WM/AlbumArtist',
-                'WM/Year', 'WM/Year', 'WM/OriginalReleaseYear', 'WM/Composer',
-                'WM/Writer', '', 'WM/Conductor', '', 'WM/ModifiedBy', '',
-                'WM/Engineer', 'WM/Producer', 'WM/DJMixer', 'WM/Mixer',
-                'WM/ContentGroupDescription', 'WM/SubTitle', 'WM/SetSubTitle',
-                'WM/TrackNumber', '', 'WM/PartOfSet', '', 'WM/IsCompilation',
-                'Description', 'WM/Genre', 'WM/BeatsPerMinute', 'WM/Mood',
-                'WM/ISRC', 'Copyright', 'WM/Lyrics', 'WM/Media',
-                'WM/Publisher', 'WM/CatalogNo', 'WM/Barcode', 'WM/EncodedBy',
-                'WM/EncoderSettings', 'WM/AlbumSortOrder',
-                'WM/AlbumArtistSortOrder', 'WM/ArtistSortOrder',
-                'WM/TitleSortOrder', 'WM/ComposerSortOrder', '', '', '', '',
-                '', '', 'WM/Script', 'WM/Language', 'LICENSE', '',
-                'Acoustid/Id', 'Acoustid/Fingerprint', '', '', '', '', '', ''
-            ],
-            'iTunes MP4': [
-                '©alb', '©nam', '©ART', 'aART', '©day', '©day', '', '©wrt',
-                '----:com.apple.iTunes:LYRICIST', '',
-                '----:com.apple.iTunes:CONDUCTOR', '',
-                '----:com.apple.iTunes:REMIXER', '',
-                '----:com.apple.iTunes:ENGINEER',
-                '----:com.apple.iTunes:PRODUCER',
-                '----:com.apple.iTunes:DJMIXER', '----:com.apple.iTunes:MIXER',
-                '©grp', '----:com.apple.iTunes:SUBTITLE',
-                '----:com.apple.iTunes:DISCSUBTITLE', 'trkn', 'trkn', 'disk',
-                'disk', 'cpil', '©cmt', '©gen', 'tmpo',
-                '----:com.apple.iTunes:MOOD', '----:com.apple.iTunes:ISRC',
-                'cprt', '©lyr', '----:com.apple.iTunes:MEDIA',
-                '----:com.apple.iTunes:LABEL',
-                '----:com.apple.iTunes:CATALOGNUMBER',
-                '----:com.apple.iTunes:BARCODE', '©too', '', 'soal', 'soaa',
-                'soar', 'sonm', 'soco', 'sosn', '----:com.apple.iTunes:ASIN',
-                'pgap', 'pcst', 'purl', 'tvsh', '----:com.apple.iTunes:SCRIPT',
-                '----:com.apple.iTunes:LANGUAGE',
-                '----:com.apple.iTunes:LICENSE', '',
-                '----:com.apple.iTunes:Acoustid Id',
-                '----:com.apple.iTunes:Acoustid Fingerprint', '', '', '', '',
-                '', ''
-            ],
-            'Vorbis': [
-                'ALBUM', 'TITLE', 'ARTIST', 'ALBUMARTIST', 'DATE', 'DATE',
-                'ORIGINALDATE', 'COMPOSER', 'LYRICIST', 'WRITER', 'CONDUCTOR',
-                'PERFORMER', 'REMIXER', 'ARRANGER', 'ENGINEER', 'PRODUCER',
-                'DJMIXER', 'MIXER', 'GROUPING', 'SUBTITLE', 'DISCSUBTITLE',
-                'TRACKNUMBER', 'TRACKTOTAL and    TOTALTRACKS', 'DISCNUMBER',
-                'DISCTOTAL and TOTALDISCS', 'COMPILATION', 'COMMENT',
-                'COMMENTS', 'GENRE', 'BPM', 'MOOD', 'ISRC', 'COPYRIGHT',
-                'LYRICS', 'MEDIA', 'LABEL', 'CATALOGNUMBER', 'BARCODE',
-                'ENCODEDBY', 'ENCODERSETTINGS', 'ALBUMSORT', 'ALBUMARTISTSORT',
-                'ARTISTSORT', 'TITLESORT', 'COMPOSERSORT', '', 'ASIN', '', '',
-                '', '', 'SCRIPT', 'LANGUAGE', 'LICENSE', 'ORIGINALYEAR',
-                'ACOUSTID_ID', 'ACOUSTID_FINGERPRINT', 'WEBSITE', 'WORK', '',
-                '', '', ''
-            ],
-            'APEv2': [
-                'Album', 'Title', 'Artist', 'Album Artist', 'Year', 'Year', '',
-                'Composer', 'Lyricist', 'Writer', 'Conductor',
-                'Performerinstrument', 'MixArtist', 'Arranger', 'Engineer',
-                'Producer', 'DJMixer', 'Mixer', 'Grouping', 'Subtitle',
-                'DiscSubtitle', 'Track', 'Track', 'Disc', 'Disc',
-                'Compilation', 'Comment', 'Comments', 'Genre', 'BPM', 'Mood',
-                'ISRC', 'Copyright', 'Lyrics', 'Media', 'Label',
-                'CatalogNumber', 'Barcode', 'EncodedBy', 'EncoderSettings',
-                'ALBUMSORT', 'ALBUMARTISTSORT', 'ARTISTSORT', 'TITLESORT',
-                'COMPOSERSORT', '', 'ASIN', '', '', '', '', 'Script',
-                'Language', 'LICENSE', 'ORIGINALYEAR', 'ACOUSTID_ID',
-                'ACOUSTID_FINGERPRINT', 'Weblink', 'WORK', '', '', '', ''
-            ],
-        }
-
-        self.tags_db['common'] = self.tags_common
-        # Full list of all the aforementioned, for lookup.
-        self.tags_all = {}
-        for type in self.tags_db:
-            for n in range(len(self.tags_db[type])):
-                # If these are iTunes tags, ignore the colons.
-                # Otherwise, save only the part before the colon.
-                item = self.tags_db[type][n]
-                if 'iTunes' not in item:
-                    item = item.split(':')[0]
-                self.tags_all[item] = n
-
-        # Human-readable versions of the tags. These are shown when adding
-        # a list of tags to the video's description.
-        self.tags_readable = [
-            'Album', 'Title', 'Artist', 'Album Artist', 'Release Date',
-            'Release Date', 'Original Release Date', 'Composer', 'Lyricist',
-            'Writer', 'Conductor', 'Performer', 'Remixer', 'Arranger',
-            'Engineer', 'Producer', 'Mix-DJ', 'Mixer', 'Grouping', 'Subtitle',
-            'Disc Subtitle', 'Track Number', 'Total Tracks', 'Disc Number',
-            'Total Discs', 'Compilation (iTunes)', 'Comment', 'Comment',
-            'Genre', 'BPM', 'Mood', 'ISRC', 'Copyright', 'Lyrics', 'Media',
-            'Record Label', 'Catalog Number', 'Barcode', 'Encoded By',
-            'Encoder Settings', 'Album Sort Order', 'Album Artist Sort Order',
-            'Artist Sort Order', 'Title Sort Order', 'Composer Sort Order',
-            'Show Name Sort Order', 'ASIN', 'Gapless Playback', 'Podcast',
-            'Podcast URL', 'Show Name', 'Script', 'Language', 'License',
-            'Original Year', 'AcoustID', 'AcoustID Fingerprint', 'Website',
-            'Work Title', 'Website', 'Original Artist', 'Date', 'Track Number'
-        ]
+        self.tags_common = tags_common
+        self.tags_db = tags_db
+        self.tags_readable = tags_readable
+
+    def tag_position(self, tag, formats=(None,)):
+        '''
+        Returns the position of a tag in tags_common, or None if it's
+        unknown. The tag is looked up in the given formats, in order.
+        '''
+        for fmt in formats:
+            keys = [tag.lower()] if fmt in tags_nocase else [tag]
+            if fmt is None:
+                keys.append(tag.lower())
+            for key in keys:
+                n = tag_index.get((fmt, key))
+                if n is not None:
+                    return n
+        return None
 
     # Lookup function that translates any system's tag (e.g. ID3v2's TLAN or
     # Vorbis's ALBUMARTISTSORT) into a human-readable string.
-    def tag_lookup(self, tag, human_readable=False):
-        tag_key = tag.split(':')[0]
-        try:
-            tag_code = self.tags_all[tag_key] % len(self.tags_readable)
-            if human_readable:
-                return self.tags_readable[tag_code]
-            else:
-                return self.tags_common[tag_code]
-        except KeyError:
+    def tag_lookup(self, tag, human_readable=False, formats=(None,)):
+        n = self.tag_position(tag, formats)
+        if n is None:
             return tag
+        if human_readable:
+            return tags_readable[n]
+        return tags_common[n]
+
+    def normalize(self, tags):
+        '''
+        Normalizes the tags that ffprobe found, as returned by
+        run_ffprobe(). Returns a dict of each tag's normalized name and its
+        value. ffprobe's generic names (e.g. album_artist) are looked up
+        first; the tags it doesn't know keep the name they have in the file
+        (e.g. TSRC or CATALOGNUMBER), and are looked up in all formats.
+        Tags about the container are left out.
+        '''
+        normalized = {}
+        for tag, value in tags.items():
+            if tag.lower() in ffmpeg_ignored:
+                continue
+            name = self.tag_lookup(tag, formats=('FFmpeg', None))
+            normalized[name] = unicode(value)
+        return normalized
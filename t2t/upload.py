@@ -0,0 +1,150 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import time
+
+from apiclient.http import MediaFileUpload
+from bandwidth import ThrottledFile
+from utils import bytes_to_human, seconds_to_human
+
+# Resumable uploads must be sent in multiples of this many bytes.
+chunk_unit = 256 * 1024
+
+
+def round_chunksize(size, minimum, maximum):
+    '''
+    Rounds a chunk size down to a multiple of chunk_unit and keeps it
+    between minimum and maximum.
+    '''
+    size = max(minimum, min(maximum, int(size)))
+    return max(chunk_unit, size - size % chunk_unit)
+
+
+class ChunkedFileUpload(MediaFileUpload):
+    '''
+    Resumable upload of a file in chunks, whose size can be changed
+    between chunks. Each chunk is streamed from the file, so memory use
+    doesn't depend on the chunk size. If a bandwidth limiter is passed,
+    the file is read no faster than it allows.
+    '''
+
+    def __init__(self, filename, limiter=None, **kwargs):
+        MediaFileUpload.__init__(self, filename, **kwargs)
+        self._limiter = limiter
+
+    def set_chunksize(self, chunksize):
+        self._chunksize = chunksize
+
+    def stream(self):
+        if self._limiter is None:
+            return self._fd
+        return ThrottledFile(self._fd, self._limiter)
+
+
+class ChunkSizer(object):
+    '''
+    Adapts the chunk size of an upload to the measured throughput, so that
+    each chunk takes about target seconds. On a fast link this keeps the
+    number of requests down; on a slow or flaky one it limits how much
+    progress is lost when a chunk fails.
+    '''
+
+    def __init__(self, chunksize, minimum, maximum, target=None):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.chunksize = round_chunksize(chunksize, minimum, maximum)
+
+    def update(self, sent, seconds):
+        '''
+        Returns the size of the next chunk, given that the last one
+        sent bytes in seconds.
+        '''
+        if self.target and seconds > 0:
+            rate = sent / seconds
+            # Don't grow by more than double at a time.
+            self.chunksize = round_chunksize(
+                min(rate * self.target, self.chunksize * 2),
+                self.minimum, self.maximum
+            )
+        return self.chunksize
+
+    def failed(self):
+        '''
+        Halves the chunk size after a failed chunk.
+        '''
+        if self.target:
+            self.chunksize = round_chunksize(
+                self.chunksize / 2, self.minimum, self.maximum
+            )
+        return self.chunksize
+
+
+class UploadProgress(object):
+    '''
+    Prints the progress of an upload: bytes sent, throughput and ETA.
+    The throughput is a running average, so a single slow chunk doesn't
+    throw off the ETA.
+    '''
+
+    def __init__(self, total=None, quiet=False, weight=0.3):
+        self.total = total
+        self.quiet = quiet
+        self.weight = weight
+        self.sent = 0
+        self.rate = None
+        self.start = self.last = time.time()
+
+    def update(self, sent):
+        '''
+        Reports that sent bytes have now been confirmed by the server.
+        Returns the number of bytes and seconds since the last update.
+        '''
+        now = time.time()
+        delta, seconds = sent - self.sent, now - self.last
+        if seconds > 0 and delta > 0:
+            rate = delta / seconds
+            if self.rate is None:
+                self.rate = rate
+            else:
+                self.rate = self.rate * (1 - self.weight) + rate * self.weight
+        self.sent, self.last = sent, now
+        if not self.quiet:
+            print(self.status())
+        return delta, seconds
+
+    def status(self):
+        rate = self.rate or 0
+        if self.total:
+            line = 'Uploaded %s of %s (%d%%), %s/s' % (
+                bytes_to_human(self.sent),
+                bytes_to_human(self.total),
+                self.sent * 100 / self.total,
+                bytes_to_human(rate)
+            )
+            if rate:
+                line += ', ETA %s' % seconds_to_human(
+                    (self.total - self.sent) / rate
+                )
+            return line + '.'
+        return 'Uploaded %s, %s/s.' % (
+            bytes_to_human(self.sent), bytes_to_human(rate)
+        )
+
+    def elapsed(self):
+        return time.time() - self.start
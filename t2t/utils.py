@@ -45,6 +45,16 @@ def bytes_to_human(n, bformat='%(value).1f %(symbol)s', symbols='customary'):
     return bformat % dict(symbol=symbols[0], value=n)
 
 
+def seconds_to_human(seconds):
+    '''
+    Formats a duration in seconds as HH:MM:SS.ss, the way ffmpeg does.
+    Durations of 24 hours or longer simply have more hours.
+    '''
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(int(minutes), 60)
+    return '%02d:%02d:%05.2f' % (hours, minutes, seconds)
+
+
 def error_exit(str='unknown error'):
     '''
     Exits the program with an error message.
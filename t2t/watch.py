@@ -0,0 +1,230 @@
+# coding=UTF8
+
+# tune2tube.py
+#
+# Copyright (C) 2014-2018 Michiel Sikma and contributors
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express
+# or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import json
+import os
+import time
+
+from batch import Batch, audio_exts, find_image, image_exts
+from errors import Tune2TubeError
+from pipeline import Pipeline
+from quota import connect
+
+# Longest time in seconds to wait before trying a tune that couldn't be
+# encoded again.
+max_retry_delay = 3600
+
+# pyinotify is optional; without it, the folders are polled.
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+
+def signature(paths):
+    '''
+    Returns a string identifying the current contents of a list of files,
+    based on their size and modification time.
+    '''
+    return json.dumps([[n, os.path.getsize(n), os.path.getmtime(n)]
+                       for n in paths])
+
+
+class WatchState(object):
+    '''
+    Record of the tunes a watcher has processed, so that only new or
+    changed files are processed after the daemon is restarted.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with connect(self.path) as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS processed (
+                audio TEXT PRIMARY KEY, signature TEXT, processed REAL
+            )''')
+
+    def is_processed(self, audio, signature):
+        db = connect(self.path)
+        row = db.execute('SELECT signature FROM processed WHERE audio = ?',
+                         (audio,)).fetchone()
+        db.close()
+        return row is not None and row[0] == signature
+
+    def mark(self, audio, signature):
+        with connect(self.path) as db:
+            db.execute('INSERT OR REPLACE INTO processed VALUES (?, ?, ?)',
+                       (audio, signature, time.time()))
+
+
+class FolderWatcher(object):
+    '''
+    Long-running daemon that watches one or more drop folders and
+    processes each new or changed audio file as soon as it and its image
+    are complete. A file counts as complete once its size and modification
+    time haven't changed for settle seconds, so files that are still being
+    copied are left alone.
+
+    If pyinotify is installed, the daemon sleeps until something happens in
+    one of the folders; otherwise the folders are checked every interval
+    seconds.
+    '''
+
+    def __init__(self, t2t, folders, interval=5, settle=10, jobs=None,
+                 output_dir=None, album=False, upload_jobs=1):
+        self.t2t = t2t
+        self.folders = [os.path.abspath(n) for n in folders]
+        self.interval = interval
+        self.settle = settle
+        # Options passed on to each batch.
+        self.jobs = jobs
+        self.output_dir = output_dir
+        self.album = album
+        self.upload_jobs = upload_jobs
+        self.state = WatchState(t2t.settings['watch_state'])
+        # Size and modification time of each file at the last scan.
+        self.seen = {}
+        # Whether there are files that haven't settled yet.
+        self.unsettled = False
+        # Tunes that couldn't be encoded: their signature, the number of
+        # times they failed and when to try them again.
+        self.failures = {}
+        self.notifier = None
+        if pyinotify is not None:
+            manager = pyinotify.WatchManager()
+            mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | \
+                pyinotify.IN_CREATE | pyinotify.IN_MODIFY
+            for folder in self.folders:
+                manager.add_watch(folder, mask)
+            self.notifier = pyinotify.Notifier(manager, lambda event: None)
+
+    def scan(self):
+        '''
+        Returns the set of audio and image files in our folders that have
+        settled since the last scan.
+        '''
+        now = time.time()
+        seen = {}
+        settled = set()
+        self.unsettled = False
+        for folder in self.folders:
+            for name in os.listdir(folder):
+                ext = os.path.splitext(name)[1].lower()
+                # Skip the hidden temporary files that e.g. rsync writes.
+                if name.startswith('.') or ext not in audio_exts + image_exts:
+                    continue
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen[path] = (stat.st_size, stat.st_mtime)
+                if self.seen.get(path) == seen[path] and \
+                   now - stat.st_mtime >= self.settle:
+                    settled.add(path)
+                else:
+                    self.unsettled = True
+        self.seen = seen
+        return settled
+
+    def find_tunes(self):
+        '''
+        Returns the complete audio/image pairs that haven't been processed
+        yet, along with their signatures.
+        '''
+        settled = self.scan()
+        # Forget the failures of tunes that have been removed.
+        for audio in self.failures.keys():
+            if audio not in self.seen:
+                del self.failures[audio]
+        tunes = []
+        for audio in sorted(settled):
+            if os.path.splitext(audio)[1].lower() not in audio_exts:
+                continue
+            image = find_image(audio, self.t2t.settings['image_file'])
+            # Wait for the image if it hasn't arrived or settled yet.
+            if image is None or (image not in settled and
+                                 image != self.t2t.settings['image_file']):
+                continue
+            sig = signature([audio, image])
+            failure = self.failures.get(audio)
+            if failure is not None and failure[0] == sig and \
+               time.time() < failure[2]:
+                continue
+            if not self.state.is_processed(audio, sig):
+                tunes.append(({'audio': audio, 'image': image}, sig))
+        return tunes
+
+    def wait(self):
+        '''
+        Waits until it's time to scan our folders again.
+        '''
+        if self.notifier is None:
+            time.sleep(self.interval)
+            return
+        # Files that haven't settled yet, and tunes that are due to be
+        # tried again, need to be checked later even if nothing happens.
+        now = time.time()
+        due = [n[2] - now for n in self.failures.values() if n[2] > now]
+        if self.unsettled:
+            due.append(self.interval)
+        timeout = min(due) * 1000 if due else None
+        if self.notifier.check_events(timeout):
+            self.notifier.read_events()
+            self.notifier.process_events()
+
+    def process(self, tunes, args):
+        '''
+        Runs a batch of new tunes. Tunes that couldn't be encoded are
+        tried again later, waiting twice as long after each failure, or as
+        soon as they change. Failed uploads remain in the upload queue, so
+        those tunes are only processed again if they change.
+        '''
+        batch = Pipeline if self.t2t.settings['pipeline'] else Batch
+        batch = batch(self.t2t, [n[0] for n in tunes], self.jobs,
+                      self.output_dir, self.album, self.upload_jobs)
+        try:
+            batch.run(args)
+            skipped = batch.skipped
+        except Tune2TubeError, e:
+            print('Couldn\'t process the new tune(s): %s' % e)
+            skipped = set(tune['audio'] for tune, sig in tunes)
+        for tune, sig in tunes:
+            audio = tune['audio']
+            if audio not in skipped:
+                self.state.mark(audio, sig)
+                self.failures.pop(audio, None)
+                continue
+            failure = self.failures.get(audio)
+            count = failure[1] + 1 if failure and failure[0] == sig else 0
+            delay = min(self.interval * 2 ** count, max_retry_delay)
+            self.failures[audio] = (sig, count, time.time() + delay)
+
+    def run(self, args):
+        '''
+        Processes new tunes until the daemon is stopped.
+        '''
+        print('Watching %s for new tunes...' % ', '.join(self.folders))
+        try:
+            while True:
+                tunes = self.find_tunes()
+                if tunes:
+                    print('Found %d new tune(s).' % len(tunes))
+                    self.process(tunes, args)
+                self.wait()
+        except KeyboardInterrupt:
+            print('Stopped watching.')
@@ -19,16 +19,19 @@
 #
 # This script contains code from <https://developers.google.com/>.
 
-from oauth2client.tools import argparser
-from t2t import Tune2Tube
+import argparse
+import os
 
-if __name__ == '__main__':
-    # Run the script using our command line arguments.
-    t2t = Tune2Tube()
-    
-    # Check to ensure we've got valid command line arguments.
-    args = argparser.parse_args()
+from t2t import Tune2Tube, VideoCache, Tune2TubeError, add_arguments, \
+    add_auth_arguments
+from t2t.containers import container_path, path_container
+from t2t.utils import error_exit
 
+
+def main(t2t, args):
+    '''
+    Runs the script with a set of parsed command line arguments.
+    '''
     # From here we can assume we have our required arguments.
     in_image = args.image_file
     in_audio = args.audio_file
@@ -37,6 +40,8 @@ if __name__ == '__main__':
     if args.title is None and args.title_vars is None:
         args.dynamic_title = True
         args.title_vars = t2t.settings['default_title_vars']
+    elif args.title_vars is None:
+        args.dynamic_title = False
     if args.title_vars is not None:
         args.dynamic_title = True
     if args.title_vars is None:
@@ -47,12 +52,87 @@ if __name__ == '__main__':
         args.client_secrets_file = args.cs_json
     if args.output:
         args.generate_only = True
-        args.path_output = args.output
+        if args.batch is None:
+            args.path_output = args.output
+            # The extension of the output file picks the container, unless
+            # one was given as well.
+            forced = path_container(args.output)
+            if args.container == 'auto' and forced is not None:
+                args.container = forced
+            elif forced not in (None, args.container):
+                print('Warning: writing the video to `%s\' instead, as '
+                      '--container %s was given.' % (
+                          container_path(args.output, args.container),
+                          args.container
+                      ))
     
     # Stick our command line arguments into the class.
     t2t.change_settings(vars(args))
+    t2t.serve_metrics()
+
+    # Upload the videos left in the queue by earlier batches.
+    if args.queue:
+        from t2t.batch import Batch
+        Batch(t2t, [], upload_jobs=args.upload_jobs).run_queue(args)
+        return
+
+    # Watch folders for new tunes until we're stopped.
+    if args.watch:
+        from t2t.watch import FolderWatcher
+        if args.output and not os.path.isdir(args.output):
+            os.makedirs(args.output)
+        FolderWatcher(t2t, args.watch, args.watch_interval, args.watch_settle,
+                      args.jobs, args.output, args.album,
+                      args.upload_jobs).run(args)
+        return
+
+    # In batch mode, encode all tunes in parallel before uploading them.
+    if args.batch is not None:
+        from t2t.batch import Batch, collect_tunes
+        from t2t.pipeline import Pipeline
+        tunes = collect_tunes(args.batch, in_image)
+        if args.output and not os.path.isdir(args.output):
+            os.makedirs(args.output)
+        batch = (Pipeline if args.pipeline else Batch)(
+            t2t, tunes, args.jobs, args.output, args.album, args.upload_jobs
+        )
+        if args.dry_run:
+            batch.dry_run()
+        else:
+            batch.run(args)
+        return
+
+    if args.dry_run:
+        t2t.show_tune(in_audio)
+        return
+
+    t2t.upload_tune(in_audio, in_image, args)
+
+
+if __name__ == '__main__':
+    # Run the script using our command line arguments.
+    argparser = argparse.ArgumentParser(add_help=False)
+    add_auth_arguments(argparser)
+    add_arguments(argparser)
+    t2t = Tune2Tube()
+
+    # Check to ensure we've got valid command line arguments.
+    args = argparser.parse_args()
+
+    # Inspect or clear the video cache.
+    if args.cache_info or args.cache_clear:
+        cache = VideoCache(args.cache_dir, args.cache_size * 1024 * 1024)
+        if args.cache_clear:
+            cache.clear()
+        cache.info()
+        exit()
+
+    # Either a batch or a single audio/image pair is required.
+    if not (args.queue or args.watch) and args.batch is None and (
+            args.audio_file is None or args.image_file is None):
+        argparser.error('an audio and image file, or --batch, is required')
 
-    # Upload each tune that's been queued.
-    tunes = [{'audio': in_audio, 'image': in_image}]
-    for tune in tunes:
-        t2t.upload_tune(tune['audio'], tune['image'], args)
+    try:
+        main(t2t, args)
+    except Tune2TubeError, e:
+        error_exit(e)